@@ -0,0 +1,340 @@
+"""
+Mede o desempenho dos cálculos mais pesados do aplicativo (pacote core), fora do Streamlit.
+
+Os dados são sintéticos, gerados a partir dos arquivos de exemplo em CSV/ na quantidade de linhas
+pedida (1 milhão ou mais): as sessões são sorteadas com reposição de online_shoppers_intention.csv
+e as transações de exemplo_RFV.csv são replicadas com novos IDs de cliente e de compra, para que a
+quantidade de clientes cresça junto. Os arquivos gerados ficam em cache em .cache/benchmarks.
+
+Cada caso roda em um processo Python novo, que chama as mesmas funções de core/ usadas pelas
+páginas, sem os caches do Streamlit. O resultado traz a mediana do tempo, o pico de memória (RSS) do processo e a vazão
+em linhas por segundo. Com --linha-base os tempos são comparados com uma execução anterior e o
+script termina com código 1 se algum caso ficar mais lento que a tolerância.
+
+A linha de base não faz parte do repositório: os tempos só são comparáveis na mesma máquina e
+com as mesmas versões das bibliotecas. Grave-a localmente com --salvar-linha-base (em
+benchmarks/linha_base.json, ignorado pelo git) antes de uma mudança e compare depois dela.
+
+Uso:
+    python benchmarks/desempenho.py [--linhas 100000 1000000] [--casos varredura_kmeans calcular_silhuetas]
+                                    [--repeticoes 3] [--json resultado.json]
+                                    [--linha-base benchmarks/linha_base.json] [--tolerancia 0.2]
+                                    [--salvar-linha-base]
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ))
+
+import numpy as np
+import pandas as pd
+
+from core.cache_disco import diretorio_cache
+from core.clusterizacao import calcular_silhuetas, silhueta_kmeans, varredura_kmeans
+from core.hierarquico import rotulos_hierarquicos
+from core.ingestao import ler_csv, ler_parquet
+from core.preprocessamento import padronizar_sessoes
+from core.rfv import calcular_frequencia, calcular_quartis, calcular_recencia, calcular_rfv, calcular_valor, gerar_df_rfv
+
+LINHA_BASE_PADRAO = RAIZ / 'benchmarks' / 'linha_base.json'
+
+# Data de referência fixa, para que a Recência não dependa do dia da execução
+DATA_REFERENCIA = pd.Timestamp('2021-12-09')
+
+# ---------------------------------------------------------------------------------------------
+# Dados sintéticos
+# ---------------------------------------------------------------------------------------------
+
+def gerar_sessoes(n_linhas, semente=123):
+    """
+    Gera sessões sorteando com reposição as linhas de online_shoppers_intention.csv.
+
+    Parâmetros:
+    - n_linhas (int): Quantidade de sessões.
+    - semente (int): Semente do sorteio.
+
+    Retorna:
+    - pandas.DataFrame: Sessões com os mesmos tipos da leitura do aplicativo.
+    """
+    base, _ = ler_csv(RAIZ / 'CSV' / 'online_shoppers_intention.csv')
+    indices = np.random.default_rng(semente).integers(0, len(base), n_linhas)
+    return base.iloc[indices].reset_index(drop=True)
+
+def gerar_transacoes(n_linhas):
+    """
+    Gera transações replicando exemplo_RFV.csv com novos IDs de cliente e de compra a cada cópia.
+
+    Parâmetros:
+    - n_linhas (int): Quantidade de transações.
+
+    Retorna:
+    - pandas.DataFrame: Transações com ID_cliente, CodigoCompra, DiaCompra e ValorTotal.
+    """
+    base, _ = ler_csv(RAIZ / 'CSV' / 'exemplo_RFV.csv')
+    copias = -(-n_linhas // len(base))
+
+    # Cada cópia desloca os IDs para além dos da cópia anterior, criando clientes novos
+    deslocamento = np.repeat(np.arange(copias, dtype=np.int64), len(base))[:n_linhas]
+    df = base.iloc[np.tile(np.arange(len(base)), copias)[:n_linhas]].reset_index(drop=True)
+    df['ID_cliente'] = df['ID_cliente'].astype(np.int64) + deslocamento * (int(base['ID_cliente'].max()) + 1)
+    df['CodigoCompra'] = df['CodigoCompra'].astype(np.int64) + deslocamento * (int(base['CodigoCompra'].max()) + 1)
+    return df
+
+GERADORES = {'sessoes': gerar_sessoes, 'transacoes': gerar_transacoes}
+
+def dados_sinteticos(tipo, n_linhas):
+    """
+    Retorna o Parquet com os dados sintéticos, gerando-o apenas na primeira vez.
+
+    Parâmetros:
+    - tipo (str): 'sessoes' ou 'transacoes'.
+    - n_linhas (int): Quantidade de linhas.
+
+    Retorna:
+    - Path: Caminho do Parquet.
+    """
+    caminho = diretorio_cache('benchmarks') / f'{tipo}_{n_linhas}.parquet'
+    if not caminho.exists():
+        temporario = caminho.with_suffix('.tmp')
+        GERADORES[tipo](n_linhas).to_parquet(temporario, index=False)
+        temporario.replace(caminho)
+    return caminho
+
+# ---------------------------------------------------------------------------------------------
+# Casos medidos
+# ---------------------------------------------------------------------------------------------
+
+def preparar_clusterizacao(caminho_dados, motor):
+    """
+    Carrega as sessões e padroniza os dados uma vez.
+    """
+    df = ler_parquet(caminho_dados)
+    X, _ = padronizar_sessoes(df)
+    return {'df': df, 'X': X, 'motor': motor}
+
+def preparar_segmentacao(caminho_dados, motor):
+    """
+    Carrega as transações e calcula a tabela RFV e os quartis uma vez.
+    """
+    df = ler_parquet(caminho_dados)
+    df_rfv = calcular_rfv(df, DATA_REFERENCIA)
+    return {'df': df, 'df_rfv': df_rfv, 'quartis': calcular_quartis(df_rfv, 4)}
+
+def caso_padronizar(ctx):
+    return padronizar_sessoes(ctx['df'])
+
+def caso_cotovelo(ctx):
+    return varredura_kmeans(ctx['X'], 1, 9, ctx['motor'])
+
+def preparar_silhueta(ctx):
+    # Os ajustes do K-means ficam prontos antes, para medir apenas o cálculo das silhuetas
+    ctx['ajustes'] = varredura_kmeans(ctx['X'], 2, 10, ctx['motor'])
+
+def caso_silhueta(ctx):
+    ajustes_prontos = lambda X, k, motor, batch_size: ctx['ajustes'][k]
+    return calcular_silhuetas(ctx['X'], 2, 10, motor=ctx['motor'],
+                              avaliar=lambda X, k, *args: silhueta_kmeans(X, k, *args, ajustar=ajustes_prontos))
+
+def caso_hierarquico(ctx):
+    return rotulos_hierarquicos(ctx['X'], 4)
+
+def caso_recencia(ctx):
+    return calcular_recencia(ctx['df'], DATA_REFERENCIA)
+
+def caso_frequencia(ctx):
+    return calcular_frequencia(ctx['df'])
+
+def caso_valor(ctx):
+    return calcular_valor(ctx['df'])
+
+def caso_gerar_df_rfv(ctx):
+    # gerar_df_rfv altera a tabela recebida, então cada repetição classifica uma cópia nova
+    return gerar_df_rfv(ctx['df_rfv'].copy(), ctx['quartis'])
+
+# Para cada caso: dados usados, preparação (fora da medição), preparação extra e função medida
+CASOS = {
+    'padronizar_sessoes': ('sessoes', preparar_clusterizacao, None, caso_padronizar),
+    'varredura_kmeans': ('sessoes', preparar_clusterizacao, None, caso_cotovelo),
+    'calcular_silhuetas': ('sessoes', preparar_clusterizacao, preparar_silhueta, caso_silhueta),
+    'rotulos_hierarquicos': ('sessoes', preparar_clusterizacao, None, caso_hierarquico),
+    'calcular_recencia': ('transacoes', preparar_segmentacao, None, caso_recencia),
+    'calcular_frequencia': ('transacoes', preparar_segmentacao, None, caso_frequencia),
+    'calcular_valor': ('transacoes', preparar_segmentacao, None, caso_valor),
+    'gerar_df_rfv': ('transacoes', preparar_segmentacao, None, caso_gerar_df_rfv),
+}
+
+def pico_rss_mb():
+    """
+    Retorna o pico de memória residente do processo atual, em MB (None sem o módulo resource).
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # O Linux informa o pico em KB e o macOS em bytes
+    return pico / 1024 ** 2 if sys.platform == 'darwin' else pico / 1024
+
+def executar_caso(nome, n_linhas, repeticoes, motor):
+    """
+    Executa um caso no processo atual e retorna as medições.
+    """
+    tipo, preparar, preparar_extra, funcao = CASOS[nome]
+    ctx = preparar(dados_sinteticos(tipo, n_linhas), motor)
+    if preparar_extra is not None:
+        preparar_extra(ctx)
+    rss_inicial = pico_rss_mb()
+
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao(ctx)
+        tempos.append(time.perf_counter() - inicio)
+
+    tempo = statistics.median(tempos)
+    return {
+        'caso': nome,
+        'linhas': n_linhas,
+        'tempo_s': tempo,
+        'tempos_s': tempos,
+        'pico_rss_mb': pico_rss_mb(),
+        'pico_rss_preparo_mb': rss_inicial,
+        'linhas_por_s': n_linhas / tempo if tempo > 0 else None,
+    }
+
+def medir_caso(nome, n_linhas, repeticoes, motor):
+    """
+    Mede um caso em um processo novo, para que o pico de memória seja só o daquele caso.
+    """
+    comando = [sys.executable, str(Path(__file__).resolve()), '--executar', nome,
+               '--linhas', str(n_linhas), '--repeticoes', str(repeticoes), '--motor', motor]
+    saida = subprocess.run(comando, cwd=RAIZ, capture_output=True, text=True)
+    if saida.returncode != 0:
+        raise RuntimeError(f"O caso {nome} ({n_linhas} linhas) falhou:\n{saida.stderr}")
+    return json.loads(saida.stdout.strip().splitlines()[-1])
+
+# ---------------------------------------------------------------------------------------------
+# Relatório e comparação com a linha de base
+# ---------------------------------------------------------------------------------------------
+
+def descrever_ambiente(motor):
+    """
+    Retorna as versões e a máquina usadas na medição, gravadas junto com os resultados.
+    """
+    import os
+    import sklearn
+
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'sklearn': sklearn.__version__,
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+        'motor_kmeans': motor,
+    }
+
+def comparar(resultados, linha_base, tolerancia):
+    """
+    Compara os tempos com os da linha de base, caso a caso e para a mesma quantidade de linhas.
+
+    Parâmetros:
+    - resultados (list): Medições atuais.
+    - linha_base (dict): Conteúdo de um JSON gravado anteriormente por este script.
+    - tolerancia (float): Aumento relativo de tempo aceito (0.2 = 20% mais lento).
+
+    Retorna:
+    - list: Para cada caso com linha de base, a razão entre os tempos e se houve regressão.
+    """
+    anteriores = {(r['caso'], r['linhas']): r for r in linha_base['resultados']}
+    comparacoes = []
+    for r in resultados:
+        anterior = anteriores.get((r['caso'], r['linhas']))
+        if anterior is None:
+            continue
+        razao = r['tempo_s'] / anterior['tempo_s']
+        comparacoes.append({
+            'caso': r['caso'],
+            'linhas': r['linhas'],
+            'tempo_base_s': anterior['tempo_s'],
+            'razao_tempo': razao,
+            'pico_rss_base_mb': anterior.get('pico_rss_mb'),
+            'regressao': razao > 1 + tolerancia,
+        })
+    return comparacoes
+
+def main():
+    parser = argparse.ArgumentParser(description="Desempenho dos cálculos de clusterização e RFV em dados sintéticos.")
+    parser.add_argument('--linhas', type=int, nargs='+', default=[100_000, 1_000_000],
+                        help="Quantidades de linhas dos dados sintéticos.")
+    parser.add_argument('--casos', nargs='+', choices=list(CASOS), default=list(CASOS), help="Casos a medir.")
+    parser.add_argument('--repeticoes', type=int, default=3, help="Repetições medidas por caso.")
+    parser.add_argument('--motor', choices=['completo', 'minibatch'], default='completo',
+                        help="Motor do K-means na varredura e nas silhuetas.")
+    parser.add_argument('--json', help="Arquivo onde gravar os resultados em JSON.")
+    parser.add_argument('--linha-base', nargs='?', const=str(LINHA_BASE_PADRAO),
+                        help="JSON de uma execução anterior para comparar os tempos.")
+    parser.add_argument('--tolerancia', type=float, default=0.2,
+                        help="Aumento relativo de tempo aceito antes de acusar regressão.")
+    parser.add_argument('--salvar-linha-base', action='store_true',
+                        help=f"Grava os resultados como nova linha de base em {LINHA_BASE_PADRAO.relative_to(RAIZ)}.")
+    parser.add_argument('--executar', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # Execução interna: mede um único caso neste processo e imprime o resultado
+    if args.executar:
+        print(json.dumps(executar_caso(args.executar, args.linhas[0], args.repeticoes, args.motor)))
+        return
+
+    resultados = []
+    print(f"{'Caso':<22} {'Linhas':>10} {'Tempo (s)':>10} {'Pico RSS (MB)':>14} {'Linhas/s':>12}")
+    for n_linhas in args.linhas:
+        for nome in args.casos:
+            r = medir_caso(nome, n_linhas, args.repeticoes, args.motor)
+            resultados.append(r)
+            rss = f"{r['pico_rss_mb']:.0f}" if r['pico_rss_mb'] is not None else '-'
+            print(f"{r['caso']:<22} {r['linhas']:>10,} {r['tempo_s']:>10.3f} {rss:>14} {r['linhas_por_s']:>12,.0f}")
+
+    relatorio = {'ambiente': descrever_ambiente(args.motor), 'resultados': resultados}
+
+    regressoes = []
+    if args.linha_base:
+        caminho_base = Path(args.linha_base)
+        if caminho_base.exists():
+            linha_base = json.loads(caminho_base.read_text(encoding='utf-8'))
+            relatorio['comparacao'] = comparar(resultados, linha_base, args.tolerancia)
+
+            # Tempos de outra máquina ou de outras versões das bibliotecas não são comparáveis
+            diferencas = [chave for chave, valor in relatorio['ambiente'].items()
+                          if linha_base.get('ambiente', {}).get(chave) != valor]
+            if diferencas:
+                print(f"\nAviso: a linha de base foi gravada em outro ambiente ({', '.join(diferencas)}); "
+                      "grave uma nova com --salvar-linha-base nesta máquina.")
+
+            print(f"\n{'Caso':<22} {'Linhas':>10} {'Base (s)':>10} {'Razão':>8}")
+            for c in relatorio['comparacao']:
+                marca = '  REGRESSÃO' if c['regressao'] else ''
+                print(f"{c['caso']:<22} {c['linhas']:>10,} {c['tempo_base_s']:>10.3f} {c['razao_tempo']:>8.2f}{marca}")
+            regressoes = [c for c in relatorio['comparacao'] if c['regressao']]
+        else:
+            print(f"\nLinha de base {caminho_base} não encontrada; use --salvar-linha-base para criá-la.")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(relatorio, indent=2, ensure_ascii=False), encoding='utf-8')
+    if args.salvar_linha_base:
+        LINHA_BASE_PADRAO.write_text(json.dumps(relatorio, indent=2, ensure_ascii=False), encoding='utf-8')
+
+    if regressoes:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
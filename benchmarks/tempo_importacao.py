@@ -0,0 +1,86 @@
+"""
+Mede o tempo de importação (partida a frio) de cada página do aplicativo.
+
+Cada medição roda em um processo Python novo, como um contêiner recém-iniciado: o Streamlit é
+importado primeiro (custo comum a todas as páginas) e em seguida o módulo da página é carregado
+sem executar o main(). O resultado mostra a mediana das repetições e quais bibliotecas pesadas
+acabaram importadas.
+
+Uso:
+    python benchmarks/tempo_importacao.py [--repeticoes 5] [--json resultado.json]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+
+# Bibliotecas cuja importação domina a partida a frio
+BIBLIOTECAS_PESADAS = ['ydata_profiling', 'seaborn', 'matplotlib.pyplot', 'plotly.express', 'sklearn',
+                       'scipy.cluster', 'PIL.Image']
+
+# Código executado no processo novo: importa o Streamlit e depois carrega a página sem rodar o main()
+MEDICAO = '''
+import importlib.util, json, sys, time
+sys.path.insert(0, {raiz!r})
+inicio = time.perf_counter()
+import streamlit
+meio = time.perf_counter()
+spec = importlib.util.spec_from_file_location('pagina', {pagina!r})
+spec.loader.exec_module(importlib.util.module_from_spec(spec))
+fim = time.perf_counter()
+print(json.dumps({{'streamlit_s': meio - inicio, 'pagina_s': fim - meio,
+                  'carregadas': [m for m in {pesadas!r} if m in sys.modules]}}))
+'''
+
+def listar_paginas():
+    """
+    Retorna o script principal e as páginas do aplicativo.
+    """
+    return [RAIZ / 'Início.py'] + sorted((RAIZ / 'pages').glob('*.py'))
+
+def medir_pagina(pagina, repeticoes=5):
+    """
+    Mede a importação de uma página em processos novos.
+
+    Parâmetros:
+    - pagina (Path): Arquivo da página.
+    - repeticoes (int): Quantidade de processos medidos.
+
+    Retorna:
+    - dict: Medianas do tempo do Streamlit e da página, em segundos, e bibliotecas pesadas importadas.
+    """
+    codigo = MEDICAO.format(raiz=str(RAIZ), pagina=str(pagina), pesadas=BIBLIOTECAS_PESADAS)
+    medicoes = []
+    for _ in range(repeticoes):
+        saida = subprocess.run([sys.executable, '-c', codigo], cwd=RAIZ, capture_output=True, text=True, check=True)
+        medicoes.append(json.loads(saida.stdout.strip().splitlines()[-1]))
+
+    return {
+        'pagina': pagina.name,
+        'streamlit_s': statistics.median(m['streamlit_s'] for m in medicoes),
+        'pagina_s': statistics.median(m['pagina_s'] for m in medicoes),
+        'carregadas': medicoes[-1]['carregadas'],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Tempo de importação de cada página do aplicativo.")
+    parser.add_argument('--repeticoes', type=int, default=5, help="Processos medidos por página.")
+    parser.add_argument('--json', help="Arquivo onde gravar os resultados em JSON.")
+    args = parser.parse_args()
+
+    resultados = [medir_pagina(pagina, args.repeticoes) for pagina in listar_paginas()]
+
+    print(f"{'Página':<40} {'Streamlit (s)':>14} {'Página (s)':>11}  Bibliotecas pesadas importadas")
+    for r in resultados:
+        print(f"{r['pagina']:<40} {r['streamlit_s']:>14.3f} {r['pagina_s']:>11.3f}  {', '.join(r['carregadas']) or '-'}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(resultados, indent=2, ensure_ascii=False), encoding='utf-8')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,3 @@
+"""
+Código compartilhado pelas páginas do aplicativo, sem dependência do Streamlit.
+"""
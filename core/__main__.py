@@ -0,0 +1,86 @@
+"""
+Linha de comando para rodar a clusterização e a segmentação RFV em lote, sem o navegador.
+
+Uso:
+    python -m core clusterizar SESSOES [SESSOES ...] --saida DIR [--algoritmo kmeans|hierarquico] [--k 4]
+    python -m core rfv TRANSACOES [TRANSACOES ...] --saida DIR [--data-referencia AAAA-MM-DD] [--faixas Quartis]
+
+As entradas podem ser arquivos CSV/Parquet ou diretórios com as partes de uma exportação. O
+progresso e o tempo de cada etapa são escritos na saída de erro.
+"""
+import argparse
+import sys
+import time
+
+from datetime import date
+
+from core.lote import FORMATOS_SAIDA, clusterizar_arquivos, rfv_arquivos
+from core.rfv import FAIXAS
+
+def criar_informe():
+    """
+    Retorna a função que escreve as mensagens de progresso na saída de erro, com o tempo decorrido.
+    """
+    inicio = time.perf_counter()
+
+    def informar(mensagem):
+        print(f"[{time.perf_counter() - inicio:8.1f} s] {mensagem}", file=sys.stderr, flush=True)
+
+    return informar
+
+def criar_parser():
+    parser = argparse.ArgumentParser(prog='python -m core',
+                                     description="Clusterização e segmentação RFV em lote.")
+    comandos = parser.add_subparsers(dest='comando', required=True)
+
+    # Opções comuns aos dois comandos
+    comum = argparse.ArgumentParser(add_help=False)
+    comum.add_argument('entradas', nargs='+', help="Arquivos CSV/Parquet ou diretórios com as partes.")
+    comum.add_argument('--saida', required=True, help="Diretório onde gravar os resultados.")
+    comum.add_argument('--formato', choices=list(FORMATOS_SAIDA), default='parquet', help="Formato de saída.")
+    comum.add_argument('--processos', type=int, default=None, help="Processos em paralelo (padrão: um por núcleo).")
+
+    clusterizar = comandos.add_parser('clusterizar', parents=[comum],
+                                      help="Rotula sessões com o K-means ou o agrupamento hierárquico.")
+    clusterizar.add_argument('--algoritmo', choices=['kmeans', 'hierarquico'], default='kmeans')
+    clusterizar.add_argument('--k', type=int, default=4, help="Quantidade de clusters.")
+    clusterizar.add_argument('--motor', choices=['completo', 'minibatch'], default='completo',
+                             help="Motor do K-means.")
+    clusterizar.add_argument('--batch-size', type=int, default=1024, help="Tamanho do lote do motor minibatch.")
+    clusterizar.add_argument('--ligacao', choices=['ward', 'complete', 'average', 'single'], default='ward',
+                             help="Método de ligação do hierárquico.")
+    clusterizar.add_argument('--pre-agrupamento', choices=['birch', 'kmeans', 'nenhum'], default='birch',
+                             help="Pré-agrupamento em micro-clusters do hierárquico.")
+    clusterizar.add_argument('--n-micro', type=int, default=500, help="Máximo de micro-clusters do hierárquico.")
+    clusterizar.add_argument('--conectividade', action='store_true',
+                             help="No ward, restringe as junções aos vizinhos mais próximos.")
+    clusterizar.add_argument('--modelo', help="Rotula com um modelo salvo, sem ajustar (centróide mais próximo).")
+    clusterizar.add_argument('--salvar-modelo', help="Salva o K-means ajustado com este nome.")
+
+    rfv = comandos.add_parser('rfv', parents=[comum], help="Calcula a tabela RFV final com faixas e segmentos.")
+    rfv.add_argument('--data-referencia', type=date.fromisoformat, default=None,
+                     help="Data de referência da Recência, AAAA-MM-DD (padrão: hoje).")
+    rfv.add_argument('--faixas', choices=list(FAIXAS), default='Quartis', help="Faixas de classificação.")
+    return parser
+
+def main(argv=None):
+    args = criar_parser().parse_args(argv)
+    informar = criar_informe()
+
+    if args.comando == 'clusterizar':
+        caminhos = clusterizar_arquivos(args.entradas, args.saida, args.algoritmo, args.k, args.motor,
+                                        args.batch_size, args.ligacao, args.pre_agrupamento, args.n_micro,
+                                        args.conectividade, args.modelo, args.salvar_modelo, args.formato,
+                                        args.processos, informar)
+    else:
+        caminhos = [rfv_arquivos(args.entradas, args.saida, args.data_referencia, args.faixas, args.formato,
+                                 args.processos, informar)]
+
+    informar(f"concluído: {len(caminhos)} arquivo(s) gravado(s)")
+
+    # Os caminhos gravados vão para a saída padrão, para serem usados por outros scripts
+    for caminho in caminhos:
+        print(caminho)
+
+if __name__ == '__main__':
+    main()
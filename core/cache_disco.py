@@ -0,0 +1,89 @@
+"""
+Diretório de cache em disco compartilhado pelas páginas, com descarte dos arquivos menos usados.
+
+O diretório pode ser trocado pela variável de ambiente CLUSTERIZACAO_CACHE, o limite de
+tamanho (em MB) pela CLUSTERIZACAO_CACHE_MB e a carência (em segundos) em que um arquivo
+recém-usado não é descartado pela CLUSTERIZACAO_CACHE_CARENCIA.
+"""
+import hashlib
+import os
+import time
+
+from pathlib import Path
+
+DIRETORIO_CACHE = Path(os.environ.get('CLUSTERIZACAO_CACHE', Path(__file__).resolve().parent.parent / '.cache'))
+LIMITE_CACHE_MB = float(os.environ.get('CLUSTERIZACAO_CACHE_MB', 2048))
+CARENCIA_S = float(os.environ.get('CLUSTERIZACAO_CACHE_CARENCIA', 60))
+
+def diretorio_cache(subdiretorio):
+    """
+    Retorna (e cria, se preciso) um subdiretório do cache.
+
+    Parâmetros:
+    - subdiretorio (str): Nome do subdiretório, por exemplo 'datasets'.
+    """
+    caminho = DIRETORIO_CACHE / subdiretorio
+    caminho.mkdir(parents=True, exist_ok=True)
+    return caminho
+
+def hash_conteudo(dados):
+    """
+    Calcula o hash SHA-256 de um conteúdo binário, usado como nome dos arquivos em cache.
+
+    Parâmetros:
+    - dados (bytes ou memoryview): Conteúdo a ser identificado.
+    """
+    return hashlib.sha256(dados).hexdigest()
+
+def hash_arquivo(arquivo, tamanho_bloco=1024 ** 2):
+    """
+    Calcula o hash SHA-256 do conteúdo de um arquivo sem carregá-lo inteiro na memória.
+
+    Parâmetros:
+    - arquivo (str, Path ou arquivo): Caminho ou arquivo aberto (como o enviado pelo st.file_uploader).
+    - tamanho_bloco (int): Quantidade de bytes lidos por vez.
+    """
+    # Arquivos enviados pelo Streamlit já estão na memória e expõem o buffer sem cópia
+    if hasattr(arquivo, 'getbuffer'):
+        return hash_conteudo(arquivo.getbuffer())
+
+    h = hashlib.sha256()
+    with open(arquivo, 'rb') as f:
+        for bloco in iter(lambda: f.read(tamanho_bloco), b''):
+            h.update(bloco)
+    return h.hexdigest()
+
+def registrar_acesso(caminho):
+    """
+    Marca o arquivo como usado agora. A data de modificação serve de ordem de uso no descarte.
+
+    Parâmetros:
+    - caminho (Path): Arquivo do cache.
+    """
+    os.utime(caminho)
+
+def liberar_espaco(subdiretorio, padrao='*', limite_mb=LIMITE_CACHE_MB, carencia_s=CARENCIA_S):
+    """
+    Apaga os arquivos usados há mais tempo até o subdiretório caber no limite de tamanho.
+
+    Parâmetros:
+    - subdiretorio (str): Nome do subdiretório do cache.
+    - padrao (str): Padrão dos arquivos considerados, para não apagar arquivos ainda sendo escritos.
+    - limite_mb (float): Tamanho máximo do subdiretório, em MB.
+    - carencia_s (float): Arquivos usados há menos desses segundos nunca são apagados, pois
+      outra sessão pode tê-los acabado de gravar e ainda estar prestes a lê-los.
+    """
+    arquivos = sorted((p for p in diretorio_cache(subdiretorio).glob(padrao) if p.is_file()),
+                      key=lambda p: p.stat().st_mtime)
+    total = sum(p.stat().st_size for p in arquivos)
+    recentes = time.time() - carencia_s
+
+    # Remove do mais antigo para o mais recente, mantendo sempre o último arquivo usado
+    for arquivo in arquivos[:-1]:
+        if total <= limite_mb * 1024 ** 2:
+            break
+        estado = arquivo.stat()
+        if estado.st_mtime >= recentes:
+            break
+        total -= estado.st_size
+        arquivo.unlink(missing_ok=True)
@@ -0,0 +1,320 @@
+"""
+Ajuste do K-means, varredura de k (método do cotovelo) e coeficiente de silhueta.
+
+As funções recebem a matriz padronizada e retornam dicionários e arrays, sem desenhar nada.
+A varredura e as silhuetas aceitam a função de ajuste (ou de avaliação) de cada k como
+parâmetro, para que quem as chama possa guardar os ajustes em cache e reaproveitá-los entre
+o cotovelo, a silhueta e o modelo final; ajustar_kmeans_em_disco é esse cache, em disco.
+"""
+import hashlib
+import os
+import threading
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+from threadpoolctl import threadpool_limits
+
+from core.cache_disco import diretorio_cache, hash_conteudo, liberar_espaco, registrar_acesso
+from core.importacao import tardio
+
+# scikit-learn é importado apenas no primeiro ajuste
+cluster = tardio('sklearn.cluster')
+
+def hash_dados(X):
+    """
+    Calcula um hash do conteúdo da matriz padronizada para servir de chave de cache.
+
+    Parâmetros:
+    - X (numpy.ndarray): A matriz padronizada.
+    """
+    X = np.ascontiguousarray(X)
+    return hashlib.sha1(str(X.shape).encode() + X.data).hexdigest()
+
+def criar_kmeans(k, motor='completo', batch_size=1024):
+    """
+    Cria o estimador K-means do motor escolhido.
+
+    Parâmetros:
+    - k (int): Quantidade de clusters.
+    - motor (str): 'completo' para o KMeans (Lloyd sobre todas as linhas a cada iteração) ou
+      'minibatch' para o MiniBatchKMeans, que atualiza os centróides com blocos de batch_size linhas.
+      O mini-batch reduz o tempo de cada ajuste, não a memória: X continua inteira na memória.
+    - batch_size (int): Quantidade de linhas de cada bloco no motor 'minibatch'.
+    """
+    if motor == 'completo':
+        return cluster.KMeans(n_clusters=k, n_init=10, random_state=123)
+    elif motor == 'minibatch':
+        return cluster.MiniBatchKMeans(n_clusters=k, n_init=3, batch_size=batch_size, random_state=123)
+    raise ValueError('Motor de K-means inválido. Escolha "completo" ou "minibatch".')
+
+def ajustar_kmeans(X, k, motor='completo', batch_size=1024):
+    """
+    Ajusta o K-means para um valor de k.
+
+    Parâmetros:
+    - X (numpy.ndarray): A matriz padronizada.
+    - k (int): Quantidade de clusters.
+    - motor (str): 'completo' ou 'minibatch', repassado para criar_kmeans.
+    - batch_size (int): Tamanho dos blocos do motor 'minibatch'.
+
+    Retorna:
+    - dict: Dicionário com 'inercia', 'labels' e 'centroides' do ajuste.
+    """
+    # Ajusta o modelo com semente fixa para que o resultado de cada k seja reprodutível
+    km = criar_kmeans(k, motor, batch_size)
+    km.fit(X)
+
+    # Guarda a soma dos quadrados, os rótulos e os centróides do ajuste
+    return {
+        'inercia': km.inertia_,
+        'labels': km.labels_,
+        'centroides': km.cluster_centers_,
+    }
+
+def ajustar_kmeans_em_disco(X, hash_X, k, motor='completo', batch_size=1024):
+    """
+    Ajusta o K-means para um valor de k, ou lê o ajuste já gravado no cache em disco.
+
+    O cache é indexado pelo hash da matriz, por k e pelo motor, e não depende do Streamlit:
+    pode ser usado pelas tarefas em segundo plano, que rodam fora da execução do script.
+
+    Parâmetros:
+    - X (numpy.ndarray): A matriz padronizada.
+    - hash_X (str): Hash do conteúdo de X, obtido com hash_dados.
+    - k (int): Quantidade de clusters.
+    - motor (str): 'completo' ou 'minibatch'.
+    - batch_size (int): Tamanho dos blocos do motor 'minibatch'.
+
+    Retorna:
+    - dict: Dicionário com 'inercia', 'labels' e 'centroides' do ajuste.
+    """
+    chave = hash_conteudo(f'{hash_X}|{k}|{motor}|{batch_size}'.encode())
+    caminho = diretorio_cache('ajustes_kmeans') / f'{chave}.npz'
+    if caminho.exists():
+        registrar_acesso(caminho)
+        with np.load(caminho) as arquivo:
+            return {'inercia': float(arquivo['inercia']), 'labels': arquivo['labels'],
+                    'centroides': arquivo['centroides']}
+
+    ajuste = ajustar_kmeans(X, k, motor, batch_size)
+
+    # Grava em um arquivo temporário e renomeia, para nunca deixar um ajuste pela metade
+    temporario = caminho.with_name(f'{chave}.{os.getpid()}.{threading.get_ident()}.tmp')
+    with open(temporario, 'wb') as arquivo:
+        np.savez(arquivo, **ajuste)
+    os.replace(temporario, caminho)
+    liberar_espaco('ajustes_kmeans', '*.npz')
+    return ajuste
+
+def executar_em_paralelo(funcao, valores_k, n_workers=1, ao_concluir=None):
+    """
+    Executa funcao(k) para cada k em um pool de threads, repassando os resultados à medida que terminam.
+
+    Parâmetros:
+    - funcao (callable): Função que recebe k e retorna o resultado daquele k.
+    - valores_k (iterable): Valores de k a executar.
+    - n_workers (int): Quantidade de threads do pool.
+    - ao_concluir (callable, opcional): Chamada a cada k concluído com os resultados parciais ordenados por k.
+
+    Retorna:
+    - dict: Resultado de cada k, ordenado por k.
+    """
+    resultados = {}
+
+    # Divide os núcleos entre os workers para que as threads internas (OpenMP/BLAS) de cada ajuste não disputem os mesmos núcleos
+    threads_por_worker = max(1, (os.cpu_count() or 1) // n_workers)
+
+    with threadpool_limits(limits=threads_por_worker), ThreadPoolExecutor(max_workers=n_workers) as executor:
+        futuros = {executor.submit(funcao, k): k for k in valores_k}
+
+        try:
+            for futuro in as_completed(futuros):
+                resultados[futuros[futuro]] = futuro.result()
+
+                # Repassa os pontos já calculados para que o gráfico seja atualizado durante a varredura
+                if ao_concluir is not None:
+                    ao_concluir(dict(sorted(resultados.items())))
+        except BaseException:
+            # Varredura interrompida (erro ou cancelamento): descarta os k que ainda não começaram
+            for futuro in futuros:
+                futuro.cancel()
+            raise
+
+    return dict(sorted(resultados.items()))
+
+def varredura_kmeans(X, k_min=1, k_max=9, motor='completo', batch_size=1024, n_workers=1, ao_concluir=None,
+                     ajustar=ajustar_kmeans):
+    """
+    Ajusta o K-means para cada k do intervalo, em paralelo quando n_workers > 1.
+
+    Parâmetros:
+    - X (numpy.ndarray): A matriz padronizada.
+    - k_min (int): Menor quantidade de clusters da varredura.
+    - k_max (int): Maior quantidade de clusters da varredura.
+    - motor (str): 'completo' ou 'minibatch', repassado para criar_kmeans.
+    - batch_size (int): Tamanho dos blocos do motor 'minibatch'.
+    - n_workers (int): Quantidade de ajustes executados ao mesmo tempo.
+    - ao_concluir (callable, opcional): Recebe os resultados parciais a cada k concluído.
+    - ajustar (callable): Função ajustar(X, k, motor, batch_size) de cada k; por padrão, ajustar_kmeans.
+
+    Retorna:
+    - dict: Para cada k, o resultado de ajustar.
+    """
+    return executar_em_paralelo(lambda k: ajustar(X, k, motor, batch_size),
+                                range(k_min, k_max + 1), n_workers, ao_concluir)
+
+def silhuetas_por_linha(X, labels, indices, memoria_bloco_mb=64):
+    """
+    Calcula a silhueta exata das linhas em indices, medindo as distâncias contra todas as linhas.
+
+    As distâncias são percorridas em blocos de linhas: a cada passo só existe na memória a matriz
+    do bloco contra todas as linhas (tamanho do bloco x n), nunca a matriz n x n completa.
+
+    Parâmetros:
+    - X (numpy.ndarray): A matriz padronizada.
+    - labels (numpy.ndarray): Rótulos dos clusters de cada linha.
+    - indices (numpy.ndarray): Linhas cuja silhueta será calculada.
+    - memoria_bloco_mb (int): Memória aproximada ocupada pelas distâncias de cada bloco.
+
+    Retorna:
+    - numpy.ndarray: Silhueta de cada linha em indices.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    n = X.shape[0]
+
+    # Converte os rótulos em códigos 0..k-1 e monta a matriz indicadora linha x cluster
+    _, codigos = np.unique(labels, return_inverse=True)
+    contagens = np.bincount(codigos)
+    indicadora = np.zeros((n, len(contagens)))
+    indicadora[np.arange(n), codigos] = 1.0
+
+    # Quantidade de linhas por bloco para respeitar a memória definida
+    tamanho_bloco = max(1, int(memoria_bloco_mb * 1024 ** 2 / (8 * n)))
+    normas = np.einsum('ij,ij->i', X, X)
+    silhuetas = np.empty(len(indices))
+
+    for inicio in range(0, len(indices), tamanho_bloco):
+        bloco = indices[inicio:inicio + tamanho_bloco]
+        codigos_bloco = codigos[bloco]
+        linhas = np.arange(len(bloco))
+
+        # Distâncias euclidianas do bloco contra todas as linhas
+        distancias = normas[bloco, None] - 2 * X[bloco] @ X.T + normas[None, :]
+        np.sqrt(np.maximum(distancias, 0, out=distancias), out=distancias)
+
+        # Soma das distâncias de cada linha do bloco para cada cluster
+        somas = distancias @ indicadora
+
+        # a: distância média para o próprio cluster (sem contar a própria linha)
+        tamanho_proprio = contagens[codigos_bloco]
+        a = somas[linhas, codigos_bloco] / np.maximum(tamanho_proprio - 1, 1)
+
+        # b: menor distância média para os outros clusters
+        medias = somas / contagens
+        medias[linhas, codigos_bloco] = np.inf
+        b = medias.min(axis=1)
+
+        # Silhueta de cada linha, zerada para clusters com um único elemento
+        with np.errstate(invalid='ignore', divide='ignore'):
+            s_bloco = np.nan_to_num((b - a) / np.maximum(a, b))
+        s_bloco[tamanho_proprio == 1] = 0.0
+
+        silhuetas[inicio:inicio + len(bloco)] = s_bloco
+
+    return silhuetas
+
+def silhueta_amostrada(X, labels, tamanho_amostra=2000, semente=123):
+    """
+    Estima o coeficiente de silhueta médio a partir de uma amostra aleatória das linhas.
+
+    A silhueta de cada linha sorteada é exata (medida contra todas as linhas), então o custo
+    cai de O(n²) para O(m·n) com m = tamanho_amostra, e a faixa de confiança de 95% é obtida
+    pelo erro padrão da média das silhuetas sorteadas.
+
+    Parâmetros:
+    - X (numpy.ndarray): A matriz padronizada.
+    - labels (numpy.ndarray): Rótulos dos clusters de cada linha.
+    - tamanho_amostra (int): Quantidade de linhas sorteadas.
+    - semente (int): Semente fixa do sorteio, para que o resultado seja reprodutível.
+
+    Retorna:
+    - dict: 'media', 'inferior' e 'superior' da estimativa.
+    """
+    # Sorteia as linhas da amostra (ou usa todas, se o arquivo for menor que a amostra)
+    rng = np.random.default_rng(semente)
+    n = X.shape[0]
+    if n <= tamanho_amostra:
+        return silhueta_exata_em_blocos(X, labels)
+    indices = np.sort(rng.choice(n, size=tamanho_amostra, replace=False))
+
+    # Silhueta exata de cada linha sorteada
+    silhuetas = silhuetas_por_linha(X, labels, indices)
+
+    # Média e faixa de confiança de 95% pela aproximação normal
+    media = silhuetas.mean()
+    margem = 1.96 * silhuetas.std(ddof=1) / np.sqrt(len(silhuetas))
+
+    return {'media': media, 'inferior': media - margem, 'superior': media + margem}
+
+def silhueta_exata_em_blocos(X, labels, memoria_bloco_mb=64):
+    """
+    Calcula o coeficiente de silhueta médio exato sem materializar a matriz de distâncias n x n.
+
+    Parâmetros:
+    - X (numpy.ndarray): A matriz padronizada.
+    - labels (numpy.ndarray): Rótulos dos clusters de cada linha.
+    - memoria_bloco_mb (int): Memória aproximada ocupada pelas distâncias de cada bloco.
+
+    Retorna:
+    - dict: 'media', 'inferior' e 'superior' (iguais, pois o valor é exato).
+    """
+    media = silhuetas_por_linha(X, labels, np.arange(X.shape[0]), memoria_bloco_mb).mean()
+    return {'media': media, 'inferior': media, 'superior': media}
+
+def silhueta_kmeans(X, k, modo='amostrada', tamanho_amostra=2000, motor='completo', batch_size=1024,
+                    ajustar=ajustar_kmeans):
+    """
+    Calcula o coeficiente de silhueta a partir dos rótulos do ajuste do K-means para k.
+
+    Parâmetros:
+    - X (numpy.ndarray): A matriz padronizada.
+    - k (int): Quantidade de clusters.
+    - modo (str): 'amostrada' para a estimativa por amostra ou 'exata' para o cálculo em blocos.
+    - tamanho_amostra (int): Quantidade de linhas sorteadas no modo 'amostrada'.
+    - motor (str): Motor do K-means cujos rótulos serão avaliados.
+    - batch_size (int): Tamanho dos blocos do motor 'minibatch'.
+    - ajustar (callable): Função ajustar(X, k, motor, batch_size); por padrão, ajustar_kmeans.
+    """
+    labels = ajustar(X, k, motor, batch_size)['labels']
+
+    if modo == 'amostrada':
+        return silhueta_amostrada(np.asarray(X, dtype=np.float64), labels, tamanho_amostra)
+    elif modo == 'exata':
+        return silhueta_exata_em_blocos(X, labels)
+    raise ValueError('Modo de silhueta inválido. Escolha "amostrada" ou "exata".')
+
+def calcular_silhuetas(X, k_min=2, k_max=10, modo='amostrada', tamanho_amostra=2000, motor='completo',
+                       batch_size=1024, n_workers=1, ao_concluir=None, avaliar=silhueta_kmeans):
+    """
+    Calcula o coeficiente de silhueta para cada k do intervalo, em paralelo quando n_workers > 1.
+
+    Parâmetros:
+    - X (numpy.ndarray): A matriz padronizada.
+    - k_min (int): Menor quantidade de clusters.
+    - k_max (int): Maior quantidade de clusters.
+    - modo (str): 'amostrada' ou 'exata', repassado para silhueta_kmeans.
+    - tamanho_amostra (int): Quantidade de linhas sorteadas no modo 'amostrada'.
+    - motor (str): Motor do K-means cujos rótulos serão avaliados.
+    - batch_size (int): Tamanho dos blocos do motor 'minibatch'.
+    - n_workers (int): Quantidade de cálculos executados ao mesmo tempo.
+    - ao_concluir (callable, opcional): Recebe os resultados parciais a cada k concluído.
+    - avaliar (callable): Função avaliar(X, k, modo, tamanho_amostra, motor, batch_size); por
+      padrão, silhueta_kmeans.
+
+    Retorna:
+    - dict: Para cada k, a 'media' e a faixa 'inferior'/'superior' da silhueta.
+    """
+    return executar_em_paralelo(lambda k: avaliar(X, k, modo, tamanho_amostra, motor, batch_size),
+                                range(k_min, k_max + 1), n_workers, ao_concluir)
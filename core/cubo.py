@@ -0,0 +1,107 @@
+"""
+Cubo de resumo por cluster, montado uma única vez a partir dos rótulos.
+
+Para cada variável categórica o cubo guarda a contagem de cada nível em cada cluster; para
+cada variável numérica, a quantidade, a soma, a média, o mínimo, os quantis e o máximo por
+cluster. Os filtros de resultados passam a ser consultas ao cubo, sem percorrer os dados.
+"""
+import pandas as pd
+
+# Quantis guardados para as variáveis numéricas
+QUANTIS_CUBO = (0.25, 0.5, 0.75)
+
+def e_categorica(serie):
+    """
+    Indica se a coluna é tratada como categórica (booleana, categórica ou texto) nos filtros.
+    """
+    tipo = serie.dtype
+    return (pd.api.types.is_bool_dtype(tipo) or isinstance(tipo, pd.CategoricalDtype)
+            or pd.api.types.is_object_dtype(tipo))
+
+def construir_cubo(df, coluna_grupo):
+    """
+    Monta o cubo de resumo por cluster.
+
+    Parâmetros:
+    - df (pandas.DataFrame): Dados com a coluna de rótulos.
+    - coluna_grupo (str): Nome da coluna de rótulos, por exemplo 'K-Means'.
+
+    Retorna:
+    - dict: 'grupo' (nome da coluna), 'tamanhos' (linhas por cluster), 'categoricas' (uma tabela
+      cluster x nível por variável) e 'numericas' (uma tabela cluster x estatística por variável).
+    """
+    grupos = df[coluna_grupo]
+    cubo = {
+        'grupo': coluna_grupo,
+        'tamanhos': grupos.value_counts().sort_index(),
+        'categoricas': {},
+        'numericas': {},
+    }
+
+    for coluna in df.columns.drop(coluna_grupo):
+        if e_categorica(df[coluna]):
+            # Contagem de cada nível em cada cluster
+            contagens = df.groupby([coluna_grupo, coluna], observed=True).size().unstack(fill_value=0)
+            cubo['categoricas'][coluna] = contagens.reindex(cubo['tamanhos'].index, fill_value=0)
+        else:
+            agrupado = df.groupby(coluna_grupo)[coluna]
+            resumo = agrupado.agg(['count', 'sum', 'mean', 'min', 'max'])
+            quantis = agrupado.quantile(list(QUANTIS_CUBO)).unstack()
+            quantis.columns = [f'q{int(q * 100)}' for q in QUANTIS_CUBO]
+            cubo['numericas'][coluna] = resumo.join(quantis)[['count', 'sum', 'mean', 'min', *quantis.columns, 'max']]
+
+    return cubo
+
+def niveis(cubo, variavel):
+    """
+    Retorna os níveis de uma variável categórica presentes nos dados.
+    """
+    return list(cubo['categoricas'][variavel].columns)
+
+def contagem_nivel(cubo, variavel, nivel):
+    """
+    Retorna quantas linhas de cada cluster têm a variável igual ao nível (apenas clusters com alguma).
+
+    Parâmetros:
+    - cubo (dict): Cubo retornado por construir_cubo.
+    - variavel (str): Variável categórica.
+    - nivel: Nível da variável.
+
+    Retorna:
+    - pandas.Series: Contagem por cluster, com o nome da variável.
+    """
+    contagens = cubo['categoricas'][variavel][nivel]
+    return contagens[contagens > 0].rename(variavel)
+
+def resumo_numerico(cubo, variavel):
+    """
+    Retorna as estatísticas por cluster de uma variável numérica.
+
+    Parâmetros:
+    - cubo (dict): Cubo retornado por construir_cubo.
+    - variavel (str): Variável numérica.
+    """
+    return cubo['numericas'][variavel]
+
+def contagem_condicoes(cubo, condicoes):
+    """
+    Conta as linhas de cada cluster que atendem a cada condição e indica o cluster predominante.
+
+    Parâmetros:
+    - cubo (dict): Cubo retornado por construir_cubo.
+    - condicoes (dict): Condições no formato {variável categórica: nível}.
+
+    Retorna:
+    - tuple: (DataFrame com a quantidade e a proporção de cada condição em cada cluster,
+      cluster com a maior quantidade na primeira condição).
+    """
+    tamanhos = cubo['tamanhos']
+    colunas = {}
+    for variavel, nivel in condicoes.items():
+        contagem = cubo['categoricas'][variavel][nivel]
+        colunas[f'{variavel} = {nivel}'] = contagem
+        colunas[f'% do grupo ({variavel} = {nivel})'] = (contagem / tamanhos * 100).round(2)
+
+    resultado = pd.DataFrame(colunas)
+    resultado.index.name = cubo['grupo']
+    return resultado, resultado.iloc[:, 0].idxmax()
@@ -0,0 +1,106 @@
+"""
+Exportação de resultados (DataFrames com rótulos de cluster ou classes RFV) para download.
+
+O arquivo é escrito em disco bloco a bloco, sem montar o CSV inteiro como texto na memória,
+e guardado no cache pelo hash do conteúdo e do formato: pedir o mesmo download de novo
+reaproveita o arquivo já gerado.
+
+O botão de download do Streamlit carrega o arquivo inteiro na memória do servidor, então
+arquivos acima de LIMITE_DOWNLOAD_MB (variável de ambiente CLUSTERIZACAO_DOWNLOAD_MB) não
+são oferecidos pela página.
+"""
+import gzip
+import os
+import threading
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from core.cache_disco import diretorio_cache, hash_conteudo, liberar_espaco, registrar_acesso
+
+# Tamanho máximo, em MB, de um arquivo oferecido pelo botão de download
+LIMITE_DOWNLOAD_MB = float(os.environ.get('CLUSTERIZACAO_DOWNLOAD_MB', 200))
+
+# Formatos oferecidos: extensão do arquivo e tipo MIME do download
+FORMATOS = {
+    'CSV compactado (.csv.gz)': ('csv.gz', 'application/gzip'),
+    'Parquet': ('parquet', 'application/octet-stream'),
+    'CSV': ('csv', 'text/csv'),
+}
+
+def chave_exportacao(df, extensao):
+    """
+    Calcula a chave do arquivo exportado a partir do conteúdo do DataFrame e do formato.
+
+    Parâmetros:
+    - df (pandas.DataFrame): Dados a exportar.
+    - extensao (str): Extensão do formato, por exemplo 'csv.gz'.
+    """
+    conteudo = pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes()
+    cabecalho = '|'.join(f'{c}:{t}' for c, t in df.dtypes.items()) + f'|{extensao}'
+    return hash_conteudo(cabecalho.encode() + conteudo)
+
+def escrever_csv(df, caminho, compactar=False, tamanho_bloco=100_000):
+    """
+    Escreve o CSV bloco a bloco, opcionalmente compactado com gzip.
+    """
+    abrir = gzip.open if compactar else open
+    with abrir(caminho, 'wt', newline='', encoding='utf-8') as arquivo:
+        for inicio in range(0, max(len(df), 1), tamanho_bloco):
+            df.iloc[inicio:inicio + tamanho_bloco].to_csv(arquivo, index=False, header=inicio == 0)
+
+def escrever_parquet(df, caminho, tamanho_bloco=100_000):
+    """
+    Escreve o Parquet com um grupo de linhas por bloco.
+    """
+    # O esquema vem do primeiro bloco, para que colunas de texto não sejam inferidas como nulas
+    esquema = pa.Schema.from_pandas(df.iloc[:tamanho_bloco], preserve_index=False)
+    with pq.ParquetWriter(caminho, esquema) as escritor:
+        for inicio in range(0, max(len(df), 1), tamanho_bloco):
+            bloco = df.iloc[inicio:inicio + tamanho_bloco]
+            escritor.write_table(pa.Table.from_pandas(bloco, schema=esquema, preserve_index=False))
+
+def cabe_no_download(caminho, limite_mb=LIMITE_DOWNLOAD_MB):
+    """
+    Verifica se o arquivo pode ser oferecido pelo botão de download sem ocupar memória demais.
+
+    Parâmetros:
+    - caminho (Path): Arquivo gerado.
+    - limite_mb (float): Tamanho máximo, em MB.
+
+    Retorna:
+    - tuple: (cabe, tamanho_mb).
+    """
+    tamanho_mb = os.path.getsize(caminho) / 1024 ** 2
+    return tamanho_mb <= limite_mb, tamanho_mb
+
+def exportar(df, formato='CSV compactado (.csv.gz)', tamanho_bloco=100_000):
+    """
+    Gera (ou reaproveita do cache) o arquivo de download do DataFrame.
+
+    Parâmetros:
+    - df (pandas.DataFrame): Dados a exportar.
+    - formato (str): Uma das chaves de FORMATOS.
+    - tamanho_bloco (int): Quantidade de linhas escritas por vez.
+
+    Retorna:
+    - tuple: (caminho, extensao, mime) do arquivo gerado.
+    """
+    extensao, mime = FORMATOS[formato]
+    caminho = diretorio_cache('exportacoes') / f'{chave_exportacao(df, extensao)}.{extensao}'
+    if caminho.exists():
+        registrar_acesso(caminho)
+        return caminho, extensao, mime
+
+    # Escreve em um arquivo temporário e renomeia, para que outra sessão nunca sirva um arquivo incompleto
+    parciais = diretorio_cache('exportacoes/parciais')
+    temporario = parciais / f'{caminho.name}.{os.getpid()}.{threading.get_ident()}.tmp'
+    if extensao == 'parquet':
+        escrever_parquet(df, temporario, tamanho_bloco)
+    else:
+        escrever_csv(df, temporario, extensao == 'csv.gz', tamanho_bloco)
+    os.replace(temporario, caminho)
+
+    liberar_espaco('exportacoes')
+    return caminho, extensao, mime
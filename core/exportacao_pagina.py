@@ -0,0 +1,46 @@
+"""
+Botões de download das páginas, sobre a exportação em disco de core/exportacao.py.
+
+É a única parte de core/ que usa o Streamlit; o restante do pacote continua livre da
+interface e pode ser usado pela execução em lote (python -m core).
+"""
+import streamlit as st
+
+from core.exportacao import FORMATOS, LIMITE_DOWNLOAD_MB, cabe_no_download, exportar
+
+def botao_download(df, nome_arquivo, rotulo):
+    """
+    Gera o arquivo do DataFrame em disco, em blocos, somente após o clique e oferece o download.
+
+    Parâmetros:
+    - df (pandas.DataFrame): Dados a exportar.
+    - nome_arquivo (str): Nome do arquivo baixado, sem a extensão.
+    - rotulo (str): Texto do botão que gera o arquivo.
+    """
+    formato = st.selectbox("Formato do download", list(FORMATOS))
+    if st.button(rotulo):
+        with st.spinner("Gerando arquivo..."):
+            caminho, extensao, mime = exportar(df, formato)
+
+        # O arquivo é servido pelo endpoint de mídia do Streamlit, e não embutido na página
+        oferecer_arquivo(caminho, f'{nome_arquivo}.{extensao}', mime)
+
+def oferecer_arquivo(caminho, nome_arquivo, mime):
+    """
+    Oferece o download do arquivo gerado, ou avisa se ele for grande demais para a memória.
+
+    Parâmetros:
+    - caminho (Path): Arquivo gerado em disco.
+    - nome_arquivo (str): Nome do arquivo baixado, com a extensão.
+    - mime (str): Tipo MIME do download.
+    """
+    # O botão de download lê o arquivo inteiro na memória do servidor
+    cabe, tamanho_mb = cabe_no_download(caminho)
+    if not cabe:
+        # Apenas o nome e o tamanho são mostrados: o caminho no servidor não é exposto a quem usa a página
+        st.warning(f"O arquivo {nome_arquivo} tem {tamanho_mb:,.0f} MB, acima do limite de {LIMITE_DOWNLOAD_MB:,.0f} MB "
+                   "do download pela página. Para arquivos grandes, use a execução em lote (`python -m core`).")
+        return
+
+    with open(caminho, 'rb') as arquivo:
+        st.download_button("Baixar arquivo", arquivo, file_name=nome_arquivo, mime=mime)
@@ -0,0 +1,295 @@
+"""
+Agrupamento hierárquico em memória limitada: micro-clusters, árvore de junções e corte.
+
+A ligação, que precisa de memória O(m²), é calculada sobre no máximo n_micro centros de
+micro-clusters, e o rótulo de cada micro-cluster é propagado para as suas linhas. A árvore
+completa é calculada uma vez; escolher outra quantidade de clusters é apenas um novo corte.
+"""
+import os
+import threading
+
+import numpy as np
+
+from core.cache_disco import diretorio_cache, hash_conteudo, liberar_espaco, registrar_acesso
+from core.importacao import tardio
+
+# scikit-learn e scipy são importados apenas quando a árvore for construída
+cluster = tardio('sklearn.cluster')
+neighbors = tardio('sklearn.neighbors')
+hierarchy = tardio('scipy.cluster.hierarchy')
+distance = tardio('scipy.spatial.distance')
+
+def resumir_micro_clusters(X, metodo='birch', n_micro=500):
+    """
+    Resume as linhas em no máximo n_micro micro-clusters antes da ligação hierárquica.
+
+    Parâmetros:
+    - X (numpy.ndarray): A matriz padronizada.
+    - metodo (str): 'birch' (árvore CF de memória limitada), 'kmeans' (MiniBatchKMeans com
+      n_micro centróides) ou 'nenhum' (cada linha é o seu próprio micro-cluster).
+    - n_micro (int): Quantidade máxima de micro-clusters.
+
+    Retorna:
+    - tuple: (centros, atribuicao), com os centros dos micro-clusters e o micro-cluster de cada linha.
+    """
+    X = np.asarray(X, dtype=np.float64)
+
+    # Sem pré-agrupamento (ou com poucas linhas) a ligação é feita sobre as próprias linhas
+    if metodo == 'nenhum' or len(X) <= n_micro:
+        return X, np.arange(len(X))
+
+    if metodo == 'birch':
+        # A árvore CF do BIRCH lê as linhas uma vez e guarda apenas os subclusters
+        birch = cluster.Birch(threshold=0.5, n_clusters=None).fit(X)
+        centros, atribuicao = birch.subcluster_centers_, birch.labels_
+
+        # Se o BIRCH gerar subclusters demais, junta-os com um K-means ponderado pelo tamanho de cada um
+        if len(centros) > n_micro:
+            pesos = np.bincount(atribuicao, minlength=len(centros))
+            km = cluster.KMeans(n_clusters=n_micro, n_init=1, random_state=123).fit(centros, sample_weight=pesos)
+            centros, atribuicao = km.cluster_centers_, km.labels_[atribuicao]
+    elif metodo == 'kmeans':
+        km = cluster.MiniBatchKMeans(n_clusters=n_micro, n_init=1, batch_size=4096, random_state=123).fit(X)
+        centros, atribuicao = km.cluster_centers_, km.labels_
+    else:
+        raise ValueError('Pré-agrupamento inválido. Escolha "birch", "kmeans" ou "nenhum".')
+
+    # Descarta micro-clusters que ficaram sem nenhuma linha
+    usados, atribuicao = np.unique(atribuicao, return_inverse=True)
+    return centros[usados], atribuicao
+
+def matriz_ligacao(children, distancias, n_folhas):
+    """
+    Converte a árvore do AgglomerativeClustering para a matriz de ligação no formato do scipy.
+
+    Parâmetros:
+    - children (numpy.ndarray): Pares de nós unidos em cada junção (children_ do sklearn).
+    - distancias (numpy.ndarray): Distância de cada junção (distances_ do sklearn).
+    - n_folhas (int): Quantidade de folhas da árvore.
+
+    Retorna:
+    - numpy.ndarray: Matriz (n_folhas - 1) x 4 com os nós unidos, a distância e o tamanho do novo nó.
+    """
+    tamanhos = np.zeros(len(children))
+
+    # Tamanho de cada novo nó = soma dos tamanhos dos dois nós unidos
+    for i, (a, b) in enumerate(children):
+        tamanhos[i] = (1 if a < n_folhas else tamanhos[a - n_folhas]) + (1 if b < n_folhas else tamanhos[b - n_folhas])
+
+    return np.column_stack([children, distancias, tamanhos]).astype(float)
+
+def ward_ponderado(centros, pesos, ao_progredir=None):
+    """
+    Calcula a ligação ward sobre centros de micro-clusters, cada um pesando a quantidade de linhas que resume.
+
+    O aumento da soma dos quadrados ao unir dois grupos depende apenas dos seus centróides e
+    tamanhos, então o resultado é o ward exato sobre as linhas com os micro-clusters mantidos
+    inteiros. As junções seguem a cadeia de vizinhos mais próximos (NN-chain), em memória O(m).
+
+    Parâmetros:
+    - centros (numpy.ndarray): Centros dos micro-clusters.
+    - pesos (numpy.ndarray): Quantidade de linhas de cada micro-cluster.
+    - ao_progredir (callable, opcional): Chamada com a fração das junções já feitas, a cada 100 junções.
+
+    Retorna:
+    - numpy.ndarray: Matriz de ligação (m - 1) x 4 no formato do scipy, com o tamanho de cada nó em micro-clusters.
+    """
+    m = len(centros)
+    centroides = np.array(centros, dtype=np.float64)
+    pesos = np.asarray(pesos, dtype=np.float64).copy()
+    folhas = np.ones(m)
+    ativos = np.ones(m, dtype=bool)
+    juncoes = []
+
+    # Cada junção fica na posição do primeiro grupo, que passa a representar o grupo unido
+    cadeia = []
+    for i in range(m - 1):
+        if ao_progredir is not None and i % 100 == 0:
+            ao_progredir(i / (m - 1))
+        while True:
+            if not cadeia:
+                cadeia.append(int(np.flatnonzero(ativos)[0]))
+            a = cadeia[-1]
+
+            # Distância ward de a para todos os grupos ativos
+            d2 = 2 * pesos[a] * pesos / (pesos[a] + pesos) * ((centroides - centroides[a]) ** 2).sum(axis=1)
+            d2[~ativos] = np.inf
+            d2[a] = np.inf
+            b = int(np.argmin(d2))
+
+            # Em caso de empate, prefere o anterior da cadeia, o que garante o fim da cadeia
+            if len(cadeia) > 1 and d2[cadeia[-2]] <= d2[b]:
+                b = cadeia[-2]
+            if len(cadeia) > 1 and b == cadeia[-2]:
+                break
+            cadeia.append(b)
+
+        # a e b são vizinhos mais próximos um do outro: une os dois
+        cadeia = cadeia[:-2]
+        total = pesos[a] + pesos[b]
+        juncoes.append((a, b, np.sqrt(d2[b]), folhas[a] + folhas[b]))
+        centroides[a] = (pesos[a] * centroides[a] + pesos[b] * centroides[b]) / total
+        pesos[a], folhas[a] = total, folhas[a] + folhas[b]
+        ativos[b] = False
+
+    # Ordena as junções pela distância e numera os nós no formato do scipy
+    juncoes.sort(key=lambda juncao: juncao[2])
+    no = np.arange(m)
+    ligacao = np.empty((m - 1, 4))
+    for i, (a, b, distancia, tamanho) in enumerate(juncoes):
+        ligacao[i] = (min(no[a], no[b]), max(no[a], no[b]), distancia, tamanho)
+        no[a] = m + i
+    return ligacao
+
+def construir_arvore(X, linkage='ward', pre_agrupamento='birch', n_micro=500, conectividade=False,
+                     ao_progredir=None):
+    """
+    Calcula a árvore completa de junções sobre os micro-clusters.
+
+    No ward sem grafo de conectividade cada micro-cluster pesa a quantidade de linhas que resume
+    (ward_ponderado). Nas demais ligações, e no ward com conectividade, os centros entram sem peso
+    e a árvore é uma aproximação da calculada sobre as linhas.
+
+    Parâmetros:
+    - X (numpy.ndarray): A matriz padronizada.
+    - linkage (str): Método de ligação ('ward', 'complete', 'average' ou 'single').
+    - pre_agrupamento (str): 'birch', 'kmeans' ou 'nenhum', repassado para resumir_micro_clusters.
+    - n_micro (int): Quantidade máxima de micro-clusters.
+    - conectividade (bool): No ward, restringe as junções aos vizinhos mais próximos de cada micro-cluster.
+    - ao_progredir (callable, opcional): Chamada com a fração concluída (de 0 a 1) após o
+      pré-agrupamento e durante a ligação; pode interromper o cálculo levantando uma exceção.
+
+    Retorna:
+    - dict: 'ligacao' (matriz de ligação), 'centros' e 'atribuicao' dos micro-clusters.
+    """
+    informar = ao_progredir or (lambda fracao: None)
+
+    # Resume as linhas em micro-clusters
+    centros, atribuicao = resumir_micro_clusters(X, pre_agrupamento, n_micro)
+    informar(0.5)
+
+    # Com um único micro-cluster não há junção nenhuma a fazer
+    if len(centros) < 2:
+        return {'ligacao': np.empty((0, 4)), 'centros': centros, 'atribuicao': atribuicao}
+
+    # Ward com micro-clusters de tamanhos diferentes: junções ponderadas pela quantidade de linhas
+    pesos = np.bincount(atribuicao, minlength=len(centros))
+    if linkage == 'ward' and not conectividade and (pesos != 1).any():
+        ligacao = ward_ponderado(centros, pesos, lambda fracao: informar(0.5 + 0.5 * fracao))
+        return {'ligacao': ligacao, 'centros': centros, 'atribuicao': atribuicao}
+
+    # Grafo de vizinhança entre os micro-clusters, usado apenas no ward
+    grafo = None
+    if conectividade and linkage == 'ward':
+        grafo = neighbors.kneighbors_graph(centros, n_neighbors=min(10, len(centros) - 1), include_self=False)
+
+    # distance_threshold=0 faz o AgglomerativeClustering registrar todas as junções até a raiz
+    agglomerative_fit = cluster.AgglomerativeClustering(n_clusters=None, distance_threshold=0, linkage=linkage,
+                                                connectivity=grafo, compute_full_tree=True)
+    agglomerative_fit.fit(centros)
+
+    return {
+        'ligacao': matriz_ligacao(agglomerative_fit.children_, agglomerative_fit.distances_, len(centros)),
+        'centros': centros,
+        'atribuicao': atribuicao,
+    }
+
+def arvore_em_disco(X, hash_X, linkage='ward', pre_agrupamento='birch', n_micro=500, conectividade=False,
+                    ao_progredir=None):
+    """
+    Constrói a árvore com construir_arvore, ou lê a já gravada no cache em disco para os mesmos dados e parâmetros.
+
+    O cache não depende do Streamlit e pode ser usado pelas tarefas em segundo plano.
+
+    Parâmetros:
+    - X (numpy.ndarray): A matriz padronizada.
+    - hash_X (str): Hash do conteúdo de X, obtido com hash_dados.
+    - linkage, pre_agrupamento, n_micro, conectividade, ao_progredir: Repassados para construir_arvore.
+
+    Retorna:
+    - dict: 'ligacao' (matriz de ligação), 'centros' e 'atribuicao' dos micro-clusters.
+    """
+    chave = hash_conteudo(f'{hash_X}|{linkage}|{pre_agrupamento}|{n_micro}|{conectividade}'.encode())
+    caminho = diretorio_cache('arvores') / f'{chave}.npz'
+    if caminho.exists():
+        registrar_acesso(caminho)
+        with np.load(caminho) as arquivo:
+            return {nome: arquivo[nome] for nome in ('ligacao', 'centros', 'atribuicao')}
+
+    arvore = construir_arvore(X, linkage, pre_agrupamento, n_micro, conectividade, ao_progredir)
+
+    # Grava em um arquivo temporário e renomeia, para nunca deixar uma árvore pela metade
+    temporario = caminho.with_name(f'{chave}.{os.getpid()}.{threading.get_ident()}.tmp')
+    with open(temporario, 'wb') as arquivo:
+        np.savez(arquivo, **arvore)
+    os.replace(temporario, caminho)
+    liberar_espaco('arvores', '*.npz')
+    return arvore
+
+def cortar_arvore(arvore, n_clusters):
+    """
+    Corta a árvore em n_clusters grupos desfazendo as últimas n_clusters - 1 junções.
+
+    Parâmetros:
+    - arvore (dict): Resultado de construir_arvore.
+    - n_clusters (int): Quantidade de clusters desejada.
+
+    Retorna:
+    - numpy.ndarray: Rótulo do cluster de cada linha.
+    """
+    ligacao = arvore['ligacao']
+    n_folhas = len(ligacao) + 1
+
+    if not 0 < n_clusters <= n_folhas:
+        raise ValueError(f'A quantidade de clusters deve estar entre 1 e {n_folhas} micro-clusters.')
+
+    if n_folhas == 1:
+        return np.zeros(len(arvore['atribuicao']), dtype=int)
+
+    # Critério monótono = ordem de cada junção: o fcluster mantém apenas as primeiras n_folhas - n_clusters
+    ordem = np.arange(n_folhas - 1, dtype=float)
+    raizes = hierarchy.fcluster(ligacao, t=n_folhas - n_clusters - 1, criterion='monocrit', monocrit=ordem)
+
+    # Numera os grupos de 0 a n_clusters - 1 e propaga o rótulo de cada micro-cluster para as suas linhas
+    _, labels_micro = np.unique(raizes, return_inverse=True)
+    return labels_micro[arvore['atribuicao']]
+
+def rotulos_hierarquicos(X, n_clusters, linkage='ward', pre_agrupamento='birch', n_micro=500, conectividade=False):
+    """
+    Agrupa as linhas com o Agglomerative Clustering sobre micro-clusters, em memória limitada.
+
+    Parâmetros:
+    - X (numpy.ndarray): A matriz padronizada.
+    - n_clusters (int): Quantidade de clusters desejada.
+    - linkage, pre_agrupamento, n_micro, conectividade: Repassados para construir_arvore.
+
+    Retorna:
+    - numpy.ndarray: Rótulo do cluster de cada linha de X.
+    """
+    return cortar_arvore(construir_arvore(X, linkage, pre_agrupamento, n_micro, conectividade), n_clusters)
+
+def altura_corte(arvore, n_clusters):
+    """
+    Retorna a altura entre a junção desfeita e a mantida no corte em n_clusters, ou None se não houver corte.
+    """
+    ligacao = arvore['ligacao']
+    if 1 < n_clusters <= len(ligacao):
+        return (ligacao[-n_clusters, 2] + ligacao[-n_clusters + 1, 2]) / 2
+    return None
+
+def correlacao_cofenetica(arvore, max_centros=5000):
+    """
+    Mede o quanto a árvore preserva as distâncias entre os micro-clusters.
+
+    Parâmetros:
+    - arvore (dict): Resultado de construir_arvore.
+    - max_centros (int): Acima desta quantidade de micro-clusters a correlação não é calculada,
+      pois as distâncias entre todos os pares ocupariam memória demais.
+
+    Retorna:
+    - float ou None: A correlação cofenética, ou None com menos de 3 ou mais de max_centros micro-clusters.
+    """
+    if not 2 < len(arvore['centros']) <= max_centros:
+        return None
+    correlacao, _ = hierarchy.cophenet(arvore['ligacao'], distance.pdist(arvore['centros']))
+    return correlacao
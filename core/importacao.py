@@ -0,0 +1,51 @@
+"""
+Importação tardia das bibliotecas pesadas (seaborn, matplotlib, plotly, scikit-learn, scipy...).
+
+O módulo só é importado de fato no primeiro acesso a um dos seus atributos, de modo que uma
+página que não usa o gráfico ou o algoritmo não paga o tempo de importação dele.
+"""
+import importlib
+import sys
+import types
+
+class ModuloTardio(types.ModuleType):
+    """
+    Representa um módulo que será importado no primeiro acesso a um atributo.
+
+    Parâmetros:
+    - nome (str): Nome completo do módulo, por exemplo 'matplotlib.pyplot'.
+    """
+
+    def __init__(self, nome):
+        super().__init__(nome)
+        self.__dict__['_modulo'] = None
+
+    def _carregar(self):
+        """
+        Importa o módulo na primeira chamada e retorna o módulo real.
+        """
+        if self.__dict__['_modulo'] is None:
+            self.__dict__['_modulo'] = importlib.import_module(self.__name__)
+        return self.__dict__['_modulo']
+
+    def __getattr__(self, atributo):
+        return getattr(self._carregar(), atributo)
+
+    def __dir__(self):
+        return dir(self._carregar())
+
+    def __repr__(self):
+        estado = 'carregado' if self.__dict__['_modulo'] is not None else 'ainda não importado'
+        return f"<módulo tardio '{self.__name__}' ({estado})>"
+
+def tardio(nome):
+    """
+    Retorna o módulo para importação tardia, ou o próprio módulo se ele já estiver importado.
+
+    Parâmetros:
+    - nome (str): Nome completo do módulo.
+    """
+    modulo = sys.modules.get(nome)
+    if modulo is not None:
+        return modulo
+    return ModuloTardio(nome)
@@ -0,0 +1,451 @@
+"""
+Leitura dos arquivos enviados pelo usuário, em blocos e com tipos reduzidos.
+
+Os dois conjuntos de dados conhecidos (sessões do "online_shoppers_intention" e transações
+do "exemplo_RFV") têm um esquema fixo; arquivos com outras colunas têm os tipos inferidos
+bloco a bloco. Cada arquivo enviado é convertido uma única vez para Parquet no cache em
+disco, e as páginas leem dele apenas as colunas de que precisam.
+"""
+import os
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from pandas.api.types import union_categoricals
+
+from core.cache_disco import diretorio_cache, hash_arquivo, liberar_espaco, registrar_acesso
+
+# Mede o pico de memória das leituras com o tracemalloc (variável de ambiente CLUSTERIZACAO_MEDIR_MEMORIA=1).
+# Fica desligado por padrão: o rastreamento vale para o processo inteiro e deixa mais lentas as outras sessões
+MEDIR_MEMORIA = os.environ.get('CLUSTERIZACAO_MEDIR_MEMORIA', '0') == '1'
+
+# Vocabulários fixos das colunas categóricas (os meses seguem a grafia do arquivo de sessões)
+MESES = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'June', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+TIPOS_VISITANTE = ['New_Visitor', 'Other', 'Returning_Visitor']
+
+# Esquemas dos conjuntos de dados conhecidos: tipo de cada coluna e colunas de data
+ESQUEMAS = {
+    'sessoes': {
+        'tipos': {
+            'Administrative': 'int32',
+            'Administrative_Duration': 'float32',
+            'Informational': 'int32',
+            'Informational_Duration': 'float32',
+            'ProductRelated': 'int32',
+            'ProductRelated_Duration': 'float32',
+            'BounceRates': 'float32',
+            'ExitRates': 'float32',
+            'PageValues': 'float32',
+            'SpecialDay': 'float32',
+            'Month': pd.CategoricalDtype(MESES),
+            'OperatingSystems': 'int32',
+            'Browser': 'int32',
+            'Region': 'int32',
+            'TrafficType': 'int32',
+            'VisitorType': pd.CategoricalDtype(TIPOS_VISITANTE),
+            'Weekend': 'bool',
+            'Revenue': 'bool',
+        },
+        'datas': [],
+    },
+    'rfv': {
+        # ValorTotal fica em float64 porque é somado por cliente no cálculo do Valor
+        'tipos': {
+            'ID_cliente': 'int32',
+            'CodigoCompra': 'int32',
+            'ValorTotal': 'float64',
+        },
+        'datas': ['DiaCompra'],
+    },
+}
+
+def detectar_esquema(colunas):
+    """
+    Identifica qual esquema conhecido corresponde às colunas do arquivo.
+
+    Parâmetros:
+    - colunas (list): Nomes das colunas do arquivo.
+
+    Retorna:
+    - str ou None: Nome do esquema em ESQUEMAS, ou None se as colunas não forem de nenhum deles.
+    """
+    for nome, esquema in ESQUEMAS.items():
+        if set(colunas) == set(esquema['tipos']) | set(esquema['datas']):
+            return nome
+    return None
+
+def reduzir_tipos(bloco):
+    """
+    Reduz os tipos de um bloco sem esquema conhecido: números para o menor tipo que os comporta
+    e textos para categóricos.
+
+    Parâmetros:
+    - bloco (pandas.DataFrame): Bloco lido com os tipos padrão do pandas.
+    """
+    for coluna in bloco.columns:
+        serie = bloco[coluna]
+        if pd.api.types.is_integer_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+            bloco[coluna] = pd.to_numeric(serie, downcast='integer')
+        elif pd.api.types.is_float_dtype(serie):
+            bloco[coluna] = pd.to_numeric(serie, downcast='float')
+        elif pd.api.types.is_object_dtype(serie) or pd.api.types.is_string_dtype(serie):
+            bloco[coluna] = serie.astype('category')
+    return bloco
+
+def converter_categoricas(bloco, tipos):
+    """
+    Converte as colunas categóricas do esquema, recusando valores fora das categorias.
+
+    A conversão direta para um CategoricalDtype troca por NaN, sem aviso, os valores que não
+    estão nas categorias (por exemplo, um mês escrito de outra forma).
+
+    Parâmetros:
+    - bloco (pandas.DataFrame): Bloco com as colunas categóricas ainda como texto.
+    - tipos (dict): Tipos do esquema conhecido.
+
+    Retorna:
+    - pandas.DataFrame: O bloco com as colunas categóricas convertidas. Levanta ValueError com
+      os valores que não puderam ser convertidos.
+    """
+    for coluna, tipo in tipos.items():
+        if coluna not in bloco or not isinstance(tipo, pd.CategoricalDtype):
+            continue
+        convertida = bloco[coluna].astype(tipo)
+        invalidos = bloco[coluna][convertida.isna() & bloco[coluna].notna()].unique()
+        if len(invalidos):
+            raise ValueError(f"A coluna '{coluna}' tem valores fora das categorias esperadas "
+                             f"({', '.join(map(str, tipo.categories))}): {', '.join(map(str, invalidos[:10]))}.")
+        bloco[coluna] = convertida
+    return bloco
+
+def iterar_blocos(arquivo, tamanho_bloco=100_000, colunas=None):
+    """
+    Lê o CSV em blocos de tamanho_bloco linhas, já com os tipos reduzidos.
+
+    Parâmetros:
+    - arquivo (str ou arquivo): Caminho ou arquivo aberto (como o enviado pelo st.file_uploader).
+    - tamanho_bloco (int): Quantidade de linhas de cada bloco.
+    - colunas (list, opcional): Lê apenas essas colunas.
+
+    Retorna:
+    - generator: Blocos (pandas.DataFrame) na ordem do arquivo.
+    """
+    # Lê o cabeçalho para descobrir o esquema
+    if hasattr(arquivo, 'seek'):
+        arquivo.seek(0)
+    cabecalho = pd.read_csv(arquivo, nrows=0).columns.tolist()
+    if hasattr(arquivo, 'seek'):
+        arquivo.seek(0)
+
+    # Os leitores ficam em blocos with, para que o arquivo seja fechado mesmo se o gerador for
+    # fechado antes do fim (por exemplo, depois de ler só uma amostra)
+    esquema = ESQUEMAS.get(detectar_esquema(cabecalho))
+    if esquema is None:
+        with pd.read_csv(arquivo, chunksize=tamanho_bloco, usecols=colunas) as leitor:
+            for bloco in leitor:
+                yield reduzir_tipos(bloco)
+        return
+
+    # As colunas categóricas são lidas como texto e convertidas depois, para acusar valores desconhecidos
+    lidas = colunas or cabecalho
+    with pd.read_csv(
+        arquivo,
+        chunksize=tamanho_bloco,
+        usecols=colunas,
+        dtype={c: str if isinstance(t, pd.CategoricalDtype) else t for c, t in esquema['tipos'].items() if c in lidas},
+        parse_dates=[c for c in esquema['datas'] if c in lidas],
+    ) as leitor:
+        for bloco in leitor:
+            yield converter_categoricas(bloco, esquema['tipos'])
+
+def iterar_blocos_parquet(arquivo, tamanho_bloco=100_000, colunas=None):
+    """
+    Lê o Parquet em blocos de até tamanho_bloco linhas, com os tipos do seu esquema.
+
+    Parâmetros:
+    - arquivo (str, Path ou arquivo): Caminho ou arquivo aberto.
+    - tamanho_bloco (int): Quantidade máxima de linhas de cada bloco.
+    - colunas (list, opcional): Lê apenas essas colunas.
+
+    Retorna:
+    - generator: Blocos (pandas.DataFrame) na ordem do arquivo.
+    """
+    if hasattr(arquivo, 'seek'):
+        arquivo.seek(0)
+    parquet = pq.ParquetFile(arquivo)
+    nomes = [c for c in parquet.schema_arrow.names if not c.startswith('__index_level_')]
+    esquema = ESQUEMAS.get(detectar_esquema(nomes))
+
+    for lote in parquet.iter_batches(batch_size=tamanho_bloco, columns=colunas):
+        bloco = lote.to_pandas()
+        if esquema is None:
+            yield reduzir_tipos(bloco)
+            continue
+
+        bloco = bloco.astype({c: t for c, t in esquema['tipos'].items()
+                              if c in bloco and not isinstance(t, pd.CategoricalDtype)})
+        bloco = converter_categoricas(bloco, esquema['tipos'])
+        for coluna in esquema['datas']:
+            if coluna in bloco:
+                bloco[coluna] = pd.to_datetime(bloco[coluna])
+        yield bloco
+
+def iterar_arquivo(arquivo, tamanho_bloco=100_000, colunas=None):
+    """
+    Lê um CSV ou Parquet em blocos, escolhendo o leitor pelo conteúdo do arquivo.
+
+    Parâmetros:
+    - arquivo (str, Path ou arquivo): Caminho ou arquivo aberto.
+    - tamanho_bloco (int): Quantidade de linhas de cada bloco.
+    - colunas (list, opcional): Lê apenas essas colunas.
+    """
+    if e_parquet(arquivo):
+        return iterar_blocos_parquet(arquivo, tamanho_bloco, colunas)
+    return iterar_blocos(arquivo, tamanho_bloco, colunas)
+
+def concatenar_blocos(blocos):
+    """
+    Junta os blocos lidos unificando as categorias das colunas categóricas.
+
+    Parâmetros:
+    - blocos (list): Blocos (pandas.DataFrame) com as mesmas colunas.
+    """
+    if not blocos:
+        return pd.DataFrame()
+
+    # Colunas categóricas com categorias diferentes entre os blocos viram objeto no pd.concat
+    for coluna in blocos[0].columns:
+        if all(isinstance(b[coluna].dtype, pd.CategoricalDtype) for b in blocos):
+            categorias = union_categoricals([b[coluna] for b in blocos]).categories
+            for b in blocos:
+                b[coluna] = b[coluna].cat.set_categories(categorias)
+
+    return pd.concat(blocos, ignore_index=True)
+
+def aplicar_tipos(df):
+    """
+    Converte um DataFrame já carregado (por exemplo, de um Parquet enviado) para os tipos do seu esquema.
+
+    Parâmetros:
+    - df (pandas.DataFrame): Dados com os tipos originais.
+    """
+    esquema = ESQUEMAS.get(detectar_esquema(df.columns))
+    if esquema is None:
+        return reduzir_tipos(df)
+
+    df = df.astype({c: t for c, t in esquema['tipos'].items() if not isinstance(t, pd.CategoricalDtype)})
+    df = converter_categoricas(df, esquema['tipos'])
+    for coluna in esquema['datas']:
+        df[coluna] = pd.to_datetime(df[coluna])
+    return df
+
+def ler_csv(arquivo, tamanho_bloco=100_000, colunas=None, medir_memoria=MEDIR_MEMORIA):
+    """
+    Lê o CSV inteiro em blocos e, se pedido, mede a memória usada durante a leitura.
+
+    Parâmetros:
+    - arquivo (str ou arquivo): Caminho ou arquivo aberto.
+    - tamanho_bloco (int): Quantidade de linhas de cada bloco.
+    - colunas (list, opcional): Lê apenas essas colunas.
+    - medir_memoria (bool): Mede o pico de memória com o tracemalloc; por padrão, MEDIR_MEMORIA.
+
+    Retorna:
+    - tuple: (df, relatorio), em que relatorio tem 'esquema', 'linhas', 'memoria_mb',
+      'pico_mb' (None sem medição) e 'tempo_s' da leitura.
+    """
+    # Mede o pico de memória da leitura apenas se pedido e se ninguém mais estiver medindo
+    medir = medir_memoria and not tracemalloc.is_tracing()
+    if medir:
+        tracemalloc.start()
+    inicio = time.perf_counter()
+
+    try:
+        df = concatenar_blocos(list(iterar_blocos(arquivo, tamanho_bloco, colunas)))
+        pico = tracemalloc.get_traced_memory()[1] if medir else None
+    finally:
+        if medir:
+            tracemalloc.stop()
+
+    relatorio = {
+        'esquema': detectar_esquema(df.columns) if colunas is None else None,
+        'linhas': len(df),
+        'memoria_mb': df.memory_usage(deep=True).sum() / 1024 ** 2,
+        'pico_mb': pico / 1024 ** 2 if pico is not None else None,
+        'tempo_s': time.perf_counter() - inicio,
+    }
+    return df, relatorio
+
+def e_parquet(arquivo):
+    """
+    Verifica pela assinatura 'PAR1' no início do conteúdo se o arquivo é Parquet.
+
+    Parâmetros:
+    - arquivo (str, Path ou arquivo): Caminho ou arquivo aberto.
+    """
+    if hasattr(arquivo, 'getbuffer'):
+        return bytes(arquivo.getbuffer()[:4]) == b'PAR1'
+    with open(arquivo, 'rb') as f:
+        return f.read(4) == b'PAR1'
+
+def esquema_arrow(bloco, conhecido):
+    """
+    Define o esquema Parquet de todo o arquivo a partir do primeiro bloco.
+
+    Os códigos dos categóricos passam a int32, pois cada bloco escolhe o menor tipo para as suas
+    categorias. Sem esquema conhecido os números ficam em 64 bits, já que a redução de tipos de um
+    bloco pode não comportar os valores dos seguintes; reduzir_tipos volta a reduzi-los na leitura.
+
+    Parâmetros:
+    - bloco (pandas.DataFrame): Primeiro bloco lido.
+    - conhecido (bool): Se o arquivo segue um dos esquemas de ESQUEMAS.
+    """
+    campos = []
+    for campo in pa.Schema.from_pandas(bloco, preserve_index=False):
+        tipo = campo.type
+        if pa.types.is_dictionary(tipo):
+            valores = pa.string() if pa.types.is_null(tipo.value_type) else tipo.value_type
+            tipo = pa.dictionary(pa.int32(), valores)
+        elif not conhecido and pa.types.is_integer(tipo):
+            tipo = pa.int64()
+        elif not conhecido and pa.types.is_floating(tipo):
+            tipo = pa.float64()
+        campos.append(pa.field(campo.name, tipo))
+    return pa.schema(campos, metadata=pa.Schema.from_pandas(bloco, preserve_index=False).metadata)
+
+def armazenar_upload(arquivo, tamanho_bloco=100_000, medir_memoria=MEDIR_MEMORIA):
+    """
+    Converte o arquivo para Parquet uma única vez, guardando-o no cache pelo hash do conteúdo.
+
+    O arquivo é lido e gravado bloco a bloco, então a conversão nunca tem o arquivo inteiro na memória.
+
+    Parâmetros:
+    - arquivo (str, Path ou arquivo): CSV ou Parquet, por caminho ou aberto.
+    - tamanho_bloco (int): Quantidade de linhas de cada bloco na leitura do arquivo.
+    - medir_memoria (bool): Mede o pico de memória da conversão com o tracemalloc; por padrão, MEDIR_MEMORIA.
+
+    Retorna:
+    - tuple: (caminho, relatorio), com o Parquet em cache e o relatório da leitura do arquivo
+      (None quando o arquivo já estava no cache). A memória do relatório é a que o arquivo
+      ocupa depois de carregado.
+    """
+    caminho = diretorio_cache('datasets') / f'{hash_arquivo(arquivo)}.parquet'
+
+    # Arquivo já convertido: apenas marca o uso para o descarte por antiguidade
+    if caminho.exists():
+        registrar_acesso(caminho)
+        return caminho, None
+
+    # Mede o pico de memória da conversão apenas se pedido e se ninguém mais estiver medindo
+    medir = medir_memoria and not tracemalloc.is_tracing()
+    if medir:
+        tracemalloc.start()
+    inicio = time.perf_counter()
+
+    # Escreve em um arquivo temporário e renomeia, para que outra sessão nunca leia um Parquet incompleto
+    temporario = caminho.with_name(f'{caminho.stem}.{os.getpid()}.{threading.get_ident()}.tmp')
+    escritor, colunas, linhas, memoria = None, [], 0, 0
+    try:
+        for bloco in iterar_arquivo(arquivo, tamanho_bloco):
+            if escritor is None:
+                colunas = bloco.columns.tolist()
+                esquema = esquema_arrow(bloco, detectar_esquema(colunas) is not None)
+                escritor = pq.ParquetWriter(temporario, esquema)
+            escritor.write_table(pa.Table.from_pandas(bloco, preserve_index=False).cast(esquema))
+            linhas += len(bloco)
+            memoria += bloco.memory_usage(deep=True).sum()
+
+        # Arquivo sem nenhuma linha: grava um Parquet vazio, como a leitura faria
+        if escritor is None:
+            pd.DataFrame().to_parquet(temporario, index=False)
+        else:
+            escritor.close()
+        pico = tracemalloc.get_traced_memory()[1] if medir else None
+    except BaseException:
+        if escritor is not None:
+            escritor.close()
+        temporario.unlink(missing_ok=True)
+        raise
+    finally:
+        if medir:
+            tracemalloc.stop()
+    os.replace(temporario, caminho)
+
+    relatorio = {
+        'esquema': detectar_esquema(colunas),
+        'linhas': linhas,
+        'memoria_mb': memoria / 1024 ** 2,
+        'pico_mb': pico / 1024 ** 2 if pico is not None else None,
+        'tempo_s': time.perf_counter() - inicio,
+    }
+
+    # Mantém o cache de datasets dentro do limite de tamanho
+    liberar_espaco('datasets', '*.parquet')
+    return caminho, relatorio
+
+def ler_parquet(caminho, colunas=None):
+    """
+    Lê o Parquet em cache com mapeamento em memória, apenas com as colunas pedidas.
+
+    Parâmetros:
+    - caminho (Path): Parquet retornado por armazenar_upload.
+    - colunas (list, opcional): Colunas a ler; todas, se não informado.
+    """
+    df = pd.read_parquet(caminho, columns=list(colunas) if colunas else None, memory_map=True)
+
+    # Sem esquema conhecido os números são gravados em 64 bits (ver esquema_arrow)
+    if detectar_esquema(colunas_parquet(caminho)) is None:
+        df = reduzir_tipos(df)
+    return df
+
+def colunas_parquet(caminho):
+    """
+    Lista as colunas do Parquet em cache lendo apenas o esquema do arquivo.
+
+    Parâmetros:
+    - caminho (Path): Parquet retornado por armazenar_upload.
+    """
+    return [c for c in pq.read_schema(caminho).names if not c.startswith('__index_level_')]
+
+def carregar_upload(arquivo, colunas=None):
+    """
+    Carrega o arquivo enviado a partir do cache Parquet, convertendo-o na primeira vez.
+
+    Parâmetros:
+    - arquivo (str, Path ou arquivo): CSV ou Parquet, por caminho ou aberto.
+    - colunas (list, opcional): Colunas a ler; todas, se não informado.
+
+    Retorna:
+    - tuple: (df, relatorio), no mesmo formato de ler_csv, com 'origem' indicando se o
+      arquivo foi convertido agora ('arquivo') ou lido do cache ('cache').
+    """
+    inicio = time.perf_counter()
+    caminho, relatorio_conversao = armazenar_upload(arquivo)
+    df = ler_parquet(caminho, colunas)
+
+    relatorio = {
+        'esquema': detectar_esquema(df.columns) if colunas is None else None,
+        'linhas': len(df),
+        'memoria_mb': df.memory_usage(deep=True).sum() / 1024 ** 2,
+        'pico_mb': relatorio_conversao['pico_mb'] if relatorio_conversao else None,
+        'tempo_s': time.perf_counter() - inicio,
+        'origem': 'arquivo' if relatorio_conversao else 'cache',
+    }
+    return df, relatorio
+
+def descrever_relatorio(relatorio):
+    """
+    Resume o relatório de leitura em uma linha de texto para exibir na página.
+
+    Parâmetros:
+    - relatorio (dict): Relatório retornado por ler_csv ou carregar_upload.
+    """
+    texto = f"{relatorio['linhas']:,} linhas · {relatorio['memoria_mb']:.1f} MB em memória"
+    if relatorio.get('origem') == 'cache':
+        texto += " · lido do cache Parquet"
+    if relatorio.get('pico_mb') is not None:
+        texto += f" · pico de {relatorio['pico_mb']:.1f} MB na leitura"
+    return texto + f" · {relatorio['tempo_s']:.2f} s"
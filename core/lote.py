@@ -0,0 +1,230 @@
+"""
+Execução em lote da clusterização e da segmentação RFV sobre arquivos divididos em partes.
+
+Os mesmos cálculos do aplicativo são aplicados a arquivos em disco (por exemplo, as exportações
+de cada noite), sem passar pelo upload do Streamlit. Cada parte (fragmento) do arquivo é lida,
+agregada ou rotulada e gravada em um processo separado:
+
+- clusterização: as partes são lidas em paralelo e juntadas, o pré-processador e o algoritmo são
+  ajustados sobre todas as sessões, como na página, e cada processo grava a sua parte com a coluna
+  de rótulos. Com um modelo salvo, cada processo rotula a sua parte sem ajuste nenhum.
+- RFV: cada processo agrega as transações da sua parte por cliente; os agregados são combinados,
+  classificados nas faixas e gravados em um único arquivo.
+"""
+import os
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from core.clusterizacao import ajustar_kmeans
+from core.exportacao import escrever_csv, escrever_parquet
+from core.hierarquico import rotulos_hierarquicos
+from core.ingestao import concatenar_blocos, iterar_arquivo
+from core.modelos import atribuir_arquivo, carregar_modelo, salvar_modelo
+from core.preprocessamento import padronizar_sessoes
+from core.rfv import FAIXAS, agregar_transacoes, calcular_quartis, combinar_agregados, gerar_df_rfv, rfv_de_agregado
+from core.rfv_blocos import COLUNAS_TRANSACOES
+
+# Formatos de saída aceitos e a função que grava cada um
+FORMATOS_SAIDA = {
+    'parquet': escrever_parquet,
+    'csv': escrever_csv,
+    'csv.gz': lambda df, caminho: escrever_csv(df, caminho, compactar=True),
+}
+
+# Nome da coluna de rótulos de cada algoritmo, o mesmo usado pela página
+COLUNAS_ROTULO = {'kmeans': 'K-Means', 'hierarquico': 'Hierárquicos'}
+
+# Extensões reconhecidas ao listar as partes de um diretório
+EXTENSOES_ENTRADA = ('.csv', '.csv.gz', '.parquet')
+
+def listar_fragmentos(entradas):
+    """
+    Expande a lista de entradas em arquivos: diretórios viram os CSV e Parquet contidos neles.
+
+    Parâmetros:
+    - entradas (list): Caminhos de arquivos ou de diretórios.
+
+    Retorna:
+    - list: Caminhos (Path) dos arquivos, em ordem.
+    """
+    fragmentos = []
+    for entrada in map(Path, entradas):
+        if entrada.is_dir():
+            fragmentos += sorted(p for p in entrada.iterdir() if p.name.endswith(EXTENSOES_ENTRADA))
+        elif entrada.exists():
+            fragmentos.append(entrada)
+        else:
+            raise FileNotFoundError(f"Arquivo não encontrado: {entrada}")
+    if not fragmentos:
+        raise ValueError("Nenhum arquivo CSV ou Parquet encontrado nas entradas.")
+    return fragmentos
+
+def ler_fragmento(caminho, colunas=None, tamanho_bloco=100_000):
+    """
+    Lê uma parte inteira, com os mesmos tipos do upload do aplicativo.
+    """
+    return concatenar_blocos(list(iterar_arquivo(caminho, tamanho_bloco, colunas)))
+
+def caminho_saida(diretorio, fragmento, sufixo, formato):
+    """
+    Monta o nome do arquivo de saída de uma parte: <nome da parte>_<sufixo>.<formato>.
+    """
+    nome = fragmento.name
+    for extensao in EXTENSOES_ENTRADA:
+        if nome.endswith(extensao):
+            nome = nome[:-len(extensao)]
+            break
+    return Path(diretorio) / f'{nome}_{sufixo}.{formato}'
+
+def gravar(df, caminho, formato):
+    """
+    Grava o DataFrame no formato pedido, passando por um arquivo temporário.
+    """
+    temporario = caminho.with_name(caminho.name + '.tmp')
+    FORMATOS_SAIDA[formato](df, temporario)
+    os.replace(temporario, caminho)
+    return caminho
+
+def _rotular_fragmento(fragmento, labels, coluna, destino, formato):
+    """
+    Relê uma parte, acrescenta os rótulos calculados sobre todas as sessões e grava o resultado.
+    """
+    df = ler_fragmento(fragmento)
+    df[coluna] = labels
+    return gravar(df, destino, formato), len(df)
+
+def _atribuir_fragmento(fragmento, nome_modelo, destino, formato):
+    """
+    Rotula uma parte com o modelo salvo (centróide mais próximo) e grava o resultado.
+    """
+    df = atribuir_arquivo(fragmento, carregar_modelo(nome_modelo))
+    return gravar(df, destino, formato), len(df)
+
+def _agregar_fragmento(fragmento):
+    """
+    Agrega as transações de uma parte por cliente.
+    """
+    return agregar_transacoes(ler_fragmento(fragmento, COLUNAS_TRANSACOES))
+
+def _executar(funcao, tarefas, processos, ao_concluir):
+    """
+    Executa funcao(*argumentos) para cada tarefa em um pool de processos, na ordem das tarefas.
+    """
+    with ProcessPoolExecutor(max_workers=processos) as executor:
+        futuros = [executor.submit(funcao, *argumentos) for argumentos in tarefas]
+        resultados = []
+        for i, futuro in enumerate(futuros):
+            resultados.append(futuro.result())
+            if ao_concluir is not None:
+                ao_concluir(i, resultados[-1])
+    return resultados
+
+def clusterizar_arquivos(entradas, diretorio_saida, algoritmo='kmeans', n_clusters=4, motor='completo',
+                         batch_size=1024, linkage='ward', pre_agrupamento='birch', n_micro=500,
+                         conectividade=False, modelo=None, salvar_como=None, formato='parquet',
+                         processos=None, ao_progredir=None):
+    """
+    Rotula as sessões das partes com o K-means ou o agrupamento hierárquico, como a página de clusterização.
+
+    Parâmetros:
+    - entradas (list): Arquivos ou diretórios com as partes das sessões.
+    - diretorio_saida (str ou Path): Onde gravar uma saída rotulada por parte.
+    - algoritmo (str): 'kmeans' ou 'hierarquico'.
+    - n_clusters (int): Quantidade de clusters.
+    - motor, batch_size: Motor do K-means, como em ajustar_kmeans.
+    - linkage, pre_agrupamento, n_micro, conectividade: Parâmetros do hierárquico, como em rotulos_hierarquicos.
+    - modelo (str, opcional): Nome de um modelo salvo; as partes são rotuladas por ele, sem ajuste.
+    - salvar_como (str, opcional): Salva o K-means ajustado com este nome, para rotular lotes futuros.
+    - formato (str): 'parquet', 'csv' ou 'csv.gz'.
+    - processos (int, opcional): Quantidade de processos; por padrão, um por núcleo.
+    - ao_progredir (callable, opcional): Recebe uma mensagem a cada etapa concluída.
+
+    Retorna:
+    - list: Caminhos dos arquivos gravados.
+    """
+    informar = ao_progredir or (lambda mensagem: None)
+    fragmentos = listar_fragmentos(entradas)
+    Path(diretorio_saida).mkdir(parents=True, exist_ok=True)
+    coluna = COLUNAS_ROTULO['kmeans' if modelo else algoritmo]
+    destinos = [caminho_saida(diretorio_saida, f, 'rotulado', formato) for f in fragmentos]
+
+    def ao_gravar(i, resultado):
+        informar(f"parte {i + 1}/{len(fragmentos)} gravada: {resultado[0]} ({resultado[1]:,} linhas)")
+
+    # Com um modelo salvo, cada parte é rotulada sozinha, sem juntar as sessões
+    if modelo:
+        tarefas = [(f, modelo, d, formato) for f, d in zip(fragmentos, destinos)]
+        return [r[0] for r in _executar(_atribuir_fragmento, tarefas, processos, ao_gravar)]
+
+    if algoritmo not in COLUNAS_ROTULO:
+        raise ValueError('Algoritmo inválido. Escolha "kmeans" ou "hierarquico".')
+
+    # Lê as partes em paralelo e junta as sessões, pois o ajuste usa todas elas
+    partes = _executar(ler_fragmento, [(f,) for f in fragmentos], processos,
+                       lambda i, df: informar(f"parte {i + 1}/{len(fragmentos)} lida: {fragmentos[i]} ({len(df):,} linhas)"))
+    tamanhos = [len(df) for df in partes]
+    df = concatenar_blocos(partes)
+    del partes
+
+    # Mesmo pré-processamento da página: acessos padronizados, datas e meses codificados
+    X, preprocessador = padronizar_sessoes(df)
+    informar(f"{len(X):,} sessões padronizadas em {X.shape[1]} colunas")
+
+    if algoritmo == 'kmeans':
+        ajuste = ajustar_kmeans(X, n_clusters, motor, batch_size)
+        labels = ajuste['labels']
+        informar(f"K-means ajustado (k = {n_clusters}, motor {motor}, inércia {ajuste['inercia']:,.1f})")
+        if salvar_como:
+            caminho = salvar_modelo(salvar_como, preprocessador, ajuste['centroides'],
+                                    {'k': n_clusters, 'motor': motor, 'linhas': len(X)})
+            informar(f"modelo salvo em {caminho}")
+    else:
+        labels = rotulos_hierarquicos(X, n_clusters, linkage, pre_agrupamento, n_micro, conectividade)
+        informar(f"árvore hierárquica cortada em {n_clusters} clusters (ligação {linkage}, pré-agrupamento {pre_agrupamento})")
+    del df, X
+
+    # Cada processo relê a sua parte e grava as sessões com os rótulos correspondentes
+    limites = np.cumsum([0] + tamanhos)
+    tarefas = [(f, labels[limites[i]:limites[i + 1]], coluna, destinos[i], formato) for i, f in enumerate(fragmentos)]
+    return [r[0] for r in _executar(_rotular_fragmento, tarefas, processos, ao_gravar)]
+
+def rfv_arquivos(entradas, diretorio_saida, data_referencia=None, faixas='Quartis', formato='parquet',
+                 processos=None, ao_progredir=None):
+    """
+    Calcula a tabela RFV final (faixas, pontuação e segmento) das transações das partes, como a página de segmentação.
+
+    Parâmetros:
+    - entradas (list): Arquivos ou diretórios com as partes das transações.
+    - diretorio_saida (str ou Path): Onde gravar a tabela RFV final.
+    - data_referencia (date, opcional): Data a partir da qual a Recência é contada; hoje, se não informada.
+    - faixas (str): 'Quartis', 'Quintis' ou 'Decis'.
+    - formato (str): 'parquet', 'csv' ou 'csv.gz'.
+    - processos (int, opcional): Quantidade de processos; por padrão, um por núcleo.
+    - ao_progredir (callable, opcional): Recebe uma mensagem a cada etapa concluída.
+
+    Retorna:
+    - Path: Caminho do arquivo gravado.
+    """
+    informar = ao_progredir or (lambda mensagem: None)
+    fragmentos = listar_fragmentos(entradas)
+    Path(diretorio_saida).mkdir(parents=True, exist_ok=True)
+
+    # Agrega cada parte em um processo; um cliente pode aparecer em várias partes
+    agregados = _executar(_agregar_fragmento, [(f,) for f in fragmentos], processos,
+                          lambda i, ag: informar(f"parte {i + 1}/{len(fragmentos)} agregada: {fragmentos[i]} ({len(ag):,} clientes)"))
+    agregado = agregados[0] if len(agregados) == 1 else combinar_agregados(*agregados)
+    df_RFV = rfv_de_agregado(agregado, data_referencia)
+    informar(f"{len(df_RFV):,} clientes na tabela RFV")
+
+    # Limites das faixas e classificação, como na página
+    quartis = calcular_quartis(df_RFV, FAIXAS[faixas])
+    df_RFV = gerar_df_rfv(df_RFV, quartis)
+    informar(f"clientes classificados em {faixas.lower()}")
+
+    caminho = gravar(df_RFV, Path(diretorio_saida) / f'rfv_final.{formato}', formato)
+    informar(f"tabela RFV gravada: {caminho}")
+    return caminho
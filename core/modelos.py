@@ -0,0 +1,132 @@
+"""
+Modelos de clusterização salvos em disco e atribuição de clusters a novas sessões.
+
+Um modelo é um único .npz compactado com os centróides do K-means e o estado do
+PreprocessadorSessoes (média, escala e vocabulário de meses). Para rotular o tráfego novo
+basta transformar as sessões e procurar o centróide mais próximo, bloco a bloco, sem
+reajustar nada.
+"""
+import json
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+from core.cache_disco import diretorio_cache
+from core.ingestao import concatenar_blocos, iterar_arquivo
+from core.preprocessamento import PreprocessadorSessoes
+
+def caminho_modelo(nome):
+    """
+    Retorna o caminho do arquivo do modelo, com o nome reduzido a letras, números, '-' e '_'.
+
+    Parâmetros:
+    - nome (str): Nome do modelo.
+    """
+    nome = re.sub(r'[^\w-]', '_', nome.strip()) or 'modelo'
+    return diretorio_cache('modelos') / f'{nome}.npz'
+
+def salvar_modelo(nome, preprocessador, centroides, metadados=None):
+    """
+    Grava o pré-processador ajustado e os centróides em um .npz compactado.
+
+    Parâmetros:
+    - nome (str): Nome do modelo.
+    - preprocessador (PreprocessadorSessoes): Pré-processador ajustado nos dados do modelo.
+    - centroides (numpy.ndarray): Centróides do K-means, um por linha, nas colunas do pré-processador.
+    - metadados (dict, opcional): Informações do ajuste (k, motor, linhas...), gravadas como JSON.
+
+    Retorna:
+    - Path: Caminho do arquivo gravado.
+    """
+    centroides = np.asarray(centroides, dtype=np.float32)
+    if centroides.shape[1] != len(preprocessador.colunas):
+        raise ValueError("Os centróides não têm as mesmas colunas do pré-processador.")
+
+    metadados = {**(metadados or {}), 'colunas': preprocessador.colunas, 'salvo_em': time.strftime('%Y-%m-%d %H:%M:%S')}
+    caminho = caminho_modelo(nome)
+
+    # Grava em um arquivo temporário e renomeia, para nunca deixar um modelo pela metade
+    temporario = caminho.with_name(f'{caminho.stem}.{os.getpid()}.{threading.get_ident()}.tmp.npz')
+    np.savez_compressed(temporario, centroides=centroides, metadados=np.array(json.dumps(metadados)),
+                        **preprocessador.estado())
+    os.replace(temporario, caminho)
+    return caminho
+
+def carregar_modelo(nome):
+    """
+    Lê um modelo gravado com salvar_modelo.
+
+    Parâmetros:
+    - nome (str): Nome do modelo.
+
+    Retorna:
+    - dict: 'preprocessador', 'centroides' e 'metadados' do modelo.
+    """
+    with np.load(caminho_modelo(nome)) as arquivo:
+        return {
+            'preprocessador': PreprocessadorSessoes.de_estado(arquivo),
+            'centroides': arquivo['centroides'],
+            'metadados': json.loads(str(arquivo['metadados'])),
+        }
+
+def listar_modelos():
+    """
+    Lista os nomes dos modelos salvos, do mais recente para o mais antigo.
+    """
+    arquivos = [p for p in diretorio_cache('modelos').glob('*.npz') if not p.name.endswith('.tmp.npz')]
+    return [p.stem for p in sorted(arquivos, key=lambda p: p.stat().st_mtime, reverse=True)]
+
+def centroide_mais_proximo(X, centroides, tamanho_bloco=100_000):
+    """
+    Retorna o índice do centróide mais próximo de cada linha, calculado em blocos.
+
+    Usa ||x - c||² = ||x||² - 2·x·c + ||c||²; como ||x||² não muda a escolha do centróide,
+    basta o produto matricial de cada bloco com os centróides.
+
+    Parâmetros:
+    - X (numpy.ndarray): Matriz transformada pelo pré-processador.
+    - centroides (numpy.ndarray): Centróides do modelo.
+    - tamanho_bloco (int): Quantidade de linhas por bloco.
+
+    Retorna:
+    - numpy.ndarray: Rótulo (int32) de cada linha.
+    """
+    centroides = np.asarray(centroides, dtype=X.dtype)
+    normas = (centroides ** 2).sum(axis=1)
+    rotulos = np.empty(len(X), dtype=np.int32)
+    for inicio in range(0, len(X), tamanho_bloco):
+        bloco = X[inicio:inicio + tamanho_bloco]
+        rotulos[inicio:inicio + tamanho_bloco] = np.argmin(normas[None, :] - 2 * bloco @ centroides.T, axis=1)
+    return rotulos
+
+def atribuir_em_blocos(arquivo, modelo, tamanho_bloco=100_000, coluna='K-Means'):
+    """
+    Lê as sessões novas em blocos e rotula cada bloco com o cluster do modelo.
+
+    Parâmetros:
+    - arquivo (str, Path ou arquivo): CSV ou Parquet de sessões.
+    - modelo (dict): Modelo retornado por carregar_modelo.
+    - tamanho_bloco (int): Quantidade de linhas lidas por vez.
+    - coluna (str): Nome da coluna com o rótulo.
+
+    Retorna:
+    - generator: Blocos (pandas.DataFrame) com a coluna de rótulo acrescentada.
+    """
+    for bloco in iterar_arquivo(arquivo, tamanho_bloco):
+        X = modelo['preprocessador'].transformar(bloco)
+        bloco[coluna] = centroide_mais_proximo(X, modelo['centroides'], tamanho_bloco)
+        yield bloco
+
+def atribuir_arquivo(arquivo, modelo, tamanho_bloco=100_000, coluna='K-Means'):
+    """
+    Rotula todas as sessões do arquivo com o cluster do modelo.
+
+    Parâmetros: os mesmos de atribuir_em_blocos.
+
+    Retorna:
+    - pandas.DataFrame: As sessões com a coluna de rótulo.
+    """
+    return concatenar_blocos(list(atribuir_em_blocos(arquivo, modelo, tamanho_bloco, coluna)))
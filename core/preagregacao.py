@@ -0,0 +1,125 @@
+"""
+Tabelas pré-agregadas das sessões para os gráficos da página de análise.
+
+Uma passada pelo arquivo, em blocos, conta as sessões por (valor, Revenue) de cada coluna e
+soma os acessos por tipo de página. Os gráficos são desenhados a partir dessas tabelas
+pequenas, sem percorrer as sessões de novo a cada troca de coluna.
+
+Colunas categóricas e inteiras (como as quantidades de páginas acessadas) são contadas valor
+a valor. As de ponto flutuante com muitos valores distintos (durações, taxas) teriam quase uma
+linha por sessão, então são contadas em N_FAIXAS faixas de mesma largura; o mínimo e o máximo
+que definem as faixas vêm de uma passada anterior, apenas por essas colunas.
+"""
+from contextlib import closing
+
+import numpy as np
+import pandas as pd
+
+from core.ingestao import iterar_arquivo
+
+# Colunas de acesso por tipo de página, somadas na pré-agregação
+COLUNAS_PAGINA = ['Administrative', 'Informational', 'ProductRelated',
+                  'Administrative_Duration', 'Informational_Duration', 'ProductRelated_Duration']
+
+# Colunas de ponto flutuante com mais valores distintos do que isto são contadas em faixas
+MAX_VALORES_EXATOS = 50
+
+# Quantidade de faixas das colunas contínuas
+N_FAIXAS = 50
+
+def colunas_continuas(bloco, coluna_alvo):
+    """
+    Lista as colunas de ponto flutuante do bloco (sem a coluna_alvo), candidatas a faixas. As
+    inteiras são contagens e continuam contadas valor a valor.
+    """
+    return [c for c in bloco.columns if c != coluna_alvo and pd.api.types.is_float_dtype(bloco[c])]
+
+def bordas_das_faixas(arquivo, colunas, tamanho_bloco=500_000):
+    """
+    Percorre as colunas de ponto flutuante e define as faixas das que têm valores distintos demais.
+
+    Parâmetros:
+    - arquivo (str, Path ou arquivo): CSV ou Parquet de sessões.
+    - colunas (list): Colunas de ponto flutuante a examinar.
+    - tamanho_bloco (int): Quantidade de linhas lidas por vez.
+
+    Retorna:
+    - dict: Para cada coluna contínua, as N_FAIXAS + 1 bordas entre o mínimo e o máximo.
+    """
+    minimos, maximos = {}, {}
+    distintos = {coluna: set() for coluna in colunas}
+
+    for bloco in iterar_arquivo(arquivo, tamanho_bloco, colunas):
+        for coluna in colunas:
+            valores = bloco[coluna].to_numpy(dtype='float64')
+            valores = valores[~np.isnan(valores)]
+            if not len(valores):
+                continue
+            minimos[coluna] = min(minimos.get(coluna, np.inf), valores.min())
+            maximos[coluna] = max(maximos.get(coluna, -np.inf), valores.max())
+
+            # Deixa de guardar os valores distintos assim que a coluna passa do limite
+            if distintos[coluna] is not None:
+                distintos[coluna].update(np.unique(valores).tolist())
+                if len(distintos[coluna]) > MAX_VALORES_EXATOS:
+                    distintos[coluna] = None
+
+    return {coluna: np.linspace(minimos[coluna], maximos[coluna], N_FAIXAS + 1)
+            for coluna in colunas if distintos[coluna] is None}
+
+def centros_das_faixas(serie, bordas):
+    """
+    Troca cada valor pelo centro da sua faixa. Zeros ficam como zero, pois os gráficos os separam
+    das sessões com acesso.
+    """
+    valores = serie.to_numpy(dtype='float64')
+    indices = np.clip(np.searchsorted(bordas, valores, side='right') - 1, 0, len(bordas) - 2)
+    centros = (bordas[indices] + bordas[indices + 1]) / 2
+    return pd.Series(np.where((valores == 0) | np.isnan(valores), valores, centros), index=serie.index, name=serie.name)
+
+def preagregar_sessoes(arquivo, tamanho_bloco=500_000, coluna_alvo='Revenue'):
+    """
+    Calcula as contagens por (valor ou faixa, Revenue) de cada coluna e os totais de acesso por página.
+
+    Parâmetros:
+    - arquivo (str, Path ou arquivo): CSV ou Parquet de sessões.
+    - tamanho_bloco (int): Quantidade de linhas lidas por vez.
+    - coluna_alvo (str): Coluna que indica a compra.
+
+    Retorna:
+    - dict: 'contagens' (para cada coluna, um DataFrame com a coluna, a coluna_alvo e 'count'; nas
+      colunas contínuas, o valor é o centro da faixa), 'faixas' (bordas das faixas de cada coluna
+      contínua), 'totais_pagina' (soma de cada coluna de acesso) e 'linhas' (total de sessões).
+    """
+    # Primeira passada, apenas pelas colunas de ponto flutuante, para as bordas das colunas contínuas.
+    # O leitor da amostra é fechado logo em seguida, para não deixar o arquivo aberto
+    with closing(iterar_arquivo(arquivo, 1_000)) as leitor:
+        amostra = next(leitor, None)
+    faixas = {}
+    if amostra is not None:
+        faixas = bordas_das_faixas(arquivo, colunas_continuas(amostra, coluna_alvo), tamanho_bloco)
+
+    contagens = {}
+    totais = None
+    linhas = 0
+
+    for bloco in iterar_arquivo(arquivo, tamanho_bloco):
+        linhas += len(bloco)
+
+        # Contagem de sessões por (valor ou faixa, Revenue) de cada coluna, somada bloco a bloco
+        for coluna in bloco.columns.drop(coluna_alvo):
+            chave = centros_das_faixas(bloco[coluna], faixas[coluna]) if coluna in faixas else bloco[coluna]
+            parcial = bloco.groupby([chave, coluna_alvo], observed=True).size()
+            contagens[coluna] = parcial if coluna not in contagens else contagens[coluna].add(parcial, fill_value=0)
+
+        # Totais de acesso de cada tipo de página, somados em float64 para não perder precisão
+        colunas = [c for c in COLUNAS_PAGINA if c in bloco]
+        parcial = pd.Series(bloco[colunas].to_numpy(dtype='float64').sum(axis=0), index=colunas)
+        totais = parcial if totais is None else totais + parcial
+
+    return {
+        'contagens': {coluna: serie.astype('int64').rename('count').reset_index() for coluna, serie in contagens.items()},
+        'faixas': faixas,
+        'totais_pagina': totais,
+        'linhas': linhas,
+    }
@@ -0,0 +1,137 @@
+"""
+Pré-processamento das sessões do "online_shoppers_intention" para a clusterização.
+
+O PreprocessadorSessoes guarda a média e a escala das variáveis de acesso e usa um vocabulário
+fixo de meses, de modo que arquivos diferentes (por exemplo, o tráfego de cada dia) sejam
+transformados nas mesmas colunas, sem reajustar nada. A saída é uma matriz float32 contígua.
+"""
+import numpy as np
+import pandas as pd
+
+from core.ingestao import MESES
+
+# Variáveis de acesso, padronizadas pela média e desvio padrão
+COLUNAS_SESSAO = ['Administrative', 'Informational', 'ProductRelated',
+                  'Administrative_Duration', 'Informational_Duration', 'ProductRelated_Duration']
+
+# Variáveis de data usadas como estão
+COLUNAS_DATA = ['SpecialDay', 'Weekend']
+
+class PreprocessadorSessoes:
+    """
+    Padroniza as variáveis de acesso e codifica o mês em colunas 0/1 com um vocabulário fixo.
+
+    Parâmetros:
+    - meses (list): Vocabulário de meses, na ordem das colunas geradas.
+    """
+
+    def __init__(self, meses=MESES):
+        self.meses = list(meses)
+        self.media = None
+        self.escala = None
+
+    @property
+    def colunas(self):
+        """
+        Nomes das colunas da matriz transformada, na ordem.
+        """
+        return COLUNAS_SESSAO + COLUNAS_DATA + [f'Month_{mes}' for mes in self.meses]
+
+    def ajustar(self, df):
+        """
+        Calcula a média e a escala das variáveis de acesso, como o StandardScaler.
+
+        Parâmetros:
+        - df (pandas.DataFrame): Sessões usadas no ajuste.
+
+        Retorna:
+        - PreprocessadorSessoes: O próprio objeto, já ajustado.
+        """
+        valores = df[COLUNAS_SESSAO].to_numpy(dtype=np.float64)
+        self.media = valores.mean(axis=0)
+        escala = valores.std(axis=0)
+
+        # Variáveis constantes não são divididas por zero
+        self.escala = np.where(escala == 0, 1.0, escala)
+        return self
+
+    def transformar(self, df):
+        """
+        Transforma as sessões na matriz usada pelos algoritmos, sem reajustar.
+
+        Meses fora do vocabulário ficam com todas as colunas de mês iguais a zero.
+
+        Parâmetros:
+        - df (pandas.DataFrame): Sessões com as colunas do esquema 'sessoes'.
+
+        Retorna:
+        - numpy.ndarray: Matriz float32 contígua com uma linha por sessão e as colunas de self.colunas.
+        """
+        if self.media is None:
+            raise ValueError("O pré-processador precisa ser ajustado antes de transformar os dados.")
+
+        n_sessao, n_data = len(COLUNAS_SESSAO), len(COLUNAS_DATA)
+        X = np.zeros((len(df), n_sessao + n_data + len(self.meses)), dtype=np.float32)
+
+        # Variáveis de acesso padronizadas
+        X[:, :n_sessao] = (df[COLUNAS_SESSAO].to_numpy(dtype=np.float64) - self.media) / self.escala
+
+        # Variáveis de data
+        X[:, n_sessao:n_sessao + n_data] = df[COLUNAS_DATA].to_numpy(dtype=np.float32)
+
+        # Um 1 na coluna do mês de cada sessão, pelo código do mês no vocabulário
+        codigos = pd.Categorical(df['Month'], categories=self.meses).codes
+        linhas = np.flatnonzero(codigos >= 0)
+        X[linhas, n_sessao + n_data + codigos[linhas]] = 1
+        return X
+
+    def ajustar_transformar(self, df):
+        """
+        Ajusta o pré-processador nas sessões e retorna a matriz transformada.
+        """
+        return self.ajustar(df).transformar(df)
+
+    def estado(self):
+        """
+        Retorna os parâmetros ajustados como arrays, para serem gravados junto do modelo.
+        """
+        return {'meses': np.array(self.meses), 'media': self.media, 'escala': self.escala}
+
+    @classmethod
+    def de_estado(cls, estado):
+        """
+        Recria o pré-processador a partir dos arrays retornados por estado().
+        """
+        preprocessador = cls([str(mes) for mes in estado['meses']])
+        preprocessador.media = np.asarray(estado['media'], dtype=np.float64)
+        preprocessador.escala = np.asarray(estado['escala'], dtype=np.float64)
+        return preprocessador
+
+    def salvar(self, caminho):
+        """
+        Grava o pré-processador ajustado em um arquivo .npz.
+        """
+        np.savez(caminho, **self.estado())
+
+    @classmethod
+    def carregar(cls, caminho):
+        """
+        Lê um pré-processador gravado com salvar().
+        """
+        with np.load(caminho) as arquivo:
+            return cls.de_estado(arquivo)
+
+def padronizar_sessoes(df, meses=MESES):
+    """
+    Ajusta um pré-processador novo nas sessões e retorna a matriz padronizada.
+
+    Parâmetros:
+    - df (pandas.DataFrame): Sessões com as colunas do esquema 'sessoes'.
+    - meses (list): Vocabulário de meses.
+
+    Retorna:
+    - tuple: (X, preprocessador), com a matriz float32 contígua e o PreprocessadorSessoes ajustado.
+    """
+    # Variáveis de acesso padronizadas, SpecialDay, Weekend e uma coluna 0/1 para cada um dos 12 meses
+    preprocessador = PreprocessadorSessoes(meses)
+    return preprocessador.ajustar_transformar(df), preprocessador
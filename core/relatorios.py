@@ -0,0 +1,87 @@
+"""
+Relatórios do ydata-profiling guardados em disco, para que cada relatório seja gerado uma única vez.
+
+O relatório é identificado pelo hash do conteúdo do arquivo, pelas colunas usadas e pela
+configuração (modo e amostra). O ydata-profiling só é importado quando um relatório
+precisa de fato ser gerado.
+"""
+import json
+import os
+import threading
+
+from core.cache_disco import diretorio_cache, hash_conteudo, liberar_espaco, registrar_acesso
+
+# Modos de relatório: o mínimo desliga correlações, interações e demais cálculos caros
+MODOS_RELATORIO = {
+    'Completo': {'minimal': False},
+    'Mínimo': {'minimal': True},
+}
+
+# A partir deste número de linhas o modo mínimo é sugerido e o relatório usa uma amostra
+LINHAS_AMOSTRA = 50_000
+
+def chave_relatorio(chave_dados, colunas, modo, linhas_amostra):
+    """
+    Calcula a chave do relatório em cache.
+
+    Parâmetros:
+    - chave_dados (str): Hash do conteúdo do arquivo de origem.
+    - colunas (list): Colunas incluídas no relatório.
+    - modo (str): Modo do relatório, uma das chaves de MODOS_RELATORIO.
+    - linhas_amostra (int ou None): Tamanho da amostra, ou None para usar todas as linhas.
+    """
+    configuracao = {
+        'dados': chave_dados,
+        'colunas': [str(c) for c in colunas],
+        'modo': modo,
+        'amostra': linhas_amostra,
+    }
+    return hash_conteudo(json.dumps(configuracao, sort_keys=True).encode())
+
+def gerar_relatorio_html(df, chave_dados, modo='Completo', linhas_amostra=None, titulo='Relatório', ao_progredir=None):
+    """
+    Retorna o HTML do relatório do ydata-profiling, lendo do cache em disco quando já foi gerado.
+
+    Parâmetros:
+    - df (pandas.DataFrame): Dados do relatório.
+    - chave_dados (str): Hash do conteúdo do arquivo de origem (por exemplo, de hash_arquivo).
+    - modo (str): 'Completo' ou 'Mínimo'.
+    - linhas_amostra (int, opcional): Gera o relatório sobre uma amostra com esse número de linhas.
+    - titulo (str): Título exibido no relatório.
+    - ao_progredir (callable, opcional): Chamada com a fração concluída (de 0 a 1) após a amostra,
+      as estatísticas e o HTML; pode interromper a geração levantando uma exceção.
+
+    Retorna:
+    - tuple: (html, origem), com origem 'cache' ou 'gerado'.
+    """
+    if linhas_amostra is not None and len(df) <= linhas_amostra:
+        linhas_amostra = None
+
+    caminho = diretorio_cache('relatorios') / f'{chave_relatorio(chave_dados, df.columns, modo, linhas_amostra)}.html'
+    if caminho.exists():
+        registrar_acesso(caminho)
+        return caminho.read_text(encoding='utf-8'), 'cache'
+
+    informar = ao_progredir or (lambda fracao: None)
+
+    # Importa o ydata-profiling apenas quando o relatório ainda não existe
+    from ydata_profiling import ProfileReport
+
+    if linhas_amostra is not None:
+        df = df.sample(linhas_amostra, random_state=123)
+    informar(0.1)
+
+    # As estatísticas são a parte cara; o HTML é montado a partir delas
+    perfil = ProfileReport(df, title=titulo, progress_bar=False, **MODOS_RELATORIO[modo])
+    perfil.get_description()
+    informar(0.8)
+    html = perfil.to_html()
+    informar(1.0)
+
+    # Escreve em um arquivo temporário e renomeia, para que outra sessão nunca leia um relatório incompleto
+    temporario = caminho.with_name(f'{caminho.stem}.{os.getpid()}.{threading.get_ident()}.tmp')
+    temporario.write_text(html, encoding='utf-8')
+    os.replace(temporario, caminho)
+
+    liberar_espaco('relatorios', '*.html')
+    return html, 'gerado'
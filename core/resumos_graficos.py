@@ -0,0 +1,136 @@
+"""
+Boxplots e histogramas desenhados a partir de resumos, e não das colunas completas.
+
+O boxplot usa apenas os quartis, os limites dos bigodes e uma amostra dos pontos fora deles;
+o histograma usa contagens em faixas fixas e uma curva de densidade (KDE) estimada em uma
+amostra de tamanho limitado. O custo de desenhar deixa de crescer com o tamanho do arquivo,
+e a figura pode ser guardada em cache como PNG.
+"""
+import io
+
+import numpy as np
+import pandas as pd
+
+from core.importacao import tardio
+
+# Figure do matplotlib usada diretamente, sem o estado global do pyplot (seguro entre sessões)
+figure = tardio('matplotlib.figure')
+stats = tardio('scipy.stats')
+
+def valores_numericos(serie):
+    """
+    Converte a coluna em valores float64 finitos; datas viram dias desde 1970 (a escala de datas do matplotlib).
+
+    Retorna:
+    - tuple: (valores, e_data).
+    """
+    e_data = pd.api.types.is_datetime64_any_dtype(serie)
+    if e_data:
+        valores = serie.dropna().to_numpy(dtype='datetime64[ns]').astype(np.int64) / 86_400e9
+    else:
+        valores = serie.to_numpy(dtype=np.float64, na_value=np.nan)
+    return valores[np.isfinite(valores)], e_data
+
+def resumo_boxplot(serie, max_outliers=200, semente=123):
+    """
+    Calcula o resumo de um boxplot no formato aceito por Axes.bxp.
+
+    Parâmetros:
+    - serie (pandas.Series): Valores da coluna.
+    - max_outliers (int): Quantidade máxima de pontos fora dos bigodes desenhados (amostrados).
+    - semente (int): Semente da amostragem dos pontos.
+
+    Retorna:
+    - dict: 'label', 'q1', 'med', 'q3', 'whislo', 'whishi' e 'fliers', com o total de pontos
+      fora dos bigodes em 'n_fliers'.
+    """
+    valores, _ = valores_numericos(serie)
+    q1, mediana, q3 = np.percentile(valores, [25, 50, 75])
+    iqr = q3 - q1
+
+    # Bigodes: os valores mais extremos dentro de 1.5 IQR dos quartis, como no seaborn
+    dentro = valores[(valores >= q1 - 1.5 * iqr) & (valores <= q3 + 1.5 * iqr)]
+    fora = valores[(valores < q1 - 1.5 * iqr) | (valores > q3 + 1.5 * iqr)]
+    if len(fora) > max_outliers:
+        fora = np.random.default_rng(semente).choice(fora, max_outliers, replace=False)
+
+    return {
+        'label': serie.name,
+        'q1': q1, 'med': mediana, 'q3': q3,
+        'whislo': dentro.min(), 'whishi': dentro.max(),
+        'fliers': fora,
+        'n_fliers': int(((valores < q1 - 1.5 * iqr) | (valores > q3 + 1.5 * iqr)).sum()),
+    }
+
+def resumo_histograma(serie, n_faixas=50, tamanho_amostra_kde=5000, semente=123):
+    """
+    Calcula as contagens em faixas fixas e a curva de densidade, na escala das contagens.
+
+    Parâmetros:
+    - serie (pandas.Series): Valores da coluna.
+    - n_faixas (int): Quantidade de faixas do histograma.
+    - tamanho_amostra_kde (int): Quantidade máxima de valores usados na estimativa da densidade.
+    - semente (int): Semente da amostragem.
+
+    Retorna:
+    - dict: 'coluna', 'contagens', 'bordas', 'kde_x', 'kde_y' e 'datas' (True para colunas de data).
+    """
+    valores, e_data = valores_numericos(serie)
+    contagens, bordas = np.histogram(valores, bins=n_faixas)
+
+    # Densidade estimada em uma amostra e convertida para a escala das contagens
+    amostra = valores
+    if len(valores) > tamanho_amostra_kde:
+        amostra = np.random.default_rng(semente).choice(valores, tamanho_amostra_kde, replace=False)
+
+    # Sem variação na amostra não há densidade a estimar
+    kde_x = kde_y = None
+    if len(amostra) > 1 and amostra.std() > 0:
+        kde_x = np.linspace(bordas[0], bordas[-1], 200)
+        kde_y = stats.gaussian_kde(amostra)(kde_x) * len(valores) * (bordas[1] - bordas[0])
+
+    return {'coluna': serie.name, 'contagens': contagens, 'bordas': bordas,
+            'kde_x': kde_x, 'kde_y': kde_y, 'datas': e_data}
+
+def desenhar_boxplots(ax, resumos, limite_y=None):
+    """
+    Desenha os boxplots a partir dos resumos de resumo_boxplot.
+    """
+    caixas = ax.bxp(resumos, patch_artist=True, showfliers=True,
+                    flierprops={'marker': 'd', 'markersize': 4, 'markerfacecolor': '0.3', 'markeredgecolor': '0.3'},
+                    medianprops={'color': '0.2'})
+    for i, caixa in enumerate(caixas['boxes']):
+        caixa.set_facecolor(f'C{i}')
+    if limite_y is not None:
+        ax.set_ylim(*limite_y)
+
+def desenhar_histograma(ax, resumo):
+    """
+    Desenha o histograma e a curva de densidade a partir do resumo de resumo_histograma.
+    """
+    bordas = resumo['bordas']
+    ax.bar(bordas[:-1], resumo['contagens'], width=np.diff(bordas), align='edge', alpha=0.6, edgecolor='white')
+    if resumo['kde_x'] is not None:
+        ax.plot(resumo['kde_x'], resumo['kde_y'], color='C0')
+    if resumo['datas']:
+        ax.xaxis_date()
+        # Inclina apenas os rótulos deste eixo; autofmt_xdate esconderia os das outras linhas
+        ax.tick_params(axis='x', labelrotation=30)
+    ax.set_xlabel(resumo['coluna'])
+    ax.set_ylabel('Count')
+    ax.set_title(f"Distribuição de {resumo['coluna']}")
+
+def nova_figura(linhas=1, colunas=1, tamanho=(6.4, 4.8)):
+    """
+    Cria uma figura do matplotlib fora do pyplot e os seus eixos.
+    """
+    fig = figure.Figure(figsize=tamanho)
+    return fig, fig.subplots(linhas, colunas, squeeze=False)
+
+def figura_png(fig, dpi=100):
+    """
+    Converte a figura em PNG (bytes), pronta para ser guardada em cache e exibida com st.image.
+    """
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', dpi=dpi, bbox_inches='tight')
+    return buffer.getvalue()
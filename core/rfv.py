@@ -0,0 +1,220 @@
+"""
+Cálculo da tabela RFV (Recência, Frequência e Valor) por cliente a partir das transações.
+"""
+from datetime import datetime
+from itertools import product
+from string import ascii_uppercase
+
+import numpy as np
+import pandas as pd
+
+from core.esboco_quantis import EsbocoKLL
+
+# Ordem das colunas da tabela RFV usada em todo o aplicativo
+COLUNAS_RFV = ['ID_cliente', 'DiaUltimaCompra', 'Recencia', 'Frequencia', 'Valor']
+
+# Colunas classificadas em faixas
+COLUNAS_FAIXAS = ['Recencia', 'Frequencia', 'Valor']
+
+# Quantidade de faixas de classificação oferecidas e os respectivos cortes
+FAIXAS = {'Quartis': 4, 'Quintis': 5, 'Decis': 10}
+
+def data_referencia_padrao():
+    """
+    Retorna a data de hoje, usada como referência da Recência quando nenhuma é informada.
+    """
+    return pd.Timestamp(datetime.now().date())
+
+def dias_desde(datas, data_referencia=None):
+    """
+    Calcula, de forma vetorizada, quantos dias se passaram de cada data até a data de referência.
+
+    Parâmetros:
+    - datas (pandas.Series): Datas das últimas compras.
+    - data_referencia (date, opcional): Data a partir da qual a Recência é contada; hoje, se não informada.
+    """
+    referencia = pd.Timestamp(data_referencia) if data_referencia is not None else data_referencia_padrao()
+    return (referencia - datas).dt.days
+
+def agregar_transacoes(df):
+    """
+    Agrega as transações por cliente em uma única passada do groupby.
+
+    Parâmetros:
+    - df (pandas.DataFrame): Transações com 'ID_cliente', 'CodigoCompra', 'DiaCompra' e 'ValorTotal'.
+
+    Retorna:
+    - pandas.DataFrame: 'ID_cliente', 'DiaUltimaCompra', 'Frequencia' e 'Valor' de cada cliente.
+    """
+    # Converte as datas sem alterar o DataFrame recebido (que pode estar no cache do Streamlit)
+    if not pd.api.types.is_datetime64_any_dtype(df['DiaCompra']):
+        df = df.assign(DiaCompra=pd.to_datetime(df['DiaCompra']))
+
+    return df.groupby('ID_cliente', as_index=False).agg(
+        DiaUltimaCompra=('DiaCompra', 'max'),
+        Frequencia=('CodigoCompra', 'count'),
+        Valor=('ValorTotal', 'sum'),
+    )
+
+def calcular_rfv(df, data_referencia=None):
+    """
+    Calcula a Recência, a Frequência e o Valor de cada cliente, sem merges entre tabelas parciais.
+
+    Parâmetros:
+    - df (pandas.DataFrame): Transações com 'ID_cliente', 'CodigoCompra', 'DiaCompra' e 'ValorTotal'.
+    - data_referencia (date, opcional): Data a partir da qual a Recência é contada; hoje, se não informada.
+
+    Retorna:
+    - pandas.DataFrame: Tabela RFV com as colunas de COLUNAS_RFV.
+    """
+    return rfv_de_agregado(agregar_transacoes(df), data_referencia)
+
+def calcular_recencia(df, data_referencia=None):
+    """
+    Função para calcular a Recência.
+    """
+    datas = pd.to_datetime(df['DiaCompra'])  # Converter para pd.Timestamp sem alterar o df recebido
+    df_recencia = datas.groupby(df['ID_cliente']).max().reset_index()
+    df_recencia.columns = ['ID_cliente', 'DiaUltimaCompra']
+    df_recencia['Recencia'] = dias_desde(df_recencia['DiaUltimaCompra'], data_referencia)
+    return df_recencia
+
+def calcular_frequencia(df):
+    """
+    Função para calcular a Frequência.
+    """
+    df_frequencia = df[['ID_cliente', 'CodigoCompra']].groupby(
+        'ID_cliente').count().reset_index()
+    df_frequencia.columns = ['ID_cliente', 'Frequencia']
+    return df_frequencia
+
+def calcular_valor(df):
+    """
+    Função para calcular o Valor.
+    """
+    df_valor = df[['ID_cliente', 'ValorTotal']].groupby(
+        'ID_cliente').sum().reset_index()
+    df_valor.columns = ['ID_cliente', 'Valor']
+    return df_valor
+
+def combinar_agregados(*agregados):
+    """
+    Junta agregados parciais de agregar_transacoes (de lotes ou blocos diferentes) por cliente.
+
+    Parâmetros:
+    - agregados (pandas.DataFrame): Agregados com 'ID_cliente', 'DiaUltimaCompra', 'Frequencia' e 'Valor'.
+
+    Retorna:
+    - pandas.DataFrame: Um único agregado, com a última compra, a soma das frequências e a soma dos valores.
+    """
+    return pd.concat(agregados, ignore_index=True).groupby('ID_cliente', as_index=False).agg(
+        DiaUltimaCompra=('DiaUltimaCompra', 'max'),
+        Frequencia=('Frequencia', 'sum'),
+        Valor=('Valor', 'sum'),
+    )
+
+def rfv_de_agregado(agregado, data_referencia=None):
+    """
+    Completa um agregado por cliente com a Recência, no formato da tabela RFV.
+
+    Parâmetros:
+    - agregado (pandas.DataFrame): Resultado de agregar_transacoes ou combinar_agregados.
+    - data_referencia (date, opcional): Data a partir da qual a Recência é contada; hoje, se não informada.
+    """
+    df_RFV = agregado.copy()
+    df_RFV['Recencia'] = dias_desde(df_RFV['DiaUltimaCompra'], data_referencia)
+    return df_RFV[COLUNAS_RFV]
+
+def esbocar_rfv(blocos_rfv, k=200, semente=123):
+    """
+    Constrói um esboço de quantis para cada coluna de Recência, Frequência e Valor, bloco a bloco.
+
+    Parâmetros:
+    - blocos_rfv (iterável de pandas.DataFrame): Partes da tabela RFV (clientes distintos em cada parte).
+    - k (int): Capacidade dos esboços.
+    - semente (int): Semente das compactações.
+
+    Retorna:
+    - dict: Um EsbocoKLL por coluna; esboços de outros blocos ou processos podem ser somados com mesclar.
+    """
+    esbocos = {coluna: EsbocoKLL(k, semente) for coluna in COLUNAS_FAIXAS}
+    for bloco in blocos_rfv:
+        for coluna, esboco in esbocos.items():
+            esboco.atualizar(bloco[coluna].to_numpy())
+    return esbocos
+
+def limites_dos_esbocos(esbocos, n_faixas=4):
+    """
+    Calcula os limites das faixas a partir dos esboços, no mesmo formato de DataFrame.quantile.
+
+    Parâmetros:
+    - esbocos (dict): Esboços por coluna, como retornados por esbocar_rfv.
+    - n_faixas (int): Número de faixas (4 para quartis, 5 para quintis, 10 para decis).
+    """
+    quantis = np.linspace(0, 1, n_faixas + 1)[1:-1]
+    return pd.DataFrame({coluna: esbocos[coluna].quantis(quantis) for coluna in COLUNAS_FAIXAS}, index=quantis)
+
+def calcular_quartis(df_RFV, n_faixas=4):
+    """
+    Função para calcular os quantis que separam as faixas (quartis, quintis, decis...).
+
+    Para a tabela gravada em disco pelo caminho em blocos, veja rfv_blocos.quartis_do_arquivo,
+    que também calcula os limites com esboços de quantis.
+    """
+    quantis = np.linspace(0, 1, n_faixas + 1)[1:-1]
+    return df_RFV[COLUNAS_FAIXAS].quantile(q=quantis)
+
+def classificar(valores, limites, crescente=True):
+    """
+    Função para classificar os valores nas faixas definidas pelos limites, de forma vetorizada.
+
+    Com crescente=True os menores valores recebem 'A' (Recência); com crescente=False os
+    maiores valores recebem 'A' (Frequência e Valor). Um valor igual ao limite fica na faixa
+    de baixo, como nas comparações "x <= quantil".
+    """
+    n_faixas = len(limites) + 1
+
+    # Índice da faixa de cada valor: quantos limites são estritamente menores que ele
+    codigos = np.searchsorted(limites, valores, side='left')
+    if not crescente:
+        codigos = n_faixas - 1 - codigos
+
+    return pd.Categorical.from_codes(codigos, categories=list(ascii_uppercase[:n_faixas]), ordered=True)
+
+def segmentar(r, f, v, n_faixas):
+    """
+    Função para nomear o segmento de cada cliente a partir dos códigos das faixas (0 = 'A').
+    """
+    pior = n_faixas - 1
+    condicoes = [
+        (r == 0) & (f == 0) & (v == 0),
+        (r == pior) & (f == pior) & (v == pior),
+        (r == pior) & ((f == 0) | (v == 0)),
+        (f == 0) & (v == 0),
+        (r == 0) & (f == pior),
+    ]
+    return np.select(condicoes, ['Campeões', 'Perdidos', 'Em risco', 'Leais', 'Novos'], default='Outros')
+
+def gerar_df_rfv(df_RFV, quartis):
+    """
+    Função para gerar o DF RFV final com as classes, a pontuação RFV e o segmento.
+
+    As colunas R_quartil, F_quartil, V_quartil, RFV_Score e Segmento são acrescentadas ao próprio df_RFV.
+    """
+    df_RFV['R_quartil'] = classificar(df_RFV['Recencia'].to_numpy(), quartis['Recencia'].to_numpy())
+    df_RFV['F_quartil'] = classificar(df_RFV['Frequencia'].to_numpy(), quartis['Frequencia'].to_numpy(), crescente=False)
+    df_RFV['V_quartil'] = classificar(df_RFV['Valor'].to_numpy(), quartis['Valor'].to_numpy(), crescente=False)
+
+    # Pontuação combinada ('AAA', 'ABD'...) montada a partir dos códigos das três faixas
+    n_faixas = len(quartis) + 1
+    r, f, v = (df_RFV[c].cat.codes.to_numpy().astype(np.int32) for c in ('R_quartil', 'F_quartil', 'V_quartil'))
+    letras = ascii_uppercase[:n_faixas]
+    df_RFV['RFV_Score'] = pd.Categorical.from_codes(
+        (r * n_faixas + f) * n_faixas + v,
+        categories=[''.join(c) for c in product(letras, repeat=3)],
+        ordered=True,
+    )
+
+    # Segmento do cliente a partir das faixas
+    df_RFV['Segmento'] = pd.Categorical(segmentar(r, f, v, n_faixas))
+    return df_RFV
@@ -0,0 +1,297 @@
+"""
+Tabela RFV para arquivos de transações maiores que a memória.
+
+As transações são lidas em blocos e agregadas por cliente à medida que chegam. Quando o
+agregado acumulado passa do limite de memória, ele é dividido por hash do cliente em
+partições gravadas em disco; no final, cada partição (com clientes que não aparecem em
+nenhuma outra) é combinada separadamente, arquivo a arquivo, e redividida do mesmo modo se
+também não couber no limite. O uso de memória depende do limite e do número de partições,
+e não do tamanho do arquivo.
+"""
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from core.cache_disco import diretorio_cache, hash_arquivo, hash_conteudo, liberar_espaco, registrar_acesso
+from core.ingestao import iterar_arquivo
+from core.rfv import (COLUNAS_FAIXAS, agregar_transacoes, combinar_agregados, data_referencia_padrao, esbocar_rfv,
+                      gerar_df_rfv, limites_dos_esbocos, rfv_de_agregado)
+
+# Colunas das transações usadas no cálculo da tabela RFV
+COLUNAS_TRANSACOES = ['ID_cliente', 'CodigoCompra', 'DiaCompra', 'ValorTotal']
+
+# Quantas vezes uma partição grande demais pode ser redividida; cada nível usa outros 16 bits do hash
+MAX_NIVEIS = 4
+
+def tamanho_mb(df):
+    """
+    Retorna o tamanho em memória do DataFrame, em MB.
+    """
+    return df.memory_usage(index=True).sum() / 1024 ** 2
+
+def despejar(agregado, diretorio, n_particoes, sequencia, nivel=0):
+    """
+    Grava o agregado em disco, dividido em partições pelo hash do cliente.
+
+    Parâmetros:
+    - agregado (pandas.DataFrame): Agregado por cliente.
+    - diretorio (Path): Diretório temporário das partições.
+    - n_particoes (int): Número de partições.
+    - sequencia (int): Número do despejo, usado no nome dos arquivos.
+    - nivel (int): Nível da divisão; uma partição redividida usa outra parte do hash que a formou.
+    """
+    hashes = pd.util.hash_array(agregado['ID_cliente'].to_numpy())
+    particoes = (hashes >> np.uint64(16 * nivel)) % np.uint64(n_particoes)
+    for particao, parte in agregado.groupby(particoes, sort=False):
+        pasta = diretorio / f'particao_{particao}'
+        pasta.mkdir(exist_ok=True)
+        parte.to_parquet(pasta / f'{sequencia}.parquet', index=False)
+
+def combinar_em_disco(agregados, diretorio, limite_memoria_mb, n_particoes, nivel=0):
+    """
+    Combina agregados parciais por cliente, despejando no disco o que passar do limite de memória.
+
+    Parâmetros:
+    - agregados (iterable): Agregados parciais (pandas.DataFrame) de agregar_transacoes.
+    - diretorio (Path): Diretório temporário onde criar as partições.
+    - limite_memoria_mb (float): Tamanho máximo do agregado em memória antes de ir para o disco.
+    - n_particoes (int): Número de partições de cada divisão.
+    - nivel (int): Profundidade da divisão; a partir de MAX_NIVEIS tudo é combinado na memória.
+
+    Retorna:
+    - generator: Agregados finais (pandas.DataFrame), cada um com clientes distintos.
+    """
+    acumulado = None
+    despejos = 0
+
+    for parcial in agregados:
+        acumulado = parcial if acumulado is None else combinar_agregados(acumulado, parcial)
+
+        # Agregado grande demais: vai para o disco e a memória recomeça do zero
+        if nivel < MAX_NIVEIS and tamanho_mb(acumulado) > limite_memoria_mb:
+            despejar(acumulado, diretorio, n_particoes, despejos, nivel)
+            despejos += 1
+            acumulado = None
+
+    # Tudo coube na memória: não há partições para combinar
+    if despejos == 0:
+        if acumulado is not None:
+            yield acumulado
+        return
+
+    if acumulado is not None:
+        despejar(acumulado, diretorio, n_particoes, despejos, nivel)
+
+    # Cada partição contém todos os registros dos seus clientes; é lida arquivo a arquivo e
+    # redividida no nível seguinte se o seu agregado também passar do limite
+    for pasta in sorted(diretorio.glob('particao_*')):
+        arquivos = sorted(pasta.glob('*.parquet'))
+        yield from combinar_em_disco((pd.read_parquet(caminho) for caminho in arquivos), pasta,
+                                     limite_memoria_mb, n_particoes, nivel + 1)
+        shutil.rmtree(pasta, ignore_errors=True)
+
+def iterar_rfv_em_blocos(arquivo, data_referencia=None, tamanho_bloco=100_000, limite_memoria_mb=256,
+                         n_particoes=16, ao_progredir=None):
+    """
+    Calcula a tabela RFV em partes, lendo o arquivo em blocos e usando o disco quando a memória não basta.
+
+    Parâmetros:
+    - arquivo (str, Path ou arquivo): CSV ou Parquet de transações.
+    - data_referencia (date, opcional): Data a partir da qual a Recência é contada; hoje, se não informada.
+    - tamanho_bloco (int): Quantidade de linhas lidas por vez.
+    - limite_memoria_mb (float): Tamanho máximo do agregado em memória antes de ir para o disco.
+    - n_particoes (int): Número de partições em disco; cada uma é combinada sozinha no final.
+    - ao_progredir (callable, opcional): Chamada com o total de linhas lidas após cada bloco.
+
+    Retorna:
+    - generator: Partes da tabela RFV (pandas.DataFrame), cada uma com clientes distintos.
+    """
+    def agregados():
+        linhas = 0
+        for bloco in iterar_arquivo(arquivo, tamanho_bloco, COLUNAS_TRANSACOES):
+            yield agregar_transacoes(bloco)
+            linhas += len(bloco)
+            if ao_progredir is not None:
+                ao_progredir(linhas)
+
+    with tempfile.TemporaryDirectory(dir=diretorio_cache('rfv_blocos')) as temporario:
+        for agregado in combinar_em_disco(agregados(), Path(temporario), limite_memoria_mb, n_particoes):
+            yield rfv_de_agregado(agregado, data_referencia)
+
+def rfv_vazio(data_referencia=None):
+    """
+    Retorna a tabela RFV de um arquivo sem transações.
+    """
+    return rfv_de_agregado(agregar_transacoes(pd.DataFrame(columns=COLUNAS_TRANSACOES)), data_referencia)
+
+def rfv_em_blocos(arquivo, data_referencia=None, tamanho_bloco=100_000, limite_memoria_mb=256,
+                  n_particoes=16, ao_progredir=None):
+    """
+    Calcula a tabela RFV completa pelo caminho em blocos, igual à de calcular_rfv.
+
+    A tabela final, com uma linha por cliente, é juntada na memória; para gravá-la sem juntar
+    as partes, use gravar_rfv_em_blocos.
+
+    Parâmetros: os mesmos de iterar_rfv_em_blocos.
+
+    Retorna:
+    - pandas.DataFrame: Tabela RFV ordenada por 'ID_cliente'.
+    """
+    partes = list(iterar_rfv_em_blocos(arquivo, data_referencia, tamanho_bloco, limite_memoria_mb,
+                                       n_particoes, ao_progredir))
+    if not partes:
+        return rfv_vazio(data_referencia)
+    return pd.concat(partes, ignore_index=True).sort_values('ID_cliente', ignore_index=True)
+
+def gravar_rfv_em_blocos(arquivo, destino, data_referencia=None, tamanho_bloco=100_000, limite_memoria_mb=256,
+                         n_particoes=16, ao_progredir=None):
+    """
+    Grava a tabela RFV em um Parquet parte a parte, sem nunca ter a tabela inteira na memória.
+
+    Parâmetros:
+    - arquivo (str, Path ou arquivo): CSV ou Parquet de transações.
+    - destino (str ou Path): Parquet de saída. As linhas ficam agrupadas por partição, e não
+      ordenadas por 'ID_cliente'.
+    - demais: Os mesmos de iterar_rfv_em_blocos.
+
+    Retorna:
+    - int: Quantidade de clientes gravados.
+    """
+    partes = iterar_rfv_em_blocos(arquivo, data_referencia, tamanho_bloco, limite_memoria_mb, n_particoes,
+                                  ao_progredir)
+    return gravar_partes(partes, destino, rfv_vazio(data_referencia))
+
+def gravar_partes(partes, destino, vazio):
+    """
+    Grava as partes de uma tabela em um único Parquet, uma por grupo de linhas, de forma atômica.
+
+    Parâmetros:
+    - partes (iterable): Partes (pandas.DataFrame) com as mesmas colunas.
+    - destino (str ou Path): Parquet de saída.
+    - vazio (pandas.DataFrame): Tabela gravada quando não houver parte nenhuma.
+
+    Retorna:
+    - int: Quantidade de linhas gravadas.
+    """
+    destino = Path(destino)
+    temporario = destino.with_name(f'{destino.stem}.{os.getpid()}.{threading.get_ident()}.tmp')
+    escritor = None
+    linhas = 0
+
+    try:
+        for parte in partes:
+            tabela = pa.Table.from_pandas(parte, preserve_index=False)
+            if escritor is None:
+                escritor = pq.ParquetWriter(temporario, tabela.schema)
+            escritor.write_table(tabela.cast(escritor.schema))
+            linhas += len(parte)
+
+        if escritor is None:
+            vazio.to_parquet(temporario, index=False)
+        else:
+            escritor.close()
+    except BaseException:
+        if escritor is not None:
+            escritor.close()
+        temporario.unlink(missing_ok=True)
+        raise
+
+    os.replace(temporario, destino)
+    return linhas
+
+def iterar_parquet(caminho, tamanho_bloco=100_000, colunas=None):
+    """
+    Lê um Parquet gravado por gravar_partes em blocos, com os tipos com que foi gravado.
+    """
+    for lote in pq.ParquetFile(caminho).iter_batches(batch_size=tamanho_bloco, columns=colunas):
+        yield lote.to_pandas()
+
+def inicio_do_arquivo(caminho, n_linhas=1000):
+    """
+    Lê apenas as primeiras linhas de um Parquet, para exibição, e a quantidade total de linhas.
+
+    Retorna:
+    - tuple: (df, total), com as primeiras n_linhas e o total de linhas do arquivo.
+    """
+    arquivo = pq.ParquetFile(caminho)
+    total = arquivo.metadata.num_rows
+    primeiro = next(arquivo.iter_batches(batch_size=n_linhas), None)
+    if primeiro is None:
+        return arquivo.schema_arrow.empty_table().to_pandas(), total
+    return primeiro.to_pandas(), total
+
+def rfv_em_cache(arquivo, data_referencia=None, limite_memoria_mb=256, ao_progredir=None):
+    """
+    Grava a tabela RFV em blocos no cache em disco, ou reaproveita a já gravada para o mesmo arquivo e data.
+
+    Parâmetros:
+    - arquivo (str, Path ou arquivo): CSV ou Parquet de transações.
+    - data_referencia (date, opcional): Data a partir da qual a Recência é contada; hoje, se não informada.
+    - limite_memoria_mb (float): Repassado para iterar_rfv_em_blocos; não muda o resultado.
+    - ao_progredir (callable, opcional): Chamada com o total de linhas lidas após cada bloco.
+
+    Retorna:
+    - Path: Parquet com a tabela RFV.
+    """
+    # A data entra na chave já resolvida: sem ela, "hoje" reaproveitaria a Recência de outro dia
+    data_referencia = pd.Timestamp(data_referencia if data_referencia is not None else data_referencia_padrao()).date()
+    chave = hash_conteudo(f'{hash_arquivo(arquivo)}|{data_referencia}'.encode())
+    caminho = diretorio_cache('rfv_resultados') / f'{chave}.parquet'
+    if caminho.exists():
+        registrar_acesso(caminho)
+        return caminho
+
+    gravar_rfv_em_blocos(arquivo, caminho, data_referencia, limite_memoria_mb=limite_memoria_mb,
+                         ao_progredir=ao_progredir)
+    liberar_espaco('rfv_resultados', '*.parquet')
+    return caminho
+
+def quartis_do_arquivo(caminho, n_faixas=4, metodo='Exato', tamanho_bloco=100_000):
+    """
+    Calcula os limites das faixas da tabela RFV gravada em disco.
+
+    Parâmetros:
+    - caminho (Path): Parquet da tabela RFV, como o de rfv_em_cache.
+    - n_faixas (int): Número de faixas (4 para quartis, 5 para quintis, 10 para decis).
+    - metodo (str): 'Exato' lê as três colunas inteiras; 'Esboço' percorre o arquivo em blocos
+      com esboços de quantis, em memória que não depende da quantidade de clientes.
+    - tamanho_bloco (int): Quantidade de clientes lidos por vez no esboço.
+
+    Retorna:
+    - pandas.DataFrame: Limites de cada coluna, no mesmo formato de calcular_quartis.
+    """
+    if metodo == 'Esboço':
+        return limites_dos_esbocos(esbocar_rfv(iterar_parquet(caminho, tamanho_bloco, COLUNAS_FAIXAS)), n_faixas)
+
+    quantis = np.linspace(0, 1, n_faixas + 1)[1:-1]
+    return pd.read_parquet(caminho, columns=COLUNAS_FAIXAS).quantile(q=quantis)
+
+def classificar_arquivo(caminho, quartis, tamanho_bloco=100_000):
+    """
+    Classifica a tabela RFV gravada em disco nas faixas, bloco a bloco, gravando o DF RFV final ao lado dela.
+
+    Parâmetros:
+    - caminho (Path): Parquet da tabela RFV, como o de rfv_em_cache.
+    - quartis (pandas.DataFrame): Limites das faixas, de quartis_do_arquivo.
+    - tamanho_bloco (int): Quantidade de clientes classificados por vez.
+
+    Retorna:
+    - Path: Parquet com o DF RFV final, reaproveitado se já tiver sido gravado com os mesmos limites.
+    """
+    chave = hash_conteudo(caminho.stem.encode() + pd.util.hash_pandas_object(quartis).to_numpy().tobytes())
+    destino = diretorio_cache('rfv_resultados') / f'final_{chave}.parquet'
+    if destino.exists():
+        registrar_acesso(destino)
+        return destino
+
+    vazio = gerar_df_rfv(pq.read_schema(caminho).empty_table().to_pandas(), quartis)
+    gravar_partes((gerar_df_rfv(bloco, quartis) for bloco in iterar_parquet(caminho, tamanho_bloco)), destino, vazio)
+    liberar_espaco('rfv_resultados', '*.parquet')
+    return destino
@@ -0,0 +1,215 @@
+"""
+RFV incremental: um estado por cliente (última compra, quantidade de compras e valor total)
+guardado em disco e atualizado a cada novo lote de transações, sem reprocessar o histórico.
+
+Cada estado é um diretório com uma base compactada e um arquivo pequeno por lote aplicado,
+com o agregado por cliente apenas daquele lote. Na maioria das aplicações só o lote é lido e
+gravado; a cada MAX_LOTES_PENDENTES lotes, porém, eles são compactados na base, o que
+reescreve o estado inteiro. O custo proporcional ao lote vale, portanto, apenas em média
+(amortizado entre os lotes), e não para cada aplicação. Ler o estado combina a base com os
+lotes ainda pendentes.
+"""
+import json
+import os
+import re
+import shutil
+import threading
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from core.cache_disco import diretorio_cache, hash_arquivo
+from core.ingestao import iterar_arquivo
+from core.rfv import agregar_transacoes, combinar_agregados, rfv_de_agregado
+from core.rfv_blocos import COLUNAS_TRANSACOES
+
+# Colunas do estado, na mesma forma do resultado de agregar_transacoes
+COLUNAS_ESTADO = ['ID_cliente', 'DiaUltimaCompra', 'Frequencia', 'Valor']
+
+# Quantidade de lotes guardados em arquivos separados antes de serem compactados na base
+MAX_LOTES_PENDENTES = 8
+
+def diretorio_estado(nome):
+    """
+    Retorna (e cria, se preciso) o diretório que guarda o estado com esse nome, com o nome
+    reduzido a letras, números, '-' e '_'.
+
+    Parâmetros:
+    - nome (str): Nome do estado, por exemplo o nome da loja ou do conjunto de clientes.
+    """
+    nome = re.sub(r'[^\w-]', '_', nome.strip()) or 'estado'
+    raiz = diretorio_cache('estados_rfv').resolve()
+    diretorio = (raiz / nome).resolve()
+
+    # O nome vem de um campo de texto livre: nada pode ser criado (ou apagado) fora do cache
+    if diretorio.parent != raiz:
+        raise ValueError(f"Nome de estado inválido: {nome!r}")
+    diretorio.mkdir(exist_ok=True)
+
+    # Estados antigos, gravados em um único Parquet, passam a ser a base do diretório
+    antigo = raiz / f'{nome}.parquet'
+    if antigo.exists() and not (diretorio / 'base.parquet').exists():
+        os.replace(antigo, diretorio / 'base.parquet')
+    return diretorio
+
+def gravar_atomico(tabela, caminho):
+    """
+    Grava a tabela Arrow em um arquivo temporário e o renomeia, para nunca deixar um Parquet incompleto.
+    """
+    temporario = caminho.with_name(f'{caminho.stem}.{os.getpid()}.{threading.get_ident()}.tmp')
+    pq.write_table(tabela, temporario)
+    os.replace(temporario, caminho)
+
+def lotes_da_base(diretorio):
+    """
+    Lê apenas dos metadados da base os hashes dos lotes já compactados nela.
+    """
+    caminho = diretorio / 'base.parquet'
+    if not caminho.exists():
+        return set()
+    return set(json.loads((pq.read_schema(caminho).metadata or {}).get(b'lotes', b'[]')))
+
+def lotes_pendentes(diretorio):
+    """
+    Retorna os arquivos dos lotes aplicados e ainda não compactados, pelo hash de cada lote.
+    """
+    return {caminho.stem[len('lote_'):]: caminho for caminho in sorted(diretorio.glob('lote_*.parquet'))}
+
+def estado_vazio():
+    """
+    Retorna um estado sem nenhum cliente, indexado por 'ID_cliente'.
+    """
+    return pd.DataFrame({
+        'DiaUltimaCompra': pd.Series(dtype='datetime64[ns]'),
+        'Frequencia': pd.Series(dtype='int64'),
+        'Valor': pd.Series(dtype='float64'),
+    }, index=pd.Index([], dtype='int64', name='ID_cliente'))
+
+def carregar_estado(nome):
+    """
+    Lê o estado salvo, combinando a base com os lotes pendentes, e a lista de lotes já aplicados nele.
+
+    Parâmetros:
+    - nome (str): Nome do estado.
+
+    Retorna:
+    - tuple: (estado, lotes), com o estado indexado por 'ID_cliente' e o conjunto de hashes dos lotes aplicados.
+    """
+    diretorio = diretorio_estado(nome)
+    lotes = lotes_da_base(diretorio)
+    partes = []
+    if (diretorio / 'base.parquet').exists():
+        partes.append(pd.read_parquet(diretorio / 'base.parquet'))
+
+    # Lotes que já estão na base (compactação interrompida antes de apagá-los) não são somados de novo
+    for chave, caminho in lotes_pendentes(diretorio).items():
+        if chave not in lotes:
+            partes.append(pd.read_parquet(caminho))
+            lotes.add(chave)
+
+    if not partes:
+        return estado_vazio(), lotes
+
+    agregado = partes[0] if len(partes) == 1 else combinar_agregados(*partes)
+    vazio = estado_vazio()
+    estado = agregado.set_index('ID_cliente')[vazio.columns].astype(vazio.dtypes)
+    estado.index = estado.index.astype(vazio.index.dtype)
+    return estado, lotes
+
+def salvar_estado(nome, estado, lotes):
+    """
+    Grava o estado e os lotes aplicados como a nova base, substituindo a anterior de forma atômica,
+    e apaga os arquivos dos lotes que passaram a fazer parte dela.
+
+    Parâmetros:
+    - nome (str): Nome do estado.
+    - estado (pandas.DataFrame): Estado indexado por 'ID_cliente'.
+    - lotes (set): Hashes dos lotes já aplicados.
+    """
+    diretorio = diretorio_estado(nome)
+    tabela = pa.Table.from_pandas(estado.reset_index(), preserve_index=False)
+    metadados = {**(tabela.schema.metadata or {}), b'lotes': json.dumps(sorted(lotes)).encode()}
+    gravar_atomico(tabela.replace_schema_metadata(metadados), diretorio / 'base.parquet')
+
+    for chave, caminho in lotes_pendentes(diretorio).items():
+        if chave in lotes:
+            caminho.unlink(missing_ok=True)
+
+def compactar_estado(nome):
+    """
+    Junta os lotes pendentes na base do estado.
+
+    Parâmetros:
+    - nome (str): Nome do estado.
+    """
+    salvar_estado(nome, *carregar_estado(nome))
+
+def apagar_estado(nome):
+    """
+    Remove o estado salvo, para recomeçar do zero.
+
+    Parâmetros:
+    - nome (str): Nome do estado.
+    """
+    shutil.rmtree(diretorio_estado(nome), ignore_errors=True)
+
+def agregar_arquivo(arquivo, tamanho_bloco=100_000):
+    """
+    Agrega por cliente as transações de um arquivo lido em blocos, sem passar pelo cache de uploads.
+
+    Parâmetros:
+    - arquivo (str, Path ou arquivo): CSV ou Parquet de transações.
+    - tamanho_bloco (int): Quantidade de linhas lidas por vez.
+
+    Retorna:
+    - pandas.DataFrame: 'ID_cliente', 'DiaUltimaCompra', 'Frequencia' e 'Valor' de cada cliente do arquivo.
+    """
+    agregado = None
+    for bloco in iterar_arquivo(arquivo, tamanho_bloco, COLUNAS_TRANSACOES):
+        parcial = agregar_transacoes(bloco)
+        agregado = parcial if agregado is None else combinar_agregados(agregado, parcial)
+
+    # Arquivo sem transações: agregado vazio, para que o lote ainda conste como aplicado
+    if agregado is None:
+        agregado = agregar_transacoes(pd.DataFrame(columns=COLUNAS_TRANSACOES))
+    return agregado
+
+def aplicar_lote(nome, arquivo, tamanho_bloco=100_000):
+    """
+    Aplica um arquivo de transações ao estado salvo, ignorando arquivos que já foram aplicados.
+
+    O agregado do lote é gravado em um arquivo próprio; a base só é reescrita quando os lotes
+    pendentes passam de MAX_LOTES_PENDENTES.
+
+    Parâmetros:
+    - nome (str): Nome do estado.
+    - arquivo (str, Path ou arquivo): CSV ou Parquet com as novas transações.
+    - tamanho_bloco (int): Quantidade de linhas lidas por vez.
+
+    Retorna:
+    - bool: True se o lote foi aplicado, False se ele já constava no estado.
+    """
+    chave = hash_arquivo(arquivo)
+    diretorio = diretorio_estado(nome)
+    pendentes = lotes_pendentes(diretorio)
+    if chave in pendentes or chave in lotes_da_base(diretorio):
+        return False
+
+    agregado = agregar_arquivo(arquivo, tamanho_bloco)
+    gravar_atomico(pa.Table.from_pandas(agregado[COLUNAS_ESTADO], preserve_index=False),
+                   diretorio / f'lote_{chave}.parquet')
+
+    if len(pendentes) + 1 > MAX_LOTES_PENDENTES:
+        compactar_estado(nome)
+    return True
+
+def rfv_do_estado(estado, data_referencia=None):
+    """
+    Gera a tabela RFV a partir do estado, no mesmo formato de calcular_rfv.
+
+    Parâmetros:
+    - estado (pandas.DataFrame): Estado indexado por 'ID_cliente'.
+    - data_referencia (date, opcional): Data a partir da qual a Recência é contada; hoje, se não informada.
+    """
+    return rfv_de_agregado(estado.sort_index().reset_index(), data_referencia)
@@ -0,0 +1,224 @@
+"""
+Execução de cálculos demorados em segundo plano, fora da execução do script do Streamlit.
+
+Cada tarefa é identificada por uma chave montada a partir das suas entradas: pedidos com a
+mesma chave (de reexecuções da página ou de usuários diferentes) compartilham a mesma tarefa.
+As páginas acompanham o progresso e os resultados parciais a cada reexecução, e uma tarefa
+substituída por outra no mesmo grupo (por exemplo, a varredura de uma sessão cujos parâmetros
+mudaram) é cancelada quando ninguém mais espera por ela.
+
+A variável de ambiente CLUSTERIZACAO_TAREFAS define quantas tarefas rodam ao mesmo tempo.
+"""
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Quantidade de tarefas concluídas mantidas para serem reaproveitadas
+MAX_CONCLUIDAS = 32
+
+class TarefaCancelada(Exception):
+    """
+    Exceção usada para interromper uma tarefa cancelada no próximo ponto de verificação.
+    """
+
+class Tarefa:
+    """
+    Uma tarefa em segundo plano, com estado, progresso e resultado parcial.
+
+    A função executada recebe a própria tarefa como primeiro argumento e usa informar() para
+    publicar o progresso; informar() também é o ponto em que o cancelamento é verificado.
+
+    Parâmetros:
+    - chave (tuple): Identificação da tarefa a partir das suas entradas.
+    """
+
+    def __init__(self, chave):
+        self.chave = chave
+        self.estado = 'pendente'
+        self.progresso = 0.0
+        self.parcial = None
+        self.versao = 0
+        self.resultado = None
+        self.erro = None
+        self.grupos = set()
+        self._cancelar = threading.Event()
+        self._concluida = threading.Event()
+
+    def informar(self, progresso=None, parcial=None):
+        """
+        Publica o progresso (de 0 a 1) e, opcionalmente, um resultado parcial.
+
+        Levanta TarefaCancelada se a tarefa foi cancelada, interrompendo a função que a executa.
+        """
+        if self._cancelar.is_set():
+            raise TarefaCancelada(self.chave)
+        if progresso is not None:
+            self.progresso = float(progresso)
+        if parcial is not None:
+            self.parcial = parcial
+        self.versao += 1
+
+    def cancelar(self):
+        """
+        Pede o cancelamento; a tarefa para no próximo informar() ou antes de começar.
+        """
+        self._cancelar.set()
+
+    def cancelada(self):
+        """
+        Retorna True se o cancelamento foi pedido.
+        """
+        return self._cancelar.is_set()
+
+    def pronta(self):
+        """
+        Retorna True se a tarefa terminou, com sucesso, erro ou cancelamento.
+        """
+        return self._concluida.is_set()
+
+    def aguardar(self, ao_progredir=None, intervalo=0.25):
+        """
+        Espera a tarefa terminar, chamando ao_progredir(tarefa) periodicamente.
+
+        Parâmetros:
+        - ao_progredir (callable, opcional): Chamada a cada intervalo e ao final; pode comparar
+          tarefa.versao para redesenhar apenas quando houver novidade.
+        - intervalo (float): Tempo entre as verificações, em segundos.
+
+        Retorna:
+        - O resultado da função executada. Levanta o erro da função ou TarefaCancelada.
+        """
+        while not self._concluida.wait(intervalo):
+            if ao_progredir is not None:
+                ao_progredir(self)
+        if ao_progredir is not None:
+            ao_progredir(self)
+
+        if self.estado == 'erro':
+            raise self.erro
+        if self.estado == 'cancelada':
+            raise TarefaCancelada(self.chave)
+        return self.resultado
+
+class GerenciadorTarefas:
+    """
+    Pool de threads que executa as tarefas, sem repetir tarefas com a mesma chave.
+
+    Parâmetros:
+    - n_workers (int): Quantidade de tarefas executadas ao mesmo tempo.
+    """
+
+    def __init__(self, n_workers=2):
+        self.executor = ThreadPoolExecutor(max_workers=n_workers, thread_name_prefix='tarefa')
+        self.tarefas = OrderedDict()
+        self.grupos = {}
+        self.trava = threading.Lock()
+
+    def submeter(self, chave, funcao, *args, grupo=None, **kwargs):
+        """
+        Agenda funcao(tarefa, *args, **kwargs), ou retorna a tarefa já existente com essa chave.
+
+        Parâmetros:
+        - chave (tuple): Identificação da tarefa a partir das suas entradas.
+        - funcao (callable): Função a executar; recebe a tarefa como primeiro argumento.
+        - grupo (str, opcional): Quem espera pela tarefa, por exemplo a sessão e o gráfico.
+          A tarefa anterior do mesmo grupo, se tiver outra chave, é abandonada por ele e
+          cancelada se nenhum outro grupo a estiver esperando.
+
+        Retorna:
+        - Tarefa: A tarefa nova ou a existente.
+        """
+        with self.trava:
+            if grupo is not None:
+                self._trocar_grupo(grupo, chave)
+
+            tarefa = self.tarefas.get(chave)
+
+            # Tarefa cancelada que ainda não parou: volta a valer, em vez de rodar uma cópia ao lado dela
+            if tarefa is not None and tarefa.cancelada() and not tarefa.pronta():
+                tarefa._cancelar.clear()
+
+            if tarefa is None or tarefa.cancelada() or tarefa.estado == 'erro':
+                tarefa = Tarefa(chave)
+                self.tarefas[chave] = tarefa
+                self.executor.submit(self._executar, tarefa, funcao, args, kwargs)
+            else:
+                self.tarefas.move_to_end(chave)
+
+            if grupo is not None:
+                tarefa.grupos.add(grupo)
+            return tarefa
+
+    def _trocar_grupo(self, grupo, chave):
+        """
+        Faz o grupo passar a esperar pela chave, cancelando a tarefa anterior se ela ficar sem grupos.
+        """
+        anterior = self.grupos.get(grupo)
+        self.grupos[grupo] = chave
+        if anterior is None or anterior == chave or anterior not in self.tarefas:
+            return
+
+        tarefa = self.tarefas[anterior]
+        tarefa.grupos.discard(grupo)
+        if not tarefa.grupos and not tarefa.pronta():
+            tarefa.cancelar()
+
+    def _executar(self, tarefa, funcao, args, kwargs):
+        """
+        Executa a função da tarefa no pool e registra o resultado, o erro ou o cancelamento.
+        """
+        try:
+            while True:
+                try:
+                    if tarefa.cancelada():
+                        raise TarefaCancelada(tarefa.chave)
+                    tarefa.estado = 'executando'
+                    tarefa.resultado = funcao(tarefa, *args, **kwargs)
+                    tarefa.progresso = 1.0
+                    tarefa.estado = 'concluida'
+                    break
+                except TarefaCancelada:
+                    # A decisão é tomada com a trava, para que submeter não reaproveite uma tarefa já encerrada
+                    with self.trava:
+                        if tarefa.cancelada():
+                            tarefa.estado = 'cancelada'
+                            tarefa._concluida.set()
+                            break
+
+                    # Pedida de novo enquanto parava: recomeça do início
+                    tarefa.progresso = 0.0
+        except Exception as erro:
+            tarefa.erro = erro
+            tarefa.estado = 'erro'
+        finally:
+            tarefa._concluida.set()
+            self._descartar_antigas()
+
+    def _descartar_antigas(self):
+        """
+        Remove as tarefas terminadas mais antigas além de MAX_CONCLUIDAS.
+        """
+        with self.trava:
+            terminadas = [chave for chave, tarefa in self.tarefas.items() if tarefa.pronta()]
+            for chave in terminadas[:max(0, len(terminadas) - MAX_CONCLUIDAS)]:
+                del self.tarefas[chave]
+
+_gerenciador = None
+_trava_gerenciador = threading.Lock()
+
+def gerenciador():
+    """
+    Retorna o gerenciador de tarefas do processo, compartilhado por todas as sessões.
+    """
+    global _gerenciador
+    with _trava_gerenciador:
+        if _gerenciador is None:
+            _gerenciador = GerenciadorTarefas(int(os.environ.get('CLUSTERIZACAO_TAREFAS', 2)))
+        return _gerenciador
+
+def submeter(chave, funcao, *args, grupo=None, **kwargs):
+    """
+    Agenda uma tarefa no gerenciador do processo; veja GerenciadorTarefas.submeter.
+    """
+    return gerenciador().submeter(chave, funcao, *args, grupo=grupo, **kwargs)
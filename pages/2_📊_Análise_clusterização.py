@@ -1,27 +1,62 @@
 import streamlit as st
 import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
 import streamlit.components.v1 as components
-import plotly.express as px
 import base64
 
-from ydata_profiling import ProfileReport
+
+from core.cache_disco import hash_arquivo
+from core.importacao import tardio
+from core.ingestao import armazenar_upload, carregar_upload, colunas_parquet, descrever_relatorio
+from core.preagregacao import preagregar_sessoes
+from core.resumos_graficos import desenhar_boxplots, figura_png, nova_figura, resumo_boxplot
+from core.relatorios import LINHAS_AMOSTRA, MODOS_RELATORIO, gerar_relatorio_html
+from core.tarefas import submeter
+
+# Bibliotecas de gráficos importadas apenas quando o gráfico for desenhado
+px = tardio('plotly.express')
 
 @st.cache_data
-def carregar_dados(uploaded_file):
+def carregar_dados(uploaded_file, colunas=None):
     if uploaded_file is not None:
-        return pd.read_csv(uploaded_file)
+        # Converte o arquivo uma única vez para Parquet em cache e lê apenas as colunas pedidas
+        return carregar_upload(uploaded_file, colunas)
+    st.warning("Por favor, faça upload de um arquivo .CSV para continuar.")
+    return None, None
+
+@st.cache_data
+def listar_colunas(uploaded_file):
+    if uploaded_file is not None:
+        # Lê apenas o esquema do Parquet em cache, sem carregar os dados
+        try:
+            return colunas_parquet(armazenar_upload(uploaded_file)[0])
+        except ValueError as erro:
+            # Valores que não cabem no esquema (por exemplo, um mês desconhecido) não são descartados em silêncio
+            st.error(f"Não foi possível ler o arquivo: {erro}")
+            return None
     st.warning("Por favor, faça upload de um arquivo .CSV para continuar.")
     return None
 
-def compras_acessos(df, x_col):
+@st.cache_data(show_spinner="Pré-agregando as sessões...")
+def preagregar_dados(uploaded_file):
+    """
+    Calcula, uma única vez por arquivo, as tabelas pré-agregadas usadas nos gráficos.
+    """
+    # Percorre em blocos o Parquet em cache, sem carregar todas as sessões de uma vez
+    return preagregar_sessoes(armazenar_upload(uploaded_file)[0])
+
+# Colunas de acesso por tipo de página, em quantidade e em duração
+COLUNAS_ACESSO = {
+    'quantidade': ['Administrative', 'Informational', 'ProductRelated'],
+    'duração': ['Administrative_Duration', 'Informational_Duration', 'ProductRelated_Duration'],
+}
+
+def compras_acessos(agregados, x_col):
     """
     Gera um gráfico de barras mostrando a quantidade de sessões por uma determinada coluna (x_col),
     com opção de agrupamento (hue_col), e exibindo o número de compras (y_col).
 
     Parâmetros:
-    - df (pandas.DataFrame): O DataFrame contendo os dados.
+    - agregados (dict): Tabelas pré-agregadas retornadas por preagregar_dados.
     - x_col (str): O nome da coluna a ser usada no eixo x do gráfico.
     """
 
@@ -29,17 +64,23 @@ def compras_acessos(df, x_col):
     y_col = 'Acessos'
     hue_col = 'Revenue'
 
-    # Filtra os dados
-    df_filtered = df[df[x_col] != 0.0]
+    # Contagem de sessões por (x_col, Revenue), já calculada na pré-agregação
+    df_grouped = agregados['contagens'][x_col]
 
-    # Agrupa os dados por x_col e y_col e conta o número de ocorrências
-    df_grouped = df_filtered.groupby([x_col, hue_col]).size().reset_index(name='count')
+    # Colunas contínuas vêm contadas em faixas, cada uma identificada pelo seu centro
+    titulo = f"Quantidade de Sessões por {x_col}"
+    if x_col in agregados['faixas']:
+        bordas = agregados['faixas'][x_col]
+        titulo += f" (faixas de largura {bordas[1] - bordas[0]:,.2f})"
+
+    # Filtra os dados
+    df_grouped = df_grouped[df_grouped[x_col] != 0.0]
 
     # Calcula o número total de acessos para cada valor de x_col
-    total_accesses = df_grouped.groupby(x_col)['count'].sum().reset_index(name='total')
+    total_accesses = df_grouped.groupby(x_col, observed=True)['count'].sum().reset_index(name='total')
 
     # Mescla os dados de compras e acessos totais
-    df_merged = df_grouped[df_grouped[hue_col] == True].merge(total_accesses, on=x_col)
+    df_merged = df_grouped[df_grouped[hue_col] == True].drop(columns=hue_col).merge(total_accesses, on=x_col)
 
     # Renomeia as colunas
     df_merged.rename(columns={'count': f'{y_col} Compras', 'total': f'{y_col} Totais'}, inplace=True)
@@ -49,7 +90,7 @@ def compras_acessos(df, x_col):
 
     # Gera o gráfico de barras
     fig = px.bar(df_melted, x=x_col, y='count', text='count', color='Legenda')
-    fig.update_layout(title=f"Quantidade de Sessões por {x_col}",
+    fig.update_layout(title=titulo,
                       xaxis_title=x_col,
                       yaxis_title="Quantidade de Sessões",
                       showlegend=True)
@@ -57,24 +98,22 @@ def compras_acessos(df, x_col):
     st.plotly_chart(fig)
 
 
-def plot_weekend(df):
+def plot_weekend(agregados):
     """
     Gera um gráfico de barras mostrando a proporção de compras por acessos para dias de semana e fins de semana.
 
     Parâmetros:
-    - df (pandas.DataFrame): O DataFrame contendo os dados.
+    - agregados (dict): Tabelas pré-agregadas retornadas por preagregar_dados.
     """
 
-    # Agrupar os dados por 'Weekend' e contar o número de sessões
-    df_grouped = df.groupby(['Weekend', 'Revenue']).size().reset_index(name='count')
+    # Contagem de sessões por ('Weekend', 'Revenue'), já calculada na pré-agregação
+    df_grouped = agregados['contagens']['Weekend']
 
     # Calcular o número total de acessos para cada categoria de 'Weekend'
     total_accesses = df_grouped.groupby('Weekend')['count'].sum().reset_index(name='total')
 
-    # Mesclar os dados de comprasimportadas e plotar o gráfico
-
     # Mesclar os dados de compras e acessos totais
-    df_merged = df_grouped[df_grouped['Revenue'] == True].merge(total_accesses, on='Weekend')
+    df_merged = df_grouped[df_grouped['Revenue'] == True].drop(columns='Revenue').merge(total_accesses, on='Weekend')
 
     # Renomear as colunas
     df_merged.rename(columns={'count': 'Acessos Compras', 'total': 'Acessos Totais'}, inplace=True)
@@ -92,28 +131,27 @@ def plot_weekend(df):
     st.plotly_chart(fig)
 
 
-def plot_access(df, access_type='quantidade'):
+def plot_access(agregados, access_type='quantidade'):
     """
     Plota um gráfico de barras mostrando a quantidade de acessos ou a duração dos acessos por tipo de página.
 
     Args:
-        df (DataFrame): O DataFrame contendo os dados.
+        agregados (dict): Tabelas pré-agregadas retornadas por preagregar_dados.
         access_type (str, optional): O tipo de acesso a ser plotado. Pode ser 'quantidade' (padrão) para a quantidade de
             acessos ou 'duração' para a duração dos acessos. Defaults para 'quantidade'.
     """
 
     # Seleciona as colunas de acordo com o tipo de acesso escolhido
     if access_type == 'quantidade':
-        access_columns = ['Administrative', 'Informational', 'ProductRelated']
         title = 'Acessos Totais por Tipo de Página (Quantidade)'
     elif access_type == 'duração':
-        access_columns = ['Administrative_Duration', 'Informational_Duration', 'ProductRelated_Duration']
         title = 'Acessos Totais por Tipo de Página (Duração)'
     else:
         raise ValueError('Tipo de acesso inválido. Escolha "quantidade" ou "duração".')
+    access_columns = COLUNAS_ACESSO[access_type]
 
-    # Agrupa os dados por tipo de página e soma as variáveis de acesso
-    df_grouped = df[access_columns].sum().reset_index()
+    # Soma das variáveis de acesso por tipo de página, já calculada na pré-agregação
+    df_grouped = agregados['totais_pagina'][access_columns].reset_index()
     df_grouped.columns = ['Tipo de Página', 'Acessos']
 
     # Cria o gráfico de barras
@@ -124,33 +162,37 @@ def plot_access(df, access_type='quantidade'):
     st.plotly_chart(fig)
 
 
-def outliers_box(df):
+@st.cache_data(show_spinner=False)
+def grafico_outliers(uploaded_file, access_type, limite_y):
     """
-    Gera gráficos de boxplot mostrando a distribuição dos acessos por página.
+    Desenha o boxplot dos acessos a partir dos quartis e de uma amostra dos outliers, guardado em cache como PNG.
 
     Parâmetros:
-    - df (pandas.DataFrame): O DataFrame contendo os dados.
+    - uploaded_file (UploadedFile): Arquivo carregado (o conteúdo entra na chave do cache).
+    - access_type (str): 'quantidade' ou 'duração'.
+    - limite_y (float): Limite superior do eixo y.
     """
+    colunas = COLUNAS_ACESSO[access_type]
+    df, _ = carregar_dados(uploaded_file, tuple(colunas))
 
-    # Cria um objeto Figure do Matplotlib
-    fig, ax = plt.subplots()
-
-    # Gera o gráfico de boxplot para a quantidade de acesso
-    sns.boxplot(data=df[['Administrative','Informational','ProductRelated']], ax=ax)
-    ax.set_ylim(0, 100)
+    # Cria uma figura do Matplotlib com o boxplot desenhado a partir dos resumos de cada coluna
+    fig, eixos = nova_figura()
+    desenhar_boxplots(eixos[0, 0], [resumo_boxplot(df[coluna]) for coluna in colunas], (0, limite_y))
+    return figura_png(fig)
 
-    # Exibe o gráfico na página do Streamlit
-    st.pyplot(fig)
+def outliers_box(uploaded_file):
+    """
+    Gera gráficos de boxplot mostrando a distribuição dos acessos por página.
 
-    # Cria um novo objeto Figure do Matplotlib
-    fig, ax = plt.subplots()
+    Parâmetros:
+    - uploaded_file (UploadedFile): Arquivo carregado.
+    """
 
-    # Gera o gráfico de boxplot para o tempo de acesso
-    sns.boxplot(data=df[['Administrative_Duration','Informational_Duration','ProductRelated_Duration']], ax=ax)
-    ax.set_ylim(0, 7500)
+    # Exibe o gráfico de boxplot para a quantidade de acesso
+    st.image(grafico_outliers(uploaded_file, 'quantidade', 100))
 
-    # Exibe o gráfico na página do Streamlit
-    st.pyplot(fig)
+    # Exibe o gráfico de boxplot para o tempo de acesso
+    st.image(grafico_outliers(uploaded_file, 'duração', 7500))
 
 def main():  # sourcery skip: avoid-builtin-shadow
     # Definir o template
@@ -170,15 +212,50 @@ def main():  # sourcery skip: avoid-builtin-shadow
     label="Faça upload do arquivo CSV",
     type=["csv"]
 
-    df = carregar_dados(uploaded_file)
+    # Colunas do arquivo, lidas do esquema do Parquet em cache
+    colunas = listar_colunas(uploaded_file)
 
-    if df is not None:
+    if colunas is not None:
         # Adicionar caixa de seleção na barra lateral
         selecao_dados = st.sidebar.selectbox(
             "Selecione uma opção",
             ("Info", "Descritiva")
         )
 
+        if selecao_dados == "Descritiva":
+            # Adicionar caixa de seleção na barra lateral
+            selecao_compras_acessos = st.sidebar.selectbox(
+                "Selecione uma opção",
+                ("Compras x Acessos", "Acessos por página", "Outliers")
+            )
+            if selecao_compras_acessos == "Compras x Acessos":
+                # Filtra as colunas que já estão na função compras_acessos
+                cols = [col for col in colunas if col not in [
+                    'Acessos', 'Revenue']]
+                col_selected = st.selectbox("Selecione a coluna", cols)
+            elif selecao_compras_acessos == "Acessos por página":
+                access_type = st.selectbox("Selecione o tipo de acesso", ['quantidade', 'duração'])
+            else:
+                # Boxplots desenhados a partir de resumos e guardados em cache como imagem
+                outliers_box(uploaded_file)
+                return
+
+            # Os gráficos de barras usam apenas as tabelas pré-agregadas, calculadas uma vez por arquivo
+            agregados = preagregar_dados(uploaded_file)
+            st.sidebar.caption(f"{agregados['linhas']:,} sessões resumidas em tabelas pré-agregadas")
+
+            if selecao_compras_acessos == "Compras x Acessos":
+                compras_acessos(agregados, col_selected)
+            else:
+                plot_access(agregados, access_type)
+            return
+
+        # Lê do cache Parquet os dados da visão Info
+        df, relatorio = carregar_dados(uploaded_file)
+
+        # Exibe o tamanho em memória e o pico de memória da leitura
+        st.sidebar.caption(descrever_relatorio(relatorio))
+
         if selecao_dados == "Info":
             # Mostrar título
             st.header("Dicionário de dados:")
@@ -189,31 +266,26 @@ def main():  # sourcery skip: avoid-builtin-shadow
             # Mostrar cabeçalho do DataFrame
             st.dataframe(df.head())
 
-            # Adicionar botão para gerar relatório HTML
+            # Para arquivos grandes, sugere o relatório mínimo sobre uma amostra
+            grande = len(df) > LINHAS_AMOSTRA
+            modo_relatorio = st.radio("Tipo de relatório", list(MODOS_RELATORIO), index=int(grande), horizontal=True)
+            amostrar = st.checkbox(f"Usar amostra de {LINHAS_AMOSTRA:,} linhas", value=grande, disabled=not grande)
+
+            # Adicionar botão para gerar relatório HTML; o pedido fica guardado para sobreviver às reexecuções
+            pedido = (hash_arquivo(uploaded_file), modo_relatorio, LINHAS_AMOSTRA if amostrar else None)
             if st.button("Gerar relatório"):
-                # Gerar relatório HTML usando o ydata-profiling
-                profile = ProfileReport(df)
-                html = profile.to_html()
+                st.session_state['relatorio_analise_clusterizacao'] = pedido
+
+            if st.session_state.get('relatorio_analise_clusterizacao') == pedido:
+                # Gerar relatório HTML usando o ydata-profiling em segundo plano, ou ler do cache em disco se já foi gerado
+                tarefa = submeter(('relatorio',) + pedido,
+                                  lambda tarefa: gerar_relatorio_html(df, *pedido, ao_progredir=tarefa.informar))
+                barra = st.progress(0.0, text="Gerando relatório...")
+                html, origem = tarefa.aguardar(lambda t: barra.progress(min(t.progresso, 1.0), text="Gerando relatório..."))
+                barra.empty()
+                st.caption("Relatório lido do cache." if origem == 'cache' else "Relatório gerado e guardado em cache.")
 
                 # Exibir relatório HTML na página do Streamlit
                 components.html(html, width=900, height=500, scrolling=True)
-
-        else:
-            # Adicionar caixa de seleção na barra lateral
-            selecao_compras_acessos = st.sidebar.selectbox(
-                "Selecione uma opção",
-                ("Compras x Acessos", "Acessos por página", "Outliers")
-            )
-            if selecao_compras_acessos == "Compras x Acessos":
-                # Filtra as colunas que já estão na função compras_acessos
-                cols = [col for col in df.columns if col not in [
-                    'Acessos', 'Revenue']]
-                col_selected = st.selectbox("Selecione a coluna", cols)
-                compras_acessos(df, col_selected)
-            elif selecao_compras_acessos == "Acessos por página":
-                access_type = st.selectbox("Selecione o tipo de acesso", ['quantidade', 'duração'])
-                plot_access(df, access_type)
-            else:
-                outliers_box(df)
 if __name__ == "__main__":
     main()
@@ -1,126 +1,277 @@
 import pandas as pd
-import seaborn as sn
-import numpy as np
 import streamlit as st
-import base64
+import os
+import uuid
 
-from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
-from sklearn.metrics import silhouette_score
-from sklearn.cluster import AgglomerativeClustering
+from core.clusterizacao import ajustar_kmeans_em_disco, calcular_silhuetas, hash_dados, silhueta_kmeans, varredura_kmeans
+from core.cubo import construir_cubo, contagem_condicoes, contagem_nivel, niveis, resumo_numerico
+from core.exportacao_pagina import botao_download, oferecer_arquivo
+from core.hierarquico import altura_corte, arvore_em_disco, correlacao_cofenetica, cortar_arvore
+from core.importacao import tardio
+from core.ingestao import carregar_upload, descrever_relatorio
+from core.modelos import atribuir_arquivo, caminho_modelo, carregar_modelo, listar_modelos, salvar_modelo
+from core.preprocessamento import padronizar_sessoes
+from core.tarefas import submeter
+
+# matplotlib e scipy são importados apenas quando o dendrograma for desenhado
+plt = tardio('matplotlib.pyplot')
+hierarchy = tardio('scipy.cluster.hierarchy')
 
 
 @st.cache_data
-def carregar_dados(uploaded_file):
+def carregar_dados(uploaded_file, colunas=None):
     if uploaded_file is not None:
-        return pd.read_csv(uploaded_file)
+        # Converte o arquivo uma única vez para Parquet em cache e lê apenas as colunas pedidas
+        try:
+            return carregar_upload(uploaded_file, colunas)
+        except ValueError as erro:
+            # Valores que não cabem no esquema (por exemplo, um mês desconhecido) não são descartados em silêncio
+            st.error(f"Não foi possível ler o arquivo: {erro}")
+            return None, None
     st.warning("Por favor, faça upload de um arquivo .CSV para continuar.")
-    return None
+    return None, None
 
+@st.cache_data(show_spinner=False)
 def padronizar_dados(df):
-    # Pegando as variáveis relacionadas a acesso
-    var_sessao = df[['Administrative', 'Informational', 'ProductRelated', 'Administrative_Duration', 'Informational_Duration', 'ProductRelated_Duration']].copy()
-
-    # Pegar as variáveis relacionadas a datas
-    var_data = df[['SpecialDay', 'Month', 'Weekend']].copy()
+    """
+    Ajusta o pré-processador nas sessões e retorna a matriz padronizada, guardada em cache por arquivo.
 
-    # Cria uma instância do StandardScaler
-    scaler = StandardScaler()
+    Parâmetros:
+    - df (pandas.DataFrame): Sessões do arquivo carregado.
 
-    # Aplica a padronização às variáveis do DataFrame var_sessao
-    var_sessao_scaled = scaler.fit_transform(var_sessao)
+    Retorna:
+    - tuple: (X, preprocessador), com a matriz float32 contígua e o PreprocessadorSessoes ajustado.
+    """
+    return padronizar_sessoes(df)
 
-    # Cria um novo DataFrame com as variáveis padronizadas
-    var_sessao_scaled_df = pd.DataFrame(var_sessao_scaled, columns=var_sessao.columns)
+def ajustador_em_disco(hash_X):
+    """
+    Retorna a função de ajuste usada pela varredura e pelas silhuetas, ligada ao cache em disco da matriz.
 
-    # Transformando a variável 'month' em dummies
-    var_data_encoded = pd.get_dummies(var_data, columns=['Month'])
+    O cache do Streamlit não é usado aqui, pois essas funções rodam nas tarefas em segundo plano,
+    fora da execução do script.
 
-    return var_sessao_scaled_df.join(var_data_encoded, on=None)
+    Parâmetros:
+    - hash_X (str): Hash do conteúdo da matriz padronizada.
+    """
+    return lambda X, k, motor, batch_size: ajustar_kmeans_em_disco(X, hash_X, k, motor, batch_size)
 
-def plot_elbow_kmeans(df):
+def modelo_kmeans(X, hash_X, n_clusters, motor='completo', batch_size=1024):
     """
-    Plota o gráfico do método do cotovelo para o algoritmo K-means.
+    Retorna o ajuste do K-means para n_clusters, reaproveitando o ajuste da varredura quando existir.
 
     Parâmetros:
-    - df (pandas.DataFrame): O DataFrame contendo os dados.
+    - X (numpy.ndarray): A matriz padronizada.
+    - hash_X (str): Hash do conteúdo de X.
+    - n_clusters (int): Quantidade de clusters escolhida.
+    - motor (str): 'completo' ou 'minibatch'.
+    - batch_size (int): Tamanho dos blocos do motor 'minibatch'.
+    """
+    return ajustar_kmeans_em_disco(X, hash_X, n_clusters, motor, batch_size)
+
+def tarefa_varredura(tarefa, X, hash_X, motor='completo', batch_size=1024, n_workers=1, k_min=1, k_max=9):
+    """
+    Executa varredura_kmeans em segundo plano, publicando cada k concluído como resultado parcial.
+    """
+    total = k_max - k_min + 1
+    return varredura_kmeans(X, k_min, k_max, motor, batch_size, n_workers,
+                            ao_concluir=lambda parcial: tarefa.informar(len(parcial) / total, parcial),
+                            ajustar=ajustador_em_disco(hash_X))
+
+def id_sessao():
+    """
+    Retorna o identificador da sessão do usuário, usado como grupo das tarefas em segundo plano.
     """
+    if 'id_sessao' not in st.session_state:
+        st.session_state['id_sessao'] = uuid.uuid4().hex
+    return st.session_state['id_sessao']
 
-    # Lista para armazenar a soma dos quadrados das distâncias
-    SQD = []
+def acompanhar_tarefa(tarefa, desenhar=None, texto=None):
+    """
+    Mostra o progresso de uma tarefa em segundo plano e desenha os resultados parciais até ela terminar.
 
-    # Define o range de valores para o número de clusters (k) de 1 a 10
-    K = range(1, 10)
+    Se a página for reexecutada no meio do cálculo, a tarefa continua rodando e a nova execução
+    volta a acompanhá-la a partir do ponto em que está.
 
-    # Loop sobre cada valor de k
-    for k in K:
-        # Cria uma instância do modelo KMeans com o número de clusters (k) atual e n_init=10
-        km = KMeans(n_clusters=k, n_init=10)
+    Parâmetros:
+    - tarefa (Tarefa): Tarefa retornada por submeter.
+    - desenhar (callable, opcional): Recebe o resultado parcial sempre que ele muda.
+    - texto (str, opcional): Texto exibido na barra de progresso.
 
-        # Executa o algoritmo KMeans no conjunto de dados
-        km.fit(df)
+    Retorna:
+    - O resultado da tarefa.
+    """
+    barra = st.progress(0.0, text=texto)
+    desenhada = [None]
 
-        # Calcula e armazena a soma dos quadrados das distâncias (inertia_) na lista SQD
-        SQD.append(km.inertia_)
+    def ao_progredir(t):
+        barra.progress(min(t.progresso, 1.0), text=texto)
+        if desenhar is not None and t.parcial is not None and t.versao != desenhada[0]:
+            desenhada[0] = t.versao
+            desenhar(t.parcial)
+
+    resultado = tarefa.aguardar(ao_progredir)
+    barra.empty()
+    return resultado
+
+def plot_elbow_kmeans(varredura, grafico=None):
+    """
+    Plota o gráfico do método do cotovelo para o algoritmo K-means.
+
+    Parâmetros:
+    - varredura (dict): Resultado (completo ou parcial) de varredura_kmeans.
+    - grafico (st.empty, opcional): Espaço da página onde o gráfico é redesenhado.
+    """
 
     # Cria o DataFrame com os valores de k e a soma dos quadrados das distâncias
-    df_sqd = pd.DataFrame({'num_clusters': list(range(1, len(SQD)+1)), 'SQD': SQD})
+    df_sqd = pd.DataFrame({'num_clusters': list(varredura), 'SQD': [v['inercia'] for v in varredura.values()]})
 
     # Plota o gráfico do método do cotovelo
-    st.line_chart(df_sqd.set_index('num_clusters'))
+    (grafico or st).line_chart(df_sqd.set_index('num_clusters'))
 
-def plot_silhouette_kmeans(df):
+def tarefa_silhuetas(tarefa, X, hash_X, modo='amostrada', tamanho_amostra=2000, motor='completo',
+                     batch_size=1024, n_workers=1, k_min=2, k_max=10):
     """
-    Plota o gráfico do coeficiente de silhueta para o algoritmo K-means.
+    Executa calcular_silhuetas em segundo plano, publicando cada k concluído como resultado parcial.
+    """
+    total = k_max - k_min + 1
+    return calcular_silhuetas(X, k_min, k_max, modo, tamanho_amostra, motor, batch_size, n_workers,
+                              ao_concluir=lambda parcial: tarefa.informar(len(parcial) / total, parcial),
+                              avaliar=lambda X, k, *args: silhueta_kmeans(X, k, *args, ajustar=ajustador_em_disco(hash_X)))
+
+def plot_silhouette_kmeans(silhuetas, grafico=None):
+    """
+    Plota o gráfico do coeficiente de silhueta para o algoritmo K-means, com a faixa de confiança.
 
     Parâmetros:
-    - df (pandas.DataFrame): O DataFrame contendo os dados.
+    - silhuetas (dict): Resultado (completo ou parcial) de calcular_silhuetas.
+    - grafico (st.empty, opcional): Espaço da página onde o gráfico é redesenhado.
     """
 
-    # Range de valores de clusters que você deseja testar
-    range_clusters = range(2, 11)
+    # Organiza a média e os limites da faixa em colunas
+    df_silhueta = pd.DataFrame({
+        'Número de Clusters': list(silhuetas),
+        'Coeficiente de Silhueta': [v['media'] for v in silhuetas.values()],
+        'Limite inferior (95%)': [v['inferior'] for v in silhuetas.values()],
+        'Limite superior (95%)': [v['superior'] for v in silhuetas.values()],
+    })
 
-    # Lista para armazenar os valores de silhueta média
-    silhouette_scores = []
+    # Plotar o gráfico de silhueta
+    (grafico or st).line_chart(df_silhueta.set_index('Número de Clusters'))
 
-    # Loop pelos diferentes números de clusters
-    for n_clusters in range_clusters:
-        # Inicializar e ajustar o modelo K-means
-        kmeans = KMeans(n_clusters=n_clusters, n_init=10)
-        kmeans.fit(df)
+def tarefa_arvore(tarefa, X, hash_X, linkage, pre_agrupamento, n_micro, conectividade, n_clusters):
+    """
+    Constrói (ou lê do cache em disco) a árvore em segundo plano e a corta em n_clusters, publicando o
+    progresso após o pré-agrupamento, durante a ligação e após o corte.
+    """
+    tarefa.informar(0.0)
+    arvore = arvore_em_disco(X, hash_X, linkage, pre_agrupamento, n_micro, conectividade,
+                             lambda fracao: tarefa.informar(0.9 * fracao))
+    labels = cortar_arvore(arvore, n_clusters)
+    tarefa.informar(1.0)
+    return arvore, labels
+
+def plot_dendrograma(arvore, n_clusters):
+    """
+    Plota o dendrograma da árvore em cache e a correlação cofenética da ligação.
 
-        # Obter os rótulos dos clusters e calcular o coeficiente de silhueta média
-        cluster_labels = kmeans.labels_
-        silhouette_avg = silhouette_score(df, cluster_labels)
+    Parâmetros:
+    - arvore (dict): Resultado de construir_arvore.
+    - n_clusters (int): Quantidade de clusters escolhida, marcada como linha de corte.
+    """
+    ligacao = arvore['ligacao']
+    if len(ligacao) == 0:
+        st.info("Todas as sessões ficaram em um único micro-cluster; não há junções para desenhar.")
+        return
+
+    # Cria um objeto Figure do Matplotlib com as últimas 30 junções da árvore
+    fig, ax = plt.subplots(figsize=(10, 5))
+    hierarchy.dendrogram(ligacao, truncate_mode='lastp', p=30, ax=ax)
+
+    # Marca a altura do corte entre a junção desfeita e a mantida
+    altura = altura_corte(arvore, n_clusters)
+    if altura is not None:
+        ax.axhline(altura, color='r', linestyle='--')
+    ax.set_ylabel('Distância')
+
+    # Exibe o gráfico na página do Streamlit
+    st.pyplot(fig)
+
+    # A correlação cofenética mede o quanto a árvore preserva as distâncias entre os micro-clusters
+    correlacao = correlacao_cofenetica(arvore)
+    if correlacao is not None:
+        st.metric("Correlação cofenética", f"{correlacao:.3f}")
+    else:
+        st.info("Correlação cofenética disponível apenas com até 5000 micro-clusters.")
+
+@st.cache_data(show_spinner=False)
+def atribuir_dados(uploaded_file, nome_modelo, versao_modelo):
+    """
+    Rotula as sessões do arquivo com o modelo salvo, guardado em cache por arquivo e versão do modelo.
 
-        # Armazenar o valor médio de silhueta
-        silhouette_scores.append(silhouette_avg)
+    Parâmetros:
+    - uploaded_file (UploadedFile): Arquivo com as sessões novas.
+    - nome_modelo (str): Nome do modelo salvo.
+    - versao_modelo (float): Data de modificação do arquivo do modelo, para invalidar o cache quando ele for regravado.
+    """
+    return atribuir_arquivo(uploaded_file, carregar_modelo(nome_modelo))
 
-    # Plotar o gráfico de silhueta
-    st.line_chart(pd.DataFrame({'Número de Clusters': list(range_clusters), 'Coeficiente de Silhueta': silhouette_scores}).set_index('Número de Clusters'))
+def atribuir_modelo_salvo(uploaded_file):
+    """
+    Fluxo de atribuição: rotula as sessões de um arquivo novo com um modelo salvo, sem reajustar.
 
-def get_cluster_labels(X, n_clusters, linkage='ward'):
-    # sourcery skip: inline-immediately-returned-variable
+    Parâmetros:
+    - uploaded_file (UploadedFile ou None): Arquivo com as sessões novas.
+    """
+    modelos = listar_modelos()
+    if not modelos:
+        st.info("Nenhum modelo salvo. Ajuste um K-means e use 'Salvar modelo' para criar um.")
+        return
+
+    nome_modelo = st.sidebar.selectbox("Modelo salvo", modelos)
+    modelo = carregar_modelo(nome_modelo)
+    metadados = modelo['metadados']
+    st.sidebar.caption(f"k = {len(modelo['centroides'])} · salvo em {metadados.get('salvo_em', '-')}")
+
+    if uploaded_file is None:
+        st.warning("Por favor, faça upload de um arquivo .CSV com as sessões a rotular.")
+        return
+
+    # Transforma e procura o centróide mais próximo bloco a bloco
+    try:
+        with st.spinner("Atribuindo clusters..."):
+            df_rotulado = atribuir_dados(uploaded_file, nome_modelo, caminho_modelo(nome_modelo).stat().st_mtime)
+    except ValueError as erro:
+        st.error(f"Não foi possível ler o arquivo: {erro}")
+        return
+
+    st.subheader("Sessões por cluster")
+    st.dataframe(df_rotulado['K-Means'].value_counts().sort_index().rename('Sessões'))
+    st.dataframe(df_rotulado.head())
+
+    # Botão de download do DataFrame rotulado
+    botao_download(df_rotulado, 'df_atribuido', "Download DataFrame Clusterizado")
+
+@st.cache_data(show_spinner=False)
+def gerar_cubo(_df, coluna_grupo, chave_rotulos):
+    """
+    Monta o cubo de resumo por cluster uma única vez para cada conjunto de rótulos.
 
-    # Criar objeto AgglomerativeClustering
-    agglomerative_fit = AgglomerativeClustering(n_clusters=n_clusters, linkage=linkage)
-    
-    # Ajustar o modelo aos dados
-    labels = agglomerative_fit.fit_predict(X)
-    
-    return labels
+    Parâmetros:
+    - _df (pandas.DataFrame): Dados com a coluna de rótulos (não entra no hash do cache).
+    - coluna_grupo (str): Nome da coluna de rótulos.
+    - chave_rotulos (tuple): Identifica os dados e os rótulos (hash da matriz, algoritmo e parâmetros).
+    """
+    return construir_cubo(_df, coluna_grupo)
 
-def filter_groups_categorical(df, group_column, filter_variable, filter_category):
-    # sourcery skip: inline-immediately-returned-variable
+def filter_groups_categorical(cubo, filter_variable, filter_category):
     """
-    Filtra um DataFrame por uma variável categórica e retorna a contagem de ocorrências para cada grupo.
+    Retorna, a partir do cubo, a contagem de ocorrências de uma categoria em cada grupo.
 
     Parâmetros
     ----------
-    df : pd.DataFrame
-        DataFrame a ser filtrado.
-    group_column : str
-        Nome da coluna usada para agrupar os dados.
+    cubo : dict
+        Cubo de resumo por cluster, retornado por gerar_cubo.
     filter_variable : str
         Nome da variável categórica usada para filtrar os dados.
     filter_category : str
@@ -128,43 +279,47 @@ def filter_groups_categorical(df, group_column, filter_variable, filter_category
 
     Retorna
     -------
-    pd.DataFrame
-        DataFrame com a contagem de ocorrências para cada grupo.
+    pd.Series
+        Série com a contagem de ocorrências para cada grupo.
     """
-    # Filtrar o DataFrame com base na condição
-    filtered_df = df[df[filter_variable] == filter_category]
-
-    # Contar a quantidade de ocorrências da categoria especificada em cada grupo
-    data = filtered_df.groupby(group_column)[filter_variable].count()
+    return contagem_nivel(cubo, filter_variable, filter_category)
 
-    return data
-
-def filter_groups_continuous(df, group_column, filter_variable):
-    # sourcery skip: inline-immediately-returned-variable
+def filter_groups_continuous(cubo, filter_variable):
     """
-    Agrupa um DataFrame por uma coluna e retorna a soma dos valores para uma variável contínua em cada grupo.
+    Retorna, a partir do cubo, a soma, a média e os quantis de uma variável contínua em cada grupo.
 
     Parâmetros
     ----------
-    df : pd.DataFrame
-        DataFrame a ser agrupado.
-    group_column : str
-        Nome da coluna usada para agrupar os dados.
+    cubo : dict
+        Cubo de resumo por cluster, retornado por gerar_cubo.
     filter_variable : str
-        Nome da variável contínua usada para calcular a soma dos valores.
+        Nome da variável contínua.
 
     Retorna
     -------
-    pd.Series
-        Série com a soma dos valores para cada grupo.
+    pd.DataFrame
+        DataFrame com as estatísticas da variável para cada grupo.
     """
-    # Calcular a soma dos valores para a variável contínua em cada grupo
-    data = df.groupby(group_column)[filter_variable].sum()
-
-    return data
+    return resumo_numerico(cubo, filter_variable)
 
+def filter_groups(cubo, filter_conditions):
+    """
+    Conta, a partir do cubo, as ocorrências de cada condição em cada grupo e indica o grupo predominante.
 
+    Parâmetros
+    ----------
+    cubo : dict
+        Cubo de resumo por cluster, retornado por gerar_cubo.
+    filter_conditions : dict
+        Condições no formato {variável categórica: categoria}.
 
+    Retorna
+    -------
+    tuple
+        (DataFrame com a quantidade e a proporção de cada condição em cada grupo,
+        grupo com a maior quantidade na primeira condição).
+    """
+    return contagem_condicoes(cubo, filter_conditions)
 
 def main():  # sourcery skip: extract-duplicate-method, extract-method
     # Definir o template
@@ -185,35 +340,83 @@ def main():  # sourcery skip: extract-duplicate-method, extract-method
 
     # Adiciona uma sidebar box para escolher entre K-means e Hierárquicos
     tipo_algoritmo = st.sidebar.selectbox(
-        "Selecione o tipo de algoritmo", ("K-means", "Hierárquicos"))
+        "Selecione o tipo de algoritmo", ("K-means", "Hierárquicos", "Atribuir (modelo salvo)"))
 
         # Carregar dados
     uploaded_file = st.sidebar.file_uploader(
     label="Faça upload do arquivo CSV",
-    type=["csv"]
+    type=["csv", "parquet"]
 )
-    df = carregar_dados(uploaded_file)
+    # Rotula sessões novas com um modelo salvo, sem carregar o arquivo inteiro de uma vez
+    if tipo_algoritmo == "Atribuir (modelo salvo)":
+        atribuir_modelo_salvo(uploaded_file)
+        return
+
+    df, relatorio = carregar_dados(uploaded_file)
 
     # Verifica se o arquivo foi carregado
-    if uploaded_file is not None:
-        # Lê o arquivo CSV em um DataFrame
-        df = pd.read_csv(uploaded_file)
+    if df is not None:
+        # Exibe o tamanho em memória e o pico de memória da leitura
+        st.sidebar.caption(descrever_relatorio(relatorio))
 
         # Verifica qual opção foi selecionada e executa o respectivo fluxo
         if tipo_algoritmo == "K-means":
             # Chama a função para padronizar os dados
-            df_transformado = padronizar_dados(df)
+            df_transformado, preprocessador = padronizar_dados(df)
+
+            # Hash da matriz padronizada, usado como chave dos ajustes em cache
+            hash_transformado = hash_dados(df_transformado)
+
+            # Escolha do motor do K-means: o mini-batch é sugerido para arquivos grandes, pelo tempo de ajuste
+            motor_kmeans = st.sidebar.selectbox(
+                "Motor do K-means", ("Completo", "Mini-batch"), index=int(len(df_transformado) > 200_000),
+                help="O mini-batch atualiza os centróides com lotes de sessões e ajusta mais rápido em arquivos "
+                     "grandes, mas não reduz a memória: as sessões e a matriz padronizada continuam carregadas "
+                     "inteiras na memória.")
+            motor_kmeans = 'completo' if motor_kmeans == "Completo" else 'minibatch'
+            batch_size = 1024
+            if motor_kmeans == 'minibatch':
+                batch_size = int(st.sidebar.number_input(
+                    "Tamanho do lote (batch size)", min_value=64, value=1024, step=256))
+
+            # Quantidade de ajustes da varredura executados ao mesmo tempo
+            n_workers = st.sidebar.number_input(
+                "Workers da varredura", min_value=1, max_value=os.cpu_count() or 1, value=min(4, os.cpu_count() or 1))
 
             # Escolha entre Elbow e Silhueta
             tipo_metrica = st.radio(
                 "Escolha a métrica de avaliação", ("Elbow", "Silhueta"))
             if tipo_metrica == "Elbow":
                 st.subheader("Gráfico do Método do Cotovelo")
-                plot_elbow_kmeans(df_transformado)
+                grafico = st.empty()
+
+                # A varredura roda em segundo plano; cada k concluído é desenhado assim que termina
+                tarefa = submeter(('varredura', hash_transformado, motor_kmeans, batch_size), tarefa_varredura,
+                                  df_transformado, hash_transformado, motor_kmeans, batch_size, n_workers,
+                                  grupo=f'{id_sessao()}:metrica')
+                acompanhar_tarefa(tarefa, lambda parcial: plot_elbow_kmeans(parcial, grafico), "Ajustando o K-means...")
             else:
                 tipo_metrica == "Silhueta"
                 st.subheader("Gráfico do Coeficiente de Silhueta")
-                plot_silhouette_kmeans(df_transformado)
+
+                # Escolha entre a silhueta estimada por amostra e a exata calculada em blocos
+                modo_silhueta = st.radio(
+                    "Cálculo da silhueta", ("Amostrada", "Exata (em blocos)"), horizontal=True)
+                modo_silhueta = 'amostrada' if modo_silhueta == "Amostrada" else 'exata'
+                tamanho_amostra = 2000
+                if modo_silhueta == 'amostrada':
+                    tamanho_amostra = int(st.number_input(
+                        "Tamanho da amostra", min_value=100, value=2000, step=500))
+
+                grafico = st.empty()
+
+                # O cálculo roda em segundo plano; cada k concluído é desenhado assim que termina
+                tarefa = submeter(('silhuetas', hash_transformado, modo_silhueta, tamanho_amostra, motor_kmeans,
+                                   batch_size), tarefa_silhuetas, df_transformado, hash_transformado, modo_silhueta,
+                                  tamanho_amostra, motor_kmeans, batch_size, n_workers,
+                                  grupo=f'{id_sessao()}:metrica')
+                acompanhar_tarefa(tarefa, lambda parcial: plot_silhouette_kmeans(parcial, grafico),
+                                  "Calculando as silhuetas...")
             # Widget para definir a quantidade de clusters
             num_clusters_input = st.text_input("Digite a quantidade de clusters")
 
@@ -225,13 +428,20 @@ def main():  # sourcery skip: extract-duplicate-method, extract-method
 
             # Verifica se a quantidade de clusters é válida
             if num_clusters_input and num_clusters > 0:
-                # Executa o algoritmo de K-means com a quantidade de clusters desejada
-                kmeans = KMeans(n_clusters=num_clusters,
-                                n_init=10, random_state=123)
-                kmeans.fit(df_transformado)
+                # Recupera o K-means com a quantidade de clusters desejada sem refazer o ajuste
+                kmeans = modelo_kmeans(df_transformado, hash_transformado, num_clusters,
+                                       motor_kmeans, batch_size)
 
                 # Obter os rótulos de cluster atribuídos a cada ponto de dados
-                labels = kmeans.labels_
+                labels = kmeans['labels']
+
+                # Salvar o pré-processador e os centróides para rotular sessões novas sem reajustar
+                with st.sidebar.expander("Salvar modelo"):
+                    nome_modelo = st.text_input("Nome do modelo", value=f"kmeans_{num_clusters}")
+                    if st.button("Salvar modelo"):
+                        caminho = salvar_modelo(nome_modelo, preprocessador, kmeans['centroides'],
+                                                {'k': num_clusters, 'motor': motor_kmeans, 'linhas': len(df)})
+                        st.success(f"Modelo salvo como '{caminho.stem}'.")
 
                 # Criar uma cópia do DataFrame original
                 df_copia = df.copy()
@@ -239,103 +449,126 @@ def main():  # sourcery skip: extract-duplicate-method, extract-method
                 # Adicionar os rótulos de cluster no DataFrame df_copia
                 df_copia['K-Means'] = labels
 
+                # Cubo de resumo por cluster, montado uma vez para estes rótulos
+                cubo = gerar_cubo(df_copia, 'K-Means', (hash_transformado, num_clusters, motor_kmeans, batch_size))
+
                 # Exibir os resultados na página do Streamlit
                 st.subheader("Resultados do Filtro")
 
                 # Widget para selecionar a variável
-                filter_variable = st.selectbox("Selecione a variável para o filtro", df_copia.columns)
-
-                # Verificar o tipo de dado da variável
-                variable_dtype = df_copia[filter_variable].dtype
+                filter_variable = st.selectbox("Selecione a variável para o filtro", df.columns)
 
-                if pd.api.types.is_bool_dtype(variable_dtype) or pd.api.types.is_categorical_dtype(variable_dtype) or pd.api.types.is_object_dtype(variable_dtype):
+                if filter_variable in cubo['categoricas']:
                     # Widget para selecionar a categoria
-                    unique_categories = df_copia[filter_variable].unique()
-                    filter_category = st.selectbox("Selecione a categoria para o filtro", unique_categories)
+                    filter_category = st.selectbox("Selecione a categoria para o filtro", niveis(cubo, filter_variable))
 
-                    # Executar a função filter_groups_categorical
-                    results = filter_groups_categorical(df_copia, 'K-Means', filter_variable, filter_category)
+                    # Contagem da categoria em cada grupo, consultada no cubo
+                    results = filter_groups_categorical(cubo, filter_variable, filter_category)
                 else:
-                    # Executar a função filter_groups_continuous
-                    results = filter_groups_continuous(df_copia, 'K-Means', filter_variable)
+                    # Estatísticas da variável contínua em cada grupo, consultadas no cubo
+                    results = filter_groups_continuous(cubo, filter_variable)
 
                 # Exibir os resultados na página do Streamlit
                 st.dataframe(results)
 
                 # Botão de download do DataFrame copiado
-                if st.button("Download DataFrame Clusterizado"):
-                    csv = df_copia.to_csv(index=False)
-                    b64 = base64.b64encode(csv.encode()).decode()
-                    href = f'<a href="data:file/csv;base64,{b64}" download="df_copia.csv">Download</a>'
-                    st.markdown(href, unsafe_allow_html=True)
+                botao_download(df_copia, 'df_copia', "Download DataFrame Clusterizado")
 
         else:
             tipo_algoritmo == "Hierárquicos"
             # Chama a função para padronizar os dados
-            df_transformado_hierarquicos = padronizar_dados(df)
+            df_transformado_hierarquicos, _ = padronizar_dados(df)
 
             # Widget para selecionar o método de ligação
             metodo_ligacao = st.selectbox(
                 "Selecione o método de ligação", ("ward", "complete", "average", "single"))
 
+            # Widgets do pré-agrupamento em micro-clusters, que limita a memória da ligação
+            pre_agrupamento = st.sidebar.selectbox(
+                "Pré-agrupamento", ("BIRCH", "K-means", "Nenhum (exato)"))
+            pre_agrupamento = {"BIRCH": 'birch', "K-means": 'kmeans', "Nenhum (exato)": 'nenhum'}[pre_agrupamento]
+            n_micro = int(st.sidebar.number_input(
+                "Máximo de micro-clusters", min_value=10, max_value=5000, value=500, step=100))
+
+            # No ward, opção de restringir as junções ao grafo de vizinhos mais próximos
+            conectividade = False
+            if metodo_ligacao == "ward":
+                conectividade = st.sidebar.checkbox("Usar grafo de conectividade (ward)")
+
+            # Apenas o ward sem conectividade pondera os micro-clusters pela quantidade de linhas
+            if pre_agrupamento != 'nenhum' and (metodo_ligacao != "ward" or conectividade):
+                st.sidebar.caption("Os micro-clusters entram na ligação sem peso: a árvore é uma aproximação "
+                                   "da calculada sobre as sessões.")
+
             # Widget para o usuário digitar a quantidade de clusters desejada
             num_clusters_desejado = st.text_input(
                 "Digite a quantidade de clusters desejada", value='2')
 
-            if num_clusters_desejado is not None:
-                try:
-                    num_clusters_desejado = int(num_clusters_desejado)
-                    if num_clusters_desejado > 0:
-                        # Treinar e extrair as labels do Agglomerative Clustering
-                        labels_hierarquicos = get_cluster_labels(
-                            df_transformado_hierarquicos, n_clusters=num_clusters_desejado, linkage=metodo_ligacao)
-                except ValueError:
-                    st.error("Digite um valor inteiro válido para a quantidade de clusters desejada.")
-            else:
-                num_clusters_desejado = None
+            # Árvore completa em cache para os dados e a ligação escolhidos, construída em segundo plano
+            # e cortada na quantidade de clusters desejada
+            hash_hierarquicos = hash_dados(df_transformado_hierarquicos)
+            try:
+                num_clusters_desejado = int(num_clusters_desejado)
+            except ValueError:
+                st.error("Digite um valor inteiro válido para a quantidade de clusters desejada.")
+                return
+
+            # Erros da tarefa (por exemplo, mais clusters que micro-clusters) são mostrados à parte
+            tarefa = submeter(('arvore', hash_hierarquicos, metodo_ligacao, pre_agrupamento, n_micro,
+                               conectividade, num_clusters_desejado),
+                              tarefa_arvore, df_transformado_hierarquicos, hash_hierarquicos, metodo_ligacao,
+                              pre_agrupamento, n_micro, conectividade, num_clusters_desejado,
+                              grupo=f'{id_sessao()}:arvore')
+            try:
+                arvore, labels_hierarquicos = acompanhar_tarefa(tarefa, texto="Construindo a árvore hierárquica...")
+            except ValueError as erro:
+                st.error(f"Não foi possível construir a árvore hierárquica: {erro}")
+                return
+
+            # Visualização da mesma árvore em cache
+            if st.checkbox("Mostrar dendrograma"):
+                plot_dendrograma(arvore, num_clusters_desejado)
 
             # Criar uma cópia do DataFrame original
             df_copia_hierarquicos = df.copy()
 
-            # Treinar e extrair as labels do Agglomerative Clustering
-            labels_hierarquicos = get_cluster_labels(
-                df_transformado_hierarquicos, n_clusters=num_clusters_desejado, linkage=metodo_ligacao)
-
             # Adicionar os rótulos dos clusters ao DataFrame como uma nova coluna
             df_copia_hierarquicos['Hierárquicos'] = labels_hierarquicos
 
+            # Cubo de resumo por cluster, montado uma vez para estes rótulos
+            cubo = gerar_cubo(df_copia_hierarquicos, 'Hierárquicos',
+                              (hash_hierarquicos, metodo_ligacao, pre_agrupamento, n_micro, conectividade,
+                               num_clusters_desejado))
+
             # Exibir os resultados na página do Streamlit
             st.subheader("Resultados do Filtro")
 
             # Widget para selecionar a variável
             filter_variable_hierarquicos = st.selectbox(
-                "Selecione a variável para o filtro", df_copia_hierarquicos.columns)
+                "Selecione a variável para o filtro", df.columns)
 
-            # Widget para selecionar a categoria
-            unique_categories_hierarquicos = df_copia_hierarquicos[filter_variable_hierarquicos].unique(
-            )
-            filter_category_hierarquicos = st.selectbox(
-                "Selecione a categoria para o filtro", unique_categories_hierarquicos)
+            if filter_variable_hierarquicos in cubo['categoricas']:
+                # Widget para selecionar a categoria
+                filter_category_hierarquicos = st.selectbox(
+                    "Selecione a categoria para o filtro", niveis(cubo, filter_variable_hierarquicos))
 
-            # Montar as condições do filtro
+                # Montar as condições do filtro
+                filter_conditions_hierarquicos = {
+                    filter_variable_hierarquicos: filter_category_hierarquicos}
 
-            filter_conditions_hierarquicos = {
-                filter_variable_hierarquicos: filter_category_hierarquicos}
+                # Executar a função filter_groups para o algoritmo hierárquico
+                results_hierarquicos, max_group_hierarquicos = filter_groups(
+                    cubo, filter_conditions_hierarquicos)
 
-            # Executar a função filter_groups para o algoritmo hierárquico
-            results_hierarquicos, max_group_hierarquicos = filter_groups(
-                df_copia_hierarquicos, 'Hierárquicos', filter_conditions_hierarquicos)
-
-            # Exibir os resultados na página do Streamlit
-            st.write("Grupo com a maior predominância:", max_group_hierarquicos)
-            st.dataframe(results_hierarquicos)
+                # Exibir os resultados na página do Streamlit
+                st.write("Grupo com a maior predominância:", max_group_hierarquicos)
+                st.dataframe(results_hierarquicos)
+            else:
+                # Estatísticas da variável contínua em cada grupo, consultadas no cubo
+                st.dataframe(filter_groups_continuous(cubo, filter_variable_hierarquicos))
 
             # Botão de download do DataFrame copiado
-            if st.button("Download DataFrame Clusterizado"):
-                csv = df_copia_hierarquicos.to_csv(index=False)
-                b64 = base64.b64encode(csv.encode()).decode()
-                href = f'<a href="data:file/csv;base64,{b64}" download="df_copia.csv">Download</a>'
-                st.markdown(href, unsafe_allow_html=True)
+            botao_download(df_copia_hierarquicos, 'df_copia', "Download DataFrame Clusterizado")
 
 if __name__ == "__main__":
     main()
@@ -1,33 +1,56 @@
 import pandas as pd
 import streamlit as st
 import base64
+import streamlit.components.v1 as components
 
-from ydata_profiling import ProfileReport
-from PIL import Image
-import matplotlib.pyplot as plt
-import seaborn as sns
 
+from core.cache_disco import hash_arquivo
+from core.importacao import tardio
+from core.ingestao import carregar_upload, descrever_relatorio
+from core.resumos_graficos import desenhar_histograma, figura_png, nova_figura, resumo_histograma
+from core.relatorios import LINHAS_AMOSTRA, MODOS_RELATORIO, gerar_relatorio_html
+from core.tarefas import submeter
+
+# Bibliotecas de gráficos importadas apenas quando o gráfico for desenhado
+plt = tardio('matplotlib.pyplot')
+sns = tardio('seaborn')
 
 @st.cache_data
-def carregar_dados(uploaded_file):
+def carregar_dados(uploaded_file, colunas=None):
     if uploaded_file is not None:
-        return pd.read_csv(uploaded_file)
+        # Converte o arquivo uma única vez para Parquet em cache e lê apenas as colunas pedidas
+        try:
+            return carregar_upload(uploaded_file, colunas)
+        except ValueError as erro:
+            # Valores que não cabem no esquema (por exemplo, um mês desconhecido) não são descartados em silêncio
+            st.error(f"Não foi possível ler o arquivo: {erro}")
+            return None, None
     st.warning("Por favor, faça upload de um arquivo .CSV para continuar.")
-    return None
+    return None, None
 
 # Função para plotar distribuição dos dados
-def plot_histogram(df):
-    num_cols = len(df.columns)
-    fig, axes = plt.subplots(2, 2, figsize=(10, 8))
+@st.cache_data(show_spinner=False)
+def grafico_histogramas(uploaded_file, n_faixas):
+    """
+    Desenha os histogramas a partir de contagens em faixas fixas e de uma KDE amostrada, guardados em cache como PNG.
+
+    Parâmetros:
+    - uploaded_file (UploadedFile): Arquivo carregado (o conteúdo entra na chave do cache).
+    - n_faixas (int): Quantidade de faixas de cada histograma.
+    """
+    df, _ = carregar_dados(uploaded_file)
+    fig, axes = nova_figura(2, 2, (10, 8))
 
     for i, column in enumerate(df.columns):
         row = i // 2
         col = i % 2
-        sns.histplot(data=df, x=column, kde=True, ax=axes[row, col])
-        axes[row, col].set_title(f'Distribuição de {column}')
+        desenhar_histograma(axes[row, col], resumo_histograma(df[column], n_faixas))
 
-    plt.tight_layout()
-    st.pyplot(fig)
+    fig.tight_layout()
+    return figura_png(fig)
+
+def plot_histogram(uploaded_file, n_faixas=50):
+    st.image(grafico_histogramas(uploaded_file, n_faixas))
 
 # Função para plotar valor total por mês
 def plot_valor_total_por_mes(df):
@@ -79,11 +102,14 @@ def main():
     # Carregar dados
     uploaded_file = st.sidebar.file_uploader(
         label="Faça upload do arquivo CSV",
-        type=["csv"]
+        type=["csv", "parquet"]
     )
-    df = carregar_dados(uploaded_file)
+    df, relatorio = carregar_dados(uploaded_file)
 
     if df is not None:
+        # Exibe o tamanho em memória e o pico de memória da leitura
+        st.sidebar.caption(descrever_relatorio(relatorio))
+
         # Widget para selecionar entre "Dados" e "Gráficos"
         tipo_descritiva = st.selectbox("Descritiva", ["Dados", "Gráficos"])
 
@@ -99,11 +125,24 @@ def main():
             # Mostrar cabeçalho do DataFrame
             st.dataframe(df.head())
 
-            # Adicionar botão para gerar relatório HTML
+            # Para arquivos grandes, sugere o relatório mínimo sobre uma amostra
+            grande = len(df) > LINHAS_AMOSTRA
+            modo_relatorio = st.radio("Tipo de relatório", list(MODOS_RELATORIO), index=int(grande), horizontal=True)
+            amostrar = st.checkbox(f"Usar amostra de {LINHAS_AMOSTRA:,} linhas", value=grande, disabled=not grande)
+
+            # Adicionar botão para gerar relatório HTML; o pedido fica guardado para sobreviver às reexecuções
+            pedido = (hash_arquivo(uploaded_file), modo_relatorio, LINHAS_AMOSTRA if amostrar else None)
             if st.button("Gerar relatório"):
-                # Gerar relatório HTML usando o ydata-profiling
-                profile = ProfileReport(df)
-                html = profile.to_html()
+                st.session_state['relatorio_analises_segmentacao'] = pedido
+
+            if st.session_state.get('relatorio_analises_segmentacao') == pedido:
+                # Gerar relatório HTML usando o ydata-profiling em segundo plano, ou ler do cache em disco se já foi gerado
+                tarefa = submeter(('relatorio',) + pedido,
+                                  lambda tarefa: gerar_relatorio_html(df, *pedido, ao_progredir=tarefa.informar))
+                barra = st.progress(0.0, text="Gerando relatório...")
+                html, origem = tarefa.aguardar(lambda t: barra.progress(min(t.progresso, 1.0), text="Gerando relatório..."))
+                barra.empty()
+                st.caption("Relatório lido do cache." if origem == 'cache' else "Relatório gerado e guardado em cache.")
 
                 # Exibir relatório HTML na página do Streamlit
                 components.html(html, width=900, height=500, scrolling=True)
@@ -113,12 +152,18 @@ def main():
             tipo_grafico = st.radio("Tipo de Gráfico", ["Histogramas", "Valor Total por Mês"])
 
             if tipo_grafico == "Histogramas":
+                # Quantidade de faixas dos histogramas (a figura fica em cache para cada escolha)
+                n_faixas = st.slider("Número de faixas", min_value=10, max_value=100, value=50, step=10)
+
                 # Chamar a função para plotar histogramas das colunas do DataFrame
-                plot_histogram(df)
+                plot_histogram(uploaded_file, n_faixas)
 
             elif tipo_grafico == "Valor Total por Mês":
+                # Lê do cache apenas as duas colunas usadas no gráfico
+                df_mensal, _ = carregar_dados(uploaded_file, ('DiaCompra', 'ValorTotal'))
+
                 # Chamar a função para plotar valor total por mês
-                plot_valor_total_por_mes(df)
+                plot_valor_total_por_mes(df_mensal)
 
 # Executar o programa principal
 if __name__ == "__main__":
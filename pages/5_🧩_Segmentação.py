@@ -1,88 +1,107 @@
 import streamlit as st
-import pandas as pd
-import base64
 from datetime import datetime
 
+from core.exportacao_pagina import botao_download, oferecer_arquivo
+from core.ingestao import carregar_upload, descrever_relatorio
+from core.rfv import FAIXAS, calcular_quartis, calcular_rfv, gerar_df_rfv
+from core.rfv_blocos import classificar_arquivo, inicio_do_arquivo, quartis_do_arquivo, rfv_em_cache
+from core.rfv_incremental import aplicar_lote, apagar_estado, carregar_estado, rfv_do_estado
+
 @st.cache_data
-def carregar_dados(uploaded_file):
+def carregar_dados(uploaded_file, colunas=None):
     if uploaded_file is not None:
-        return pd.read_csv(uploaded_file)
+        # Converte o arquivo uma única vez para Parquet em cache e lê apenas as colunas pedidas
+        try:
+            return carregar_upload(uploaded_file, colunas)
+        except ValueError as erro:
+            # Valores que não cabem no esquema (por exemplo, um mês desconhecido) não são descartados em silêncio
+            st.error(f"Não foi possível ler o arquivo: {erro}")
+            return None, None
     st.warning("Por favor, faça upload de um arquivo .CSV para continuar.")
-    return None
+    return None, None
 
-def calcular_recencia(df):
-    """
-    Função para calcular a Recência.
-    """
-    df['DiaCompra'] = pd.to_datetime(df['DiaCompra'])  # Converter a coluna para pd.Timestamp
-    df_recencia = df.groupby(by='ID_cliente', as_index=False)['DiaCompra'].max()
-    df_recencia.columns = ['ID_cliente', 'DiaUltimaCompra']
-    dia_atual = pd.Timestamp(datetime.now().date())
-    df_recencia['Recencia'] = df_recencia['DiaUltimaCompra'].apply(
-        lambda x: (dia_atual - x).days)
-    return df_recencia
-
-def calcular_frequencia(df):
+@st.cache_data
+def gerar_rfv(df, data_referencia):
     """
-    Função para calcular a Frequência.
+    Função para calcular a tabela RFV, guardada em cache por dados e data de referência.
     """
-    df_frequencia = df[['ID_cliente', 'CodigoCompra']].groupby(
-        'ID_cliente').count().reset_index()
-    df_frequencia.columns = ['ID_cliente', 'Frequencia']
-    return df_frequencia
+    return calcular_rfv(df, data_referencia)
 
-def calcular_valor(df):
+def botao_download_arquivo(caminho, nome_arquivo, rotulo):
     """
-    Função para calcular o Valor.
-    """
-    df_valor = df[['ID_cliente', 'ValorTotal']].groupby(
-        'ID_cliente').sum().reset_index()
-    df_valor.columns = ['ID_cliente', 'Valor']
-    return df_valor
+    Oferece o download de um Parquet já gravado em disco, sem carregá-lo como DataFrame.
 
-def calcular_quartis(df_RFV):
-    """
-    Função para calcular os quartis.
+    Parâmetros:
+    - caminho (Path): Arquivo a baixar.
+    - nome_arquivo (str): Nome do arquivo baixado, sem a extensão.
+    - rotulo (str): Texto do botão que oferece o arquivo.
     """
-    return df_RFV.quantile(q=[0.25, 0.5, 0.75]).drop('ID_cliente', axis=1)
+    if st.button(rotulo):
+        oferecer_arquivo(caminho, f'{nome_arquivo}.parquet', 'application/octet-stream')
 
-def recencia_class(x, r, q_dict):
-    """
-    Função para classificar a Recência.
+def segmentar_em_blocos(uploaded_file, data_referencia, limite_memoria_mb):
     """
-    if x <= q_dict[r][0.25]:
-        return 'A'
-    elif x <= q_dict[r][0.50]:
-        return 'B'
-    elif x <= q_dict[r][0.75]:
-        return 'C'
-    else:
-        return 'D'
+    Segmentação de arquivos grandes: a tabela RFV e o DF RFV final são gravados em disco parte a
+    parte, e a página exibe apenas as primeiras linhas de cada um.
 
-def freq_val_class(x, fv, q_dict):
+    Parâmetros:
+    - uploaded_file (arquivo): CSV ou Parquet de transações.
+    - data_referencia (date): Data a partir da qual a Recência é contada.
+    - limite_memoria_mb (float): Tamanho máximo do agregado em memória antes de ir para o disco.
     """
-    Função para classificar a Frequência ou Valor.
+    with st.spinner("Calculando a tabela RFV em blocos..."):
+        caminho_rfv = rfv_em_cache(uploaded_file, data_referencia, limite_memoria_mb)
+
+    st.header("DataFrame RFV")
+    inicio, clientes = inicio_do_arquivo(caminho_rfv)
+    st.caption(f"{clientes:,} clientes · exibindo os primeiros {len(inicio):,}")
+    st.dataframe(inicio)
+
+    # Limites exatos leem as três colunas inteiras; o esboço percorre o arquivo em blocos
+    faixas = st.sidebar.selectbox("Faixas de classificação", list(FAIXAS))
+    metodo = st.sidebar.radio("Cálculo dos limites", ("Exato", "Esboço"),
+                              help="O esboço calcula limites aproximados em fluxo, com erro de posição de cerca de 1.3%, "
+                                   "sem carregar a tabela RFV inteira.")
+    with st.spinner("Classificando os clientes..."):
+        quartis_df = quartis_do_arquivo(caminho_rfv, FAIXAS[faixas], metodo)
+        caminho_final = classificar_arquivo(caminho_rfv, quartis_df)
+
+    st.header('DF RFV Final')
+    st.dataframe(inicio_do_arquivo(caminho_final, 5)[0])
+
+    # O DF RFV final já está em Parquet no disco
+    botao_download_arquivo(caminho_final, 'df_rfv_final', 'Download do DF RFV Final')
+
+def rfv_incremental(data_referencia):
     """
-    if x <= q_dict[fv][0.25]:
-        return 'D'
-    elif x <= q_dict[fv][0.50]:
-        return 'C'
-    elif x <= q_dict[fv][0.75]:
-        return 'B'
-    else:
-        return 'A'
+    Painel do modo incremental: aplica novos lotes de transações ao estado salvo e gera a tabela RFV dele.
 
-def gerar_df_rfv(df_RFV, quartis):
-    """
-    Função para gerar o DF RFV final com as classes.
+    Parâmetros:
+    - data_referencia (date): Data a partir da qual a Recência é contada.
+
+    Retorna:
+    - pandas.DataFrame ou None: Tabela RFV do estado, ou None se o estado ainda estiver vazio.
     """
-    df_RFV['R_quartil'] = df_RFV['Recencia'].apply(
-        recencia_class, args=('Recencia', quartis))
-    df_RFV['F_quartil'] = df_RFV['Frequencia'].apply(
-        freq_val_class, args=('Frequencia', quartis))
-    df_RFV['V_quartil'] = df_RFV['Valor'].apply(
-        freq_val_class, args=('Valor', quartis))
-    return df_RFV
+    st.sidebar.title('Atualização incremental')
+    nome = st.sidebar.text_input("Nome do estado", value="padrao")
+    lotes = st.sidebar.file_uploader("Novos lotes de transações", type=["csv", "parquet"],
+                                     accept_multiple_files=True)
+
+    # Aplica somente os lotes ainda não incorporados ao estado
+    if lotes and st.sidebar.button("Aplicar lotes"):
+        aplicados = sum(aplicar_lote(nome, lote) for lote in lotes)
+        st.sidebar.success(f"{aplicados} lote(s) aplicado(s), {len(lotes) - aplicados} já constava(m) no estado.")
+
+    if st.sidebar.button("Reiniciar estado"):
+        apagar_estado(nome)
+
+    estado, aplicados = carregar_estado(nome)
+    if estado.empty:
+        st.info("O estado ainda está vazio. Envie lotes de transações e clique em 'Aplicar lotes'.")
+        return None
+
+    st.sidebar.caption(f"{len(estado):,} clientes · {len(aplicados)} lote(s) aplicado(s)")
+    return rfv_do_estado(estado, data_referencia)
 
 def main():
     st.set_page_config(
@@ -102,42 +121,55 @@ def main():
     # Divisão
     st.write("---")
 
-    st.sidebar.title('Carregar arquivo CSV')
-    uploaded_file = st.sidebar.file_uploader("Escolha um arquivo CSV", type="csv")
+    # Arquivo completo recalcula tudo; incremental atualiza um estado salvo a cada novo lote
+    modo = st.sidebar.radio("Modo", ("Arquivo completo", "Incremental"))
 
-    if uploaded_file is not None:
-        # Carregar os dados
-        df = carregar_dados(uploaded_file)
-
-        if df is not None:
-            # Calcular a Recência, Frequência e Valor
-            df_recencia = calcular_recencia(df)
-            df_frequencia = calcular_frequencia(df)
-            df_valor = calcular_valor(df)
-
-            # Juntar o RFV de acordo com o cliente
-            df_RFV = pd.merge(pd.merge(df_recencia, df_frequencia, on='ID_cliente'), df_valor, on='ID_cliente')
-
-            # Exibir o DataFrame RFV na tela do usuário
-            st.header("DataFrame RFV")
-            st.dataframe(df_RFV)
-
-            # Obter os quartis
-            quartis_df = calcular_quartis(df_RFV)
-
-            # Gerar o DF RFV final com as classes
-            df_RFV_final = gerar_df_rfv(df_RFV, quartis_df)
-
-            # Exibir o cabeçalho do DF RFV final
-            st.header('DF RFV Final')
-            st.dataframe(df_RFV_final.head())
-
-            # Botão para fazer o download do DF RFV final
-            if st.button('Download do DF RFV Final'):
-                csv = df_RFV_final.to_csv(index=False)
-                b64 = base64.b64encode(csv.encode()).decode()
-                href = f'<a href="data:file/csv;base64,{b64}" download="df_rfv_final.csv">Download do DF RFV Final (CSV)</a>'
-                st.markdown(href, unsafe_allow_html=True)
+    # Data a partir da qual a Recência é contada, para que o resultado seja reprodutível
+    data_referencia = st.sidebar.date_input("Data de referência da Recência", value=datetime.now().date())
+
+    df_RFV = None
+    if modo == "Incremental":
+        df_RFV = rfv_incremental(data_referencia)
+    else:
+        st.sidebar.title('Carregar arquivo CSV')
+        uploaded_file = st.sidebar.file_uploader("Escolha um arquivo CSV", type=["csv", "parquet"])
+
+        # Para arquivos maiores que a memória: agrega em blocos e usa o disco quando passar do limite
+        em_blocos = st.sidebar.checkbox("Ler em blocos (arquivos grandes)")
+        if em_blocos:
+            limite_memoria_mb = st.sidebar.number_input("Limite de memória (MB)", min_value=16, value=256, step=16)
+
+        if uploaded_file is not None and em_blocos:
+            segmentar_em_blocos(uploaded_file, data_referencia, limite_memoria_mb)
+        elif uploaded_file is not None:
+            # Carregar os dados
+            df, relatorio = carregar_dados(uploaded_file)
+
+            if df is not None:
+                # Exibe o tamanho em memória e o pico de memória da leitura
+                st.sidebar.caption(descrever_relatorio(relatorio))
+
+                # Calcular a Recência, Frequência e Valor de cada cliente em uma única agregação
+                df_RFV = gerar_rfv(df, data_referencia)
+
+    if df_RFV is not None:
+        # Exibir o DataFrame RFV na tela do usuário
+        st.header("DataFrame RFV")
+        st.dataframe(df_RFV)
+
+        # Obter os limites das faixas escolhidas (quartis, quintis ou decis)
+        faixas = st.sidebar.selectbox("Faixas de classificação", list(FAIXAS))
+        quartis_df = calcular_quartis(df_RFV, FAIXAS[faixas])
+
+        # Gerar o DF RFV final com as classes
+        df_RFV_final = gerar_df_rfv(df_RFV, quartis_df)
+
+        # Exibir o cabeçalho do DF RFV final
+        st.header('DF RFV Final')
+        st.dataframe(df_RFV_final.head())
+
+        # Botão para fazer o download do DF RFV final
+        botao_download(df_RFV_final, 'df_rfv_final', 'Download do DF RFV Final')
 
 
 if __name__ == "__main__":
@@ -0,0 +1,43 @@
+"""
+Os ajustes do K-means e as árvores lidos do cache em disco são iguais aos calculados, e o cache
+não depende do Streamlit, pois é usado pelas tarefas em segundo plano.
+"""
+import threading
+
+import numpy as np
+import pytest
+
+import core.cache_disco
+from core.clusterizacao import ajustar_kmeans, ajustar_kmeans_em_disco, hash_dados
+from core.hierarquico import arvore_em_disco, construir_arvore
+
+@pytest.fixture(autouse=True)
+def cache_temporario(tmp_path, monkeypatch):
+    monkeypatch.setattr(core.cache_disco, 'DIRETORIO_CACHE', tmp_path / 'cache')
+
+@pytest.fixture(scope='module')
+def X():
+    return np.random.default_rng(123).normal(size=(2000, 5)).astype(np.float32)
+
+def test_ajuste_em_disco(X):
+    esperado = ajustar_kmeans(X, 4)
+    calculado = ajustar_kmeans_em_disco(X, hash_dados(X), 4)
+    lido = ajustar_kmeans_em_disco(X, hash_dados(X), 4)
+    assert len(list(core.cache_disco.diretorio_cache('ajustes_kmeans').glob('*.npz'))) == 1
+    for ajuste in (calculado, lido):
+        assert ajuste['inercia'] == pytest.approx(esperado['inercia'])
+        np.testing.assert_array_equal(ajuste['labels'], esperado['labels'])
+        np.testing.assert_allclose(ajuste['centroides'], esperado['centroides'])
+
+def test_arvore_em_disco_fora_do_script(X):
+    # Chamada de uma thread comum, como as das tarefas, sem contexto do Streamlit
+    resultados = []
+    for _ in range(2):
+        thread = threading.Thread(target=lambda: resultados.append(arvore_em_disco(X, hash_dados(X), n_micro=50)))
+        thread.start()
+        thread.join()
+
+    esperado = construir_arvore(X, n_micro=50)
+    for arvore in resultados:
+        for nome in ('ligacao', 'centros', 'atribuicao'):
+            np.testing.assert_allclose(arvore[nome], esperado[nome])
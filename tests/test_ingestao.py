@@ -0,0 +1,42 @@
+"""
+Leitura dos arquivos com esquema conhecido: valores fora das categorias são acusados, e não
+trocados por NaN, e o pico de memória só é medido quando pedido.
+"""
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+import core.cache_disco
+from core.ingestao import armazenar_upload, ler_csv
+
+ARQUIVO_SESSOES = Path(__file__).resolve().parent.parent / 'CSV' / 'online_shoppers_intention.csv'
+
+@pytest.fixture(autouse=True)
+def cache_temporario(tmp_path, monkeypatch):
+    monkeypatch.setattr(core.cache_disco, 'DIRETORIO_CACHE', tmp_path / 'cache')
+
+@pytest.fixture
+def mes_desconhecido(tmp_path):
+    df = pd.read_csv(ARQUIVO_SESSOES, nrows=500)
+    df.loc[123, 'Month'] = 'Junho'
+    caminho = tmp_path / 'sessoes.csv'
+    df.to_csv(caminho, index=False)
+    return caminho
+
+def test_mes_desconhecido_no_csv(mes_desconhecido):
+    with pytest.raises(ValueError, match='Junho'):
+        ler_csv(mes_desconhecido, tamanho_bloco=100)
+
+def test_mes_desconhecido_no_parquet(mes_desconhecido, tmp_path):
+    caminho = tmp_path / 'sessoes.parquet'
+    pd.read_csv(mes_desconhecido).to_parquet(caminho, index=False)
+    with pytest.raises(ValueError, match='Junho'):
+        armazenar_upload(caminho)
+    assert not list(core.cache_disco.diretorio_cache('datasets').iterdir())
+
+def test_medicao_de_memoria_opcional():
+    df, relatorio = ler_csv(ARQUIVO_SESSOES)
+    assert relatorio['pico_mb'] is None
+    assert df['Month'].notna().all()
+    assert ler_csv(ARQUIVO_SESSOES, medir_memoria=True)[1]['pico_mb'] > 0
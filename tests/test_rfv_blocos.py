@@ -0,0 +1,104 @@
+"""
+Equivalência entre a tabela RFV calculada em blocos (rfv_blocos) e a de calcular_rfv.
+
+A ordem das somas do Valor muda com os despejos em disco, então a comparação dos números
+de ponto flutuante é feita com tolerância.
+"""
+from datetime import date
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+import core.cache_disco
+import core.rfv_blocos
+from core.ingestao import ler_csv
+from core.rfv import calcular_quartis, calcular_rfv, gerar_df_rfv
+from core.rfv_blocos import (classificar_arquivo, gravar_rfv_em_blocos, iterar_rfv_em_blocos, quartis_do_arquivo,
+                             rfv_em_blocos, rfv_em_cache)
+
+ARQUIVO_RFV = Path(__file__).resolve().parent.parent / 'CSV' / 'exemplo_RFV.csv'
+DATA_REFERENCIA = date(2024, 1, 1)
+
+@pytest.fixture(autouse=True)
+def cache_temporario(tmp_path, monkeypatch):
+    # Os despejos em disco vão para um cache descartável
+    monkeypatch.setattr(core.cache_disco, 'DIRETORIO_CACHE', tmp_path / 'cache')
+
+@pytest.fixture(scope='module')
+def esperado():
+    df, _ = ler_csv(ARQUIVO_RFV)
+    return calcular_rfv(df, DATA_REFERENCIA).sort_values('ID_cliente', ignore_index=True)
+
+@pytest.fixture
+def arquivo_parquet(tmp_path):
+    df, _ = ler_csv(ARQUIVO_RFV)
+    caminho = tmp_path / 'exemplo_RFV.parquet'
+    df.to_parquet(caminho, index=False)
+    return caminho
+
+def comparar(obtido, esperado):
+    pd.testing.assert_frame_equal(obtido.sort_values('ID_cliente', ignore_index=True), esperado,
+                                  check_exact=False, check_dtype=False)
+
+def test_csv_em_memoria(esperado):
+    comparar(rfv_em_blocos(ARQUIVO_RFV, DATA_REFERENCIA, tamanho_bloco=1000), esperado)
+
+def test_parquet_em_memoria(arquivo_parquet, esperado):
+    comparar(rfv_em_blocos(arquivo_parquet, DATA_REFERENCIA, tamanho_bloco=1000), esperado)
+
+@pytest.mark.parametrize('limite_memoria_mb', [0.02, 0.001])
+def test_csv_com_despejos(esperado, limite_memoria_mb):
+    # Limites minúsculos forçam despejos a cada bloco e a redivisão das partições
+    partes = list(iterar_rfv_em_blocos(ARQUIVO_RFV, DATA_REFERENCIA, tamanho_bloco=1000,
+                                       limite_memoria_mb=limite_memoria_mb, n_particoes=4))
+    assert len(partes) > 1
+    comparar(pd.concat(partes, ignore_index=True), esperado)
+
+def test_parquet_com_despejos(arquivo_parquet, esperado):
+    comparar(rfv_em_blocos(arquivo_parquet, DATA_REFERENCIA, tamanho_bloco=1000, limite_memoria_mb=0.02), esperado)
+
+def test_gravar_com_despejos(tmp_path, esperado):
+    destino = tmp_path / 'rfv.parquet'
+    clientes = gravar_rfv_em_blocos(ARQUIVO_RFV, destino, DATA_REFERENCIA, tamanho_bloco=1000,
+                                    limite_memoria_mb=0.02)
+    assert clientes == len(esperado)
+    comparar(pd.read_parquet(destino), esperado)
+
+def test_redivisao_limita_particoes(esperado):
+    # Com a redivisão, nenhuma parte final passa muito do limite, mesmo com poucas partições
+    partes = list(iterar_rfv_em_blocos(ARQUIVO_RFV, DATA_REFERENCIA, tamanho_bloco=500,
+                                       limite_memoria_mb=0.02, n_particoes=2))
+    assert max(len(p) for p in partes) < len(esperado) / 4
+    comparar(pd.concat(partes, ignore_index=True), esperado)
+
+def test_classificacao_em_disco(esperado):
+    caminho = rfv_em_cache(ARQUIVO_RFV, DATA_REFERENCIA, limite_memoria_mb=0.02)
+    quartis = quartis_do_arquivo(caminho, 5)
+    pd.testing.assert_frame_equal(quartis, calcular_quartis(esperado, 5))
+
+    final = pd.read_parquet(classificar_arquivo(caminho, quartis, tamanho_bloco=500))
+    pd.testing.assert_frame_equal(final.sort_values('ID_cliente', ignore_index=True),
+                                  gerar_df_rfv(esperado.copy(), calcular_quartis(esperado, 5)),
+                                  check_exact=False, check_dtype=False, check_categorical=False)
+
+def test_cache_acompanha_o_dia(monkeypatch):
+    # Sem data de referência, a tabela em cache vale apenas para o dia em que foi calculada
+    hoje = rfv_em_cache(ARQUIVO_RFV)
+    assert rfv_em_cache(ARQUIVO_RFV) == hoje
+    assert rfv_em_cache(ARQUIVO_RFV, core.rfv_blocos.data_referencia_padrao().date()) == hoje
+
+    monkeypatch.setattr(core.rfv_blocos, 'data_referencia_padrao', lambda: pd.Timestamp('2030-01-01'))
+    amanha = rfv_em_cache(ARQUIVO_RFV)
+    assert amanha != hoje
+    pd.testing.assert_frame_equal(pd.read_parquet(amanha), pd.read_parquet(rfv_em_cache(ARQUIVO_RFV, date(2030, 1, 1))))
+
+def test_limites_do_esboco(esperado):
+    # O esboço erra a posição de cada limite em no máximo erro_rank (com folga para o empate de valores)
+    caminho = rfv_em_cache(ARQUIVO_RFV, DATA_REFERENCIA)
+    limites = quartis_do_arquivo(caminho, 10, 'Esboço', tamanho_bloco=300)
+    for coluna in limites.columns:
+        valores = esperado[coluna].to_numpy()
+        for q, limite in limites[coluna].items():
+            abaixo, ate = (valores < limite).mean(), (valores <= limite).mean()
+            assert abaixo - 0.02 <= q <= ate + 0.02
@@ -0,0 +1,64 @@
+"""
+Equivalência entre o estado do RFV incremental (rfv_incremental), montado lote a lote, e a
+tabela de calcular_rfv sobre todo o histórico.
+"""
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import core.cache_disco
+from core.ingestao import ler_csv
+from core.rfv import calcular_rfv
+from core.rfv_incremental import (MAX_LOTES_PENDENTES, aplicar_lote, apagar_estado, carregar_estado,
+                                  diretorio_estado, lotes_pendentes, rfv_do_estado)
+
+ARQUIVO_RFV = Path(__file__).resolve().parent.parent / 'CSV' / 'exemplo_RFV.csv'
+DATA_REFERENCIA = date(2024, 1, 1)
+
+@pytest.fixture(autouse=True)
+def cache_temporario(tmp_path, monkeypatch):
+    monkeypatch.setattr(core.cache_disco, 'DIRETORIO_CACHE', tmp_path / 'cache')
+
+@pytest.fixture
+def lotes(tmp_path):
+    # Mais lotes que MAX_LOTES_PENDENTES, para que o estado passe por uma compactação
+    df = pd.read_csv(ARQUIVO_RFV)
+    caminhos = []
+    limites = np.linspace(0, len(df), MAX_LOTES_PENDENTES + 4).astype(int)
+    for i, (inicio, fim) in enumerate(zip(limites[:-1], limites[1:])):
+        caminho = tmp_path / f'lote_{i}.csv'
+        df.iloc[inicio:fim].to_csv(caminho, index=False)
+        caminhos.append(caminho)
+    return caminhos
+
+def test_estado_igual_ao_historico(lotes):
+    assert all(aplicar_lote('loja', caminho, tamanho_bloco=500) for caminho in lotes)
+    assert len(lotes_pendentes(diretorio_estado('loja'))) < len(lotes)
+
+    estado, aplicados = carregar_estado('loja')
+    assert len(aplicados) == len(lotes)
+
+    df, _ = ler_csv(ARQUIVO_RFV)
+    esperado = calcular_rfv(df, DATA_REFERENCIA).sort_values('ID_cliente', ignore_index=True)
+    pd.testing.assert_frame_equal(rfv_do_estado(estado, DATA_REFERENCIA), esperado,
+                                  check_exact=False, check_dtype=False)
+
+def test_lote_repetido_nao_altera_o_estado(lotes):
+    for caminho in lotes[:3]:
+        aplicar_lote('loja', caminho)
+    antes, aplicados_antes = carregar_estado('loja')
+
+    assert not aplicar_lote('loja', lotes[1])
+    depois, aplicados_depois = carregar_estado('loja')
+    pd.testing.assert_frame_equal(depois, antes)
+    assert aplicados_depois == aplicados_antes
+
+def test_nome_nao_sai_do_cache(tmp_path):
+    vitima = tmp_path / 'vitima'
+    vitima.mkdir()
+    apagar_estado('../../vitima')
+    assert vitima.exists()
+    assert diretorio_estado('../../vitima').parent == core.cache_disco.diretorio_cache('estados_rfv').resolve()